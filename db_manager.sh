@@ -1,12 +1,16 @@
 #!/bin/bash
 
 # Expense Tracker Database Manager
-# Usage: ./db_manager.sh [sync|upload|status|backup]
+# Usage: ./db_manager.sh [sync|upload|merge|status|backup]
 
 DB_FILE="server/expense_tracker.db"
 ENCRYPTED_FILE="expense_tracker_encrypted.db"
 BACKUP_DIR="db_backups"
 DB_REPO_DIR=".db_repo"
+# Incremental backup chain (base snapshot + changesets) inside the database repository
+INCREMENTAL_DIR="$DB_REPO_DIR/incremental"
+# Per-device change bundles for row-level merge sync
+SYNC_DIR="$DB_REPO_DIR/sync"
 
 # Create backup directory if it doesn't exist
 mkdir -p "$BACKUP_DIR"
@@ -51,17 +55,44 @@ delete_old_backups() {
     fi
 }
 
-# Function to create a timestamped backup
+# Function to create a timestamped backup. The copy is taken with SQLite's
+# online backup API and integrity-checked, so it is consistent even while the
+# server is writing; EXPENSE_SNAPSHOT names one the server already took.
 create_backup() {
-    if [ -f "$DB_FILE" ]; then
+    SNAPSHOT_FILE=""
+    if [ -n "$EXPENSE_SNAPSHOT" ] && [ -f "$EXPENSE_SNAPSHOT" ]; then
+        SNAPSHOT_FILE="$EXPENSE_SNAPSHOT"
+        echo "📁 Backup created: $SNAPSHOT_FILE"
+        delete_old_backups
+    elif [ -f "$DB_FILE" ]; then
         timestamp=$(date +"%Y%m%d_%H%M%S")
         backup_file="$BACKUP_DIR/expense_tracker_backup_$timestamp.db"
-        cp "$DB_FILE" "$backup_file"
-        echo "📁 Backup created: $backup_file"
-        delete_old_backups
+        if (cd server && python db_backup.py snapshot "../$backup_file" --db "../$DB_FILE" > /dev/null); then
+            SNAPSHOT_FILE="$(pwd)/$backup_file"
+            echo "📁 Backup created: $backup_file"
+            delete_old_backups
+        else
+            cp "$DB_FILE" "$backup_file"
+            echo "⚠️  Snapshot failed, copied the database file as-is: $backup_file"
+            delete_old_backups
+        fi
+    fi
+}
+
+# The Python backup tool reads the password from the environment
+require_password() {
+    if [ -z "$EXPENSE_DB_PASSWORD" ]; then
+        read -s -p "🔑 Database password: " EXPENSE_DB_PASSWORD
+        echo
+        export EXPENSE_DB_PASSWORD
     fi
 }
 
+# Run db_backup.py from the server directory against the working database
+db_backup() {
+    (cd server && python db_backup.py "$1" "../$INCREMENTAL_DIR" --db "../$DB_FILE" "${@:2}")
+}
+
 # Clean up any stray database files
 cleanup() {
     if [ -f "expense_tracker.db" ]; then
@@ -90,8 +121,25 @@ if [ "$1" = "sync" ]; then
     echo "📥 Pulling latest code from GitHub..."
     git pull origin main
     
-    if [ -f "$DB_REPO_DIR/$ENCRYPTED_FILE" ]; then
-        # Copy encrypted database from db repository
+    if [ -f "$INCREMENTAL_DIR/manifest.json" ]; then
+        # Backup current database if it exists
+        if [ -f "$DB_FILE" ]; then
+            create_backup
+        fi
+        
+        # Rebuild the database from the base snapshot and the changesets since
+        echo "🔓 Restoring database from incremental backup..."
+        require_password
+        if db_backup restore; then
+            echo "✅ Database ready!"
+            echo "🚀 Starting Flask server..."
+            cd server && python app.py
+        else
+            echo "❌ Failed to restore database. Check password."
+            exit 1
+        fi
+    elif [ -f "$DB_REPO_DIR/$ENCRYPTED_FILE" ]; then
+        # Copy encrypted database from db repository (whole-file format)
         cp "$DB_REPO_DIR/$ENCRYPTED_FILE" "$ENCRYPTED_FILE"
         
         # Backup current database if it exists
@@ -142,53 +190,83 @@ elif [ "$1" = "upload" ]; then
     # Create backup before uploading
     create_backup
     
-    # Check for remote changes in database repository
-    cd "$DB_REPO_DIR"
-    git fetch origin main
-    if ! git diff --quiet HEAD origin/main -- "$ENCRYPTED_FILE" 2>/dev/null; then
+    # Write the changes since the last backup as one encrypted changeset
+    # (or a fresh base snapshot when the chain is due for re-basing)
+    echo "🔒 Writing incremental backup..."
+    require_password
+    # A new base is built from the snapshot just taken rather than a second copy
+    db_backup backup ${SNAPSHOT_FILE:+--snapshot "$SNAPSHOT_FILE"}
+    status=$?
+    if [ $status -eq 3 ]; then
         echo "⚠️  WARNING: Remote database has been updated!"
         echo "   Your upload will overwrite those changes."
         read -p "   Continue? (y/N): " confirm
         if [[ $confirm != [yY] ]]; then
             echo "❌ Upload cancelled. Use 'sync' to get latest changes first."
-            cd ..
             exit 1
         fi
-    fi
-    cd ..
-    
-    # Encrypt the database
-    echo "🔒 Encrypting database..."
-    
-    # Check if password is provided via environment variable
-    if [ -n "$EXPENSE_DB_PASSWORD" ]; then
-        # Use password from environment variable (non-interactive)
-        echo "$EXPENSE_DB_PASSWORD" | openssl enc -aes-256-cbc -salt -pbkdf2 -in "$DB_FILE" -out "$ENCRYPTED_FILE" -pass stdin
-    else
-        # Interactive password prompt (for manual use)
-        openssl enc -aes-256-cbc -salt -pbkdf2 -in "$DB_FILE" -out "$ENCRYPTED_FILE"
+        db_backup backup --force ${SNAPSHOT_FILE:+--snapshot "$SNAPSHOT_FILE"}
+        status=$?
     fi
     
-    if [ $? -eq 0 ]; then
-        echo "✅ Database encrypted!"
+    if [ $status -eq 0 ]; then
+        echo "✅ Backup written!"
         echo "📤 Committing to database repository..."
         
-        # Copy encrypted file to database repository
-        cp "$ENCRYPTED_FILE" "$DB_REPO_DIR/$ENCRYPTED_FILE"
-        
-        # Commit and push to database repository
+        # Commit and push to database repository; the whole-file copy is superseded
         cd "$DB_REPO_DIR"
-        git add "$ENCRYPTED_FILE"
-        git commit -m "Update expenses $(date +%Y-%m-%d)"
-        git push origin main
+        git add -A incremental
+        if [ -f "$ENCRYPTED_FILE" ]; then
+            git rm -q "$ENCRYPTED_FILE"
+        fi
+        if git diff --cached --quiet; then
+            echo "✅ Nothing new to upload"
+        else
+            git commit -m "Update expenses $(date +%Y-%m-%d)"
+            git push origin main
+        fi
         cd ..
         
         echo "🎉 Upload complete!"
     else
-        echo "❌ Failed to encrypt database."
+        echo "❌ Failed to write backup."
         exit 1
     fi
 
+elif [ "$1" = "merge" ]; then
+    echo "🔀 Merging changes with the other databases..."
+    cleanup
+    
+    # Check environment variable
+    check_db_repo_env
+    
+    # Setup/update database repository
+    setup_db_repo
+    
+    # Create backup before merging
+    create_backup
+    
+    # Apply the other devices' bundles and write this device's changes as a new one
+    # (a missing database is created empty and filled from the bundles)
+    require_password
+    if ! (cd server && python db_sync.py run "../$SYNC_DIR" --db "../$DB_FILE"); then
+        echo "❌ Merge failed."
+        exit 1
+    fi
+    
+    # Each device only writes its own folder, so a rejected push just needs a rebase
+    cd "$DB_REPO_DIR"
+    git add -A sync
+    if ! git diff --cached --quiet; then
+        git commit -m "Sync changes $(date +%Y-%m-%d)"
+        if ! git push origin main; then
+            git pull --rebase origin main && git push origin main
+        fi
+    fi
+    cd ..
+    
+    echo "🎉 Merge complete!"
+
 elif [ "$1" = "status" ]; then
     echo "📊 Database Status"
     echo "=================="
@@ -208,6 +286,16 @@ elif [ "$1" = "status" ]; then
         echo "❌ Local encrypted version: $ENCRYPTED_FILE (missing)"
     fi
     
+    if [ -f "$INCREMENTAL_DIR/manifest.json" ] && [ -f "$DB_FILE" ]; then
+        echo "🧩 Incremental backup:"
+        db_backup status
+    fi
+    
+    if [ -d "$SYNC_DIR" ] && [ -f "$DB_FILE" ]; then
+        echo "🔀 Merge sync:"
+        (cd server && python db_sync.py status "../$SYNC_DIR" --db "../$DB_FILE")
+    fi
+    
     # Check database repository status
     if [ -n "$EXPENSE_DB_REPO" ]; then
         echo "�️  Database repository: $EXPENSE_DB_REPO"
@@ -237,10 +325,11 @@ else
     echo "Expense Tracker Database Manager"
     echo "==============================="
     echo ""
-    echo "Usage: $0 [sync|upload|status|backup]"
+    echo "Usage: $0 [sync|upload|merge|status|backup]"
     echo ""
     echo "🔄 sync    - Pull latest changes and start server"
     echo "📤 upload  - Encrypt and upload your changes"  
+    echo "🔀 merge   - Exchange changed rows with the other databases"
     echo "📊 status  - Show database information"
     echo "📁 backup  - Create manual backup"
     echo ""
@@ -14,6 +14,84 @@ export async function loadExpenses() {
     return expenses;
 }
 
+// Load one page of expenses with server-side filters, sorting and keyset pagination.
+// Pass the returned next_cursor back as params.cursor to get the following page.
+export async function loadExpensesPage(params = {}) {
+    const query = new URLSearchParams({ limit: 100, ...params });
+    const res = await fetch(`${API_URL}/expenses?${query}`);
+    if (!res.ok) {
+        throw new Error(`Failed to load expenses: ${res.statusText}`);
+    }
+    return res.json();
+}
+
+// Bring a local expense list up to date using the server change log.
+// Returns { expenses, seq }; keep seq and pass it back on the next call.
+export async function syncExpenseChanges(expenses, since = 0) {
+    const byId = new Map(expenses.map(e => [e.id, e]));
+    let seq = since;
+    while (true) {
+        const res = await fetch(`${API_URL}/expenses/changes?since=${seq}`);
+        if (!res.ok) {
+            throw new Error(`Failed to sync expenses: ${res.statusText}`);
+        }
+        const changes = await res.json();
+        if (changes.reset) {
+            // Our cursor predates the compacted log: reload everything
+            return { expenses: await loadExpenses(), seq: changes.latest_seq };
+        }
+        changes.upserts.forEach(row => byId.set(row.id, row));
+        changes.deleted.forEach(id => byId.delete(id));
+        seq = changes.latest_seq;
+        if (!changes.has_more) break;
+    }
+    return { expenses: Array.from(byId.values()), seq };
+}
+
+// Get every dashboard aggregate (summary, trend, category, spender, ...) in one call
+export async function getAnalytics(params = {}) {
+    const res = await fetch(`${API_URL}/analytics?${new URLSearchParams(params)}`);
+    if (!res.ok) {
+        throw new Error(`Failed to load analytics: ${res.statusText}`);
+    }
+    return res.json();
+}
+
+// Bulk load user rules from a JSON, NDJSON or CSV file (merged into the existing rules)
+export async function importUserRules(file) {
+    const formData = new FormData();
+    formData.append('file', file);
+    const format = file.name.toLowerCase().endsWith('.ndjson') ? 'ndjson' : '';
+    const res = await fetch(`${API_URL}/user_rules/import${format ? `?format=${format}` : ''}`, {
+        method: 'POST',
+        body: formData
+    });
+    return res.json();
+}
+
+// URL that downloads every user rule as json, ndjson or csv
+export function userRulesExportUrl(format = 'json') {
+    return `${API_URL}/user_rules/export?format=${encodeURIComponent(format)}`;
+}
+
+// Distinct expense descriptions containing the text, most used first
+export async function suggestDescriptions(q, limit = 10) {
+    const res = await fetch(`${API_URL}/expenses/descriptions?${new URLSearchParams({ q, limit })}`);
+    if (!res.ok) {
+        throw new Error(`Failed to load suggestions: ${res.statusText}`);
+    }
+    return res.json();
+}
+
+// Income, spending and savings per month and user (params: start_month, end_month as YYYY-MM)
+export async function getCashflow(params = {}) {
+    const res = await fetch(`${API_URL}/cashflow?${new URLSearchParams(params)}`);
+    if (!res.ok) {
+        throw new Error(`Failed to load cashflow: ${res.statusText}`);
+    }
+    return res.json();
+}
+
 // Upload file
 export async function uploadFile(formData) {
     const res = await fetch(`${API_URL}/upload`, {
@@ -41,6 +119,19 @@ export async function bulkDeleteExpenses(ids) {
     return res.json();
 }
 
+// Apply the same field changes to many expenses in one request
+export async function bulkUpdateExpenses(ids, changes) {
+    const res = await fetch(`${API_URL}/expenses/bulk_update`, {
+        method: 'PATCH',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ ids, changes })
+    });
+    if (!res.ok) {
+        throw new Error(`Failed to update expenses: ${res.statusText}`);
+    }
+    return res.json();
+}
+
 // Update expense
 export async function updateExpense(id, data) {
     await fetch(`${API_URL}/expense/${id}`, {
@@ -118,22 +209,42 @@ export async function renameCategory(oldName, newName) {
     return res.json();
 }
 
-// Backup and push database to git
-export async function backupAndPush() {
+// Start a background backup-and-push job; force replaces a backup written from another database
+export async function backupAndPush(force = false) {
     const res = await fetch(`${API_URL}/backup-and-push`, {
-        method: 'POST'
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ force })
     });
     return res.json();
 }
 
-// Perform undo operation
+// Status and stage progress of the latest backup-and-push job
+export async function getBackupStatus() {
+    const res = await fetch(`${API_URL}/backup-and-push/status`);
+    return res.json();
+}
+
+// Undo the most recent journaled operation ({success: false, error} when there is nothing to undo or it conflicts)
 export async function performUndo() {
     const res = await fetch(`${API_URL}/undo`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' }
     });
-    if (!res.ok) {
-        throw new Error(`Undo failed: ${res.statusText}`);
-    }
+    return res.json();
+}
+
+// Redo the most recently undone operation
+export async function performRedo() {
+    const res = await fetch(`${API_URL}/redo`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' }
+    });
+    return res.json();
+}
+
+// Undo/redo availability for the toolbar buttons
+export async function getUndoStatus() {
+    const res = await fetch(`${API_URL}/undo/status`);
     return res.json();
 }
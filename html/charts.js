@@ -1,95 +1,118 @@
-import { genColors, getCSSColors, getPieChartOptions, getBarChartOptions } from './helpers.js';
+import { genColors, getCSSColors, getPieChartOptions } from './helpers.js';
 import { CATEGORY_META } from './config.js';
+import { getAnalytics } from './api.js';
 
 // Global chart instances for cleanup
 const chartInstances = {};
 
-// Render all charts
-export function renderCharts(expenses) {
-    // Filter expenses based on date range
-    const filteredExpenses = filterExpensesByDateRange(expenses);
-    
-    // Update summary cards
-    updateAnalyticsSummary(filteredExpenses, expenses);
-    
-    // Render enhanced charts
-    renderTrendChart(filteredExpenses);
-    renderCategoryChart(filteredExpenses);
-    renderNeedLuxuryChart(filteredExpenses);
-    renderSpenderChart(filteredExpenses);
-    renderDayOfWeekChart(filteredExpenses);
-    renderMerchantChart(filteredExpenses);
-    
-    // Setup chart controls
-    setupChartControls(filteredExpenses);
+// Pending chart refresh; filter inputs fire on every keystroke
+let chartRefreshTimer = null;
+
+// Redraw the charts for the current filters, a moment after the last call
+export function renderCharts() {
+    clearTimeout(chartRefreshTimer);
+    chartRefreshTimer = setTimeout(() => {
+        loadAndRenderCharts().catch(err => console.error('Failed to load analytics:', err));
+    }, 250);
 }
 
-// Filter expenses by selected date range
-function filterExpensesByDateRange(expenses) {
-    const dateRangeSelect = document.getElementById('dateRangeSelect');
-    if (!dateRangeSelect) return expenses;
-    
-    const range = dateRangeSelect.value;
+// Render all charts from the server-side /analytics aggregates, without downloading rows
+export async function loadAndRenderCharts(params = {}) {
+    const analytics = await getAnalytics({
+        ...getChartFilters(),
+        trend: getActiveTrendMode(),
+        ...params
+    });
+    renderAnalytics(analytics);
+    setupChartControls();
+}
+
+// Draw every chart from an analytics payload (same shape as GET /analytics)
+export function renderAnalytics(analytics) {
+    updateAnalyticsSummary(analytics.summary);
+    renderTrendChart(analytics.trend);
+    renderCategoryChart(analytics.by_category);
+    renderNeedLuxuryChart(analytics.need_luxury);
+    renderSpenderChart(analytics.by_spender);
+    renderDayOfWeekChart(analytics.day_of_week);
+    renderMerchantChart(analytics.top_merchants);
+}
+
+// Translate the Period selector into start_date/end_date query params
+function getSelectedDateRange() {
+    const range = document.getElementById('dateRangeSelect')?.value;
     const now = new Date();
-    let startDate, endDate;
-    
+    const iso = d => `${d.getFullYear()}-${String(d.getMonth() + 1).padStart(2, '0')}-${String(d.getDate()).padStart(2, '0')}`;
     switch (range) {
         case 'last30':
-            startDate = new Date(now.getTime() - 30 * 24 * 60 * 60 * 1000);
-            break;
+            return { start_date: iso(new Date(now.getTime() - 30 * 24 * 60 * 60 * 1000)) };
         case 'last90':
-            startDate = new Date(now.getTime() - 90 * 24 * 60 * 60 * 1000);
-            break;
+            return { start_date: iso(new Date(now.getTime() - 90 * 24 * 60 * 60 * 1000)) };
         case 'thisMonth':
-            startDate = new Date(now.getFullYear(), now.getMonth(), 1);
-            break;
+            return { start_date: iso(new Date(now.getFullYear(), now.getMonth(), 1)) };
         case 'lastMonth':
-            startDate = new Date(now.getFullYear(), now.getMonth() - 1, 1);
-            endDate = new Date(now.getFullYear(), now.getMonth(), 0);
-            break;
+            return {
+                start_date: iso(new Date(now.getFullYear(), now.getMonth() - 1, 1)),
+                end_date: iso(new Date(now.getFullYear(), now.getMonth(), 0))
+            };
         case 'thisYear':
-            startDate = new Date(now.getFullYear(), 0, 1);
-            break;
-        case 'custom':
-            const startInput = document.getElementById('startDate');
-            const endInput = document.getElementById('endDate');
-            if (startInput?.value) startDate = new Date(startInput.value);
-            if (endInput?.value) endDate = new Date(endInput.value);
-            break;
+            return { start_date: iso(new Date(now.getFullYear(), 0, 1)) };
+        case 'custom': {
+            const params = {};
+            const startValue = document.getElementById('startDate')?.value;
+            const endValue = document.getElementById('endDate')?.value;
+            if (startValue) params.start_date = startValue;
+            if (endValue) params.end_date = endValue;
+            return params;
+        }
         default:
-            return expenses; // 'all' or unrecognized
+            return {};
     }
-    
-    return expenses.filter(expense => {
-        if (!expense.date) return false;
-        const expenseDate = new Date(expense.date);
-        const afterStart = !startDate || expenseDate >= startDate;
-        const beforeEnd = !endDate || expenseDate <= endDate;
-        return afterStart && beforeEnd;
+}
+
+// Translate the selected time period tab (a year or a year-month) into a date range
+function getPeriodDateRange() {
+    const period = window.getCurrentPeriodFilter ? window.getCurrentPeriodFilter() : 'all-time';
+    if (!period || period === 'all-time') return {};
+    const [year, month] = period.split('-').map(Number);
+    if (!month) return { start_date: `${year}-01-01`, end_date: `${year}-12-31` };
+    const pad = n => String(n).padStart(2, '0');
+    const lastDay = new Date(year, month, 0).getDate();
+    return { start_date: `${year}-${pad(month)}-01`, end_date: `${year}-${pad(month)}-${pad(lastDay)}` };
+}
+
+// /analytics query params for the chart period, the time period tab and the table filters
+function getChartFilters() {
+    const value = id => document.getElementById(id)?.value || '';
+    // Every date restriction applies, so the range is their intersection
+    const ranges = [getSelectedDateRange(), getPeriodDateRange(),
+                    { start_date: value('filter-date-from'), end_date: value('filter-date-to') }];
+    const starts = ranges.map(r => r.start_date).filter(Boolean).sort();
+    const ends = ranges.map(r => r.end_date).filter(Boolean).sort();
+    const params = {};
+    if (starts.length) params.start_date = starts[starts.length - 1];
+    if (ends.length) params.end_date = ends[0];
+    const filters = {
+        min_amount: 'filter-amount-min', max_amount: 'filter-amount-max',
+        category: 'filter-category', card: 'filter-card', who: 'filter-who',
+        need_category: 'filter-needcat', description: 'filter-description', notes: 'filter-notes'
+    };
+    Object.entries(filters).forEach(([param, id]) => {
+        if (value(id)) params[param] = value(id);
     });
+    return params;
 }
 
 // Update analytics summary cards
-function updateAnalyticsSummary(currentExpenses, allExpenses) {
-    const total = currentExpenses.reduce((sum, e) => sum + Number(e.amount || 0), 0);
-    const transactionCount = currentExpenses.length;
-    const avgDaily = currentExpenses.length > 0 ? total / getDaysInRange(currentExpenses) : 0;
-    
-    // Calculate top category
-    const categoryTotals = {};
-    currentExpenses.forEach(e => {
-        const cat = e.category || 'Unknown';
-        categoryTotals[cat] = (categoryTotals[cat] || 0) + Number(e.amount || 0);
-    });
-    
-    const topCategory = Object.keys(categoryTotals).reduce((a, b) => 
-        categoryTotals[a] > categoryTotals[b] ? a : b, 'None');
+function updateAnalyticsSummary(summary) {
+    const { total, transaction_count: transactionCount, avg_daily: avgDaily,
+            top_category: topCategory, top_category_amount: topCategoryAmount } = summary;
     
     // Update DOM elements
     updateElement('analyticsTotalSpending', `$${total.toLocaleString(undefined, {minimumFractionDigits: 2})}`);
     updateElement('analyticsAvgDaily', `$${avgDaily.toLocaleString(undefined, {minimumFractionDigits: 2})}`);
     updateElement('analyticsTopCategory', topCategory);
-    updateElement('analyticsTopCategoryAmount', `$${(categoryTotals[topCategory] || 0).toLocaleString(undefined, {minimumFractionDigits: 2})}`);
+    updateElement('analyticsTopCategoryAmount', `$${(topCategoryAmount || 0).toLocaleString(undefined, {minimumFractionDigits: 2})}`);
     updateElement('analyticsTransactionCount', transactionCount.toString());
     
     // Calculate changes (simple placeholder - could be enhanced with historical comparison)
@@ -99,16 +122,10 @@ function updateAnalyticsSummary(currentExpenses, allExpenses) {
 }
 
 // Enhanced trend chart with multiple time periods
-function renderTrendChart(expenses) {
+function renderTrendChart(trend) {
     destroyChart('trendChart');
     
-    const mode = getActiveTrendMode();
-    const data = aggregateByTimePeriod(expenses, mode);
-    
-    // Sort the data by date keys
-    const sortedEntries = Object.entries(data).sort(([a], [b]) => a.localeCompare(b));
-    const labels = sortedEntries.map(([key]) => key);
-    const values = sortedEntries.map(([, value]) => value);
+    const { labels, values } = trend;
     
     const ctx = document.getElementById('trendChart')?.getContext('2d');
     if (!ctx) return;
@@ -192,46 +209,8 @@ function renderTrendChart(expenses) {
     });
 }
 
-// Render time-based (monthly/yearly) bar chart
-function renderTimeBasedChart(expenses, mode) {
-    const group = {};
-    expenses.forEach(e => {
-        if (!e.date) return;
-        const key = mode === 'yearly' ? e.date.slice(0,4) : e.date.slice(0,7);
-        group[key] = (group[key]||0) + Number(e.amount);
-    });
-    
-    const ctxMonthlyBar = document.getElementById('monthlyBarChart')?.getContext('2d');
-    if (ctxMonthlyBar) {
-        if (window.monthlyBarChart && typeof window.monthlyBarChart.destroy === 'function') {
-            window.monthlyBarChart.destroy();
-        }
-        window.monthlyBarChart = new Chart(ctxMonthlyBar, {
-            type: 'bar',
-            data: {
-                labels: Object.keys(group),
-                datasets: [{
-                    data: Object.values(group),
-                    backgroundColor: getCSSColors(),
-                    borderRadius: 16,
-                    barPercentage: 0.65,
-                    categoryPercentage: 0.55,
-                }]
-            },
-            options: getBarChartOptions(),
-            plugins: [window.ChartDataLabels]
-        });
-    }
-}
-
 // Render category pie chart
-function renderCategoryChart(expenses) {
-    const byCategory = {};
-    expenses.forEach(e => {
-        const cat = (e.category || 'Unknown').toLowerCase();
-        byCategory[cat] = (byCategory[cat] || 0) + Number(e.amount);
-    });
-    
+function renderCategoryChart(byCategory) {
     // Emoji map for common categories
     const catEmojis = {
         groceries: '🛒', food: '🍽️', dining: '🍽️', restaurant: '🍽️',
@@ -269,13 +248,7 @@ function renderCategoryChart(expenses) {
 }
 
 // Render needs vs luxury pie chart
-function renderNeedLuxuryChart(expenses) {
-    const needLuxury = { Need: 0, Luxury: 0 };
-    expenses.forEach(e => {
-        const n = (e.need_category || 'Need');
-        needLuxury[n] = (needLuxury[n] || 0) + Number(e.amount);
-    });
-    
+function renderNeedLuxuryChart(needLuxury) {
     const needLuxuryEmojis = { Need: '🛒', Luxury: '💎' };
     const needLuxuryLabels = Object.keys(needLuxury).map(k => `${needLuxuryEmojis[k]||''} ${k}`);
     
@@ -301,20 +274,10 @@ function renderNeedLuxuryChart(expenses) {
 }
 
 // Render spender comparison pie chart
-function renderSpenderChart(expenses) {
-    const spenderTotals = { Gautami: 0, Ameya: 0 };
-    expenses.forEach(e => {
-        if (e.split_cost) {
-            // Split cost: each gets half
-            spenderTotals.Gautami += Number(e.amount || 0) / 2;
-            spenderTotals.Ameya += Number(e.amount || 0) / 2;
-        } else {
-            if (e.who === 'Gautami') spenderTotals.Gautami += Number(e.amount || 0);
-            if (e.who === 'Ameya') spenderTotals.Ameya += Number(e.amount || 0);
-        }
-    });
-    
-    const spenderLabels = ['👩 Gautami', '👨 Ameya'];
+function renderSpenderChart(spenderTotals) {
+    const spenderEmojis = { Gautami: '👩', Ameya: '👨' };
+    const spenders = Object.keys(spenderTotals);
+    const spenderLabels = spenders.map(name => spenderEmojis[name] ? `${spenderEmojis[name]} ${name}` : name);
     const ctxSpender = document.getElementById('spenderPieChart')?.getContext('2d');
     if (ctxSpender) {
         if (window.spenderChart) window.spenderChart.destroy();
@@ -323,7 +286,7 @@ function renderSpenderChart(expenses) {
             data: {
                 labels: spenderLabels,
                 datasets: [{
-                    data: [spenderTotals.Gautami, spenderTotals.Ameya],
+                    data: spenders.map(name => spenderTotals[name]),
                     backgroundColor: [
                         getComputedStyle(document.documentElement).getPropertyValue('--mint').trim(),
                         getComputedStyle(document.documentElement).getPropertyValue('--rosy-brown').trim()
@@ -337,20 +300,11 @@ function renderSpenderChart(expenses) {
 }
 
 // Render day of week spending pattern
-function renderDayOfWeekChart(expenses) {
+function renderDayOfWeekChart(dayTotals) {
     destroyChart('dayOfWeekChart');
     
-    const dayTotals = { Sun: 0, Mon: 0, Tue: 0, Wed: 0, Thu: 0, Fri: 0, Sat: 0 };
     const dayNames = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat'];
     
-    expenses.forEach(expense => {
-        if (expense.date) {
-            const date = new Date(expense.date);
-            const dayName = dayNames[date.getDay()];
-            dayTotals[dayName] += Number(expense.amount || 0);
-        }
-    });
-    
     const ctx = document.getElementById('dayOfWeekChart')?.getContext('2d');
     if (!ctx) return;
     
@@ -359,7 +313,7 @@ function renderDayOfWeekChart(expenses) {
         data: {
             labels: dayNames,
             datasets: [{
-                data: Object.values(dayTotals),
+                data: dayNames.map(day => dayTotals[day] || 0),
                 backgroundColor: getCSSColors(),
                 borderRadius: 8,
                 borderWidth: 2,
@@ -394,19 +348,10 @@ function renderDayOfWeekChart(expenses) {
 }
 
 // Render top merchants chart
-function renderMerchantChart(expenses) {
+function renderMerchantChart(topMerchants) {
     destroyChart('merchantChart');
     
-    const merchantTotals = {};
-    expenses.forEach(expense => {
-        const merchant = (expense.description || 'Unknown').split(' ')[0].toUpperCase();
-        merchantTotals[merchant] = (merchantTotals[merchant] || 0) + Number(expense.amount || 0);
-    });
-    
-    // Get top 10 merchants
-    const sortedMerchants = Object.entries(merchantTotals)
-        .sort(([,a], [,b]) => b - a)
-        .slice(0, 10);
+    const sortedMerchants = topMerchants.map(({ merchant, total }) => [merchant, total]);
     
     const ctx = document.getElementById('merchantChart')?.getContext('2d');
     if (!ctx) return;
@@ -468,53 +413,17 @@ function updateElement(id, text, changeClass = null) {
     }
 }
 
-function getDaysInRange(expenses) {
-    if (expenses.length === 0) return 1;
-    
-    const dates = expenses.map(e => new Date(e.date)).filter(d => !isNaN(d));
-    if (dates.length === 0) return 1;
-    
-    const minDate = new Date(Math.min(...dates));
-    const maxDate = new Date(Math.max(...dates));
-    return Math.max(1, Math.ceil((maxDate - minDate) / (1000 * 60 * 60 * 24)) + 1);
-}
-
 function getActiveTrendMode() {
     const activeBtn = document.querySelector('.chart-toggle-btn.active');
     return activeBtn ? activeBtn.dataset.chart : 'monthly';
 }
 
-function aggregateByTimePeriod(expenses, mode) {
-    const data = {};
-    
-    expenses.forEach(expense => {
-        if (!expense.date) return;
-        
-        const date = new Date(expense.date);
-        let key;
-        
-        switch (mode) {
-            case 'daily':
-                key = expense.date;
-                break;
-            case 'weekly':
-                const weekStart = new Date(date);
-                weekStart.setDate(date.getDate() - date.getDay());
-                key = weekStart.toISOString().slice(0, 10);
-                break;
-            case 'monthly':
-            default:
-                key = expense.date.slice(0, 7);
-                break;
-        }
-        
-        data[key] = (data[key] || 0) + Number(expense.amount || 0);
-    });
-    
-    return data;
-}
+let chartControlsReady = false;
 
-function setupChartControls(expenses) {
+function setupChartControls() {
+    if (chartControlsReady) return;
+    chartControlsReady = true;
+    
     // Setup date range change handler
     const dateRangeSelect = document.getElementById('dateRangeSelect');
     const customDateRange = document.getElementById('customDateRange');
@@ -524,7 +433,7 @@ function setupChartControls(expenses) {
             if (customDateRange) {
                 customDateRange.classList.toggle('hidden', dateRangeSelect.value !== 'custom');
             }
-            renderCharts(window.allExpenses || []);
+            loadAndRenderCharts().catch(err => console.error('Failed to load analytics:', err));
         });
     }
     
@@ -534,7 +443,7 @@ function setupChartControls(expenses) {
         if (input) {
             input.addEventListener('change', () => {
                 if (dateRangeSelect?.value === 'custom') {
-                    renderCharts(window.allExpenses || []);
+                    loadAndRenderCharts().catch(err => console.error('Failed to load analytics:', err));
                 }
             });
         }
@@ -545,7 +454,7 @@ function setupChartControls(expenses) {
         btn.addEventListener('click', () => {
             document.querySelectorAll('.chart-toggle-btn').forEach(b => b.classList.remove('active'));
             btn.classList.add('active');
-            renderTrendChart(expenses);
+            loadAndRenderCharts().catch(err => console.error('Failed to load analytics:', err));
         });
     });
 }
@@ -22,7 +22,7 @@ export function attachDeleteAllBtnListener() {
                 await window.loadStatements();
                 await window.loadExpenses();
                 if (window.renderFilters) window.renderFilters([]);
-                if (window.renderCharts) window.renderCharts([]);
+                if (window.renderCharts) window.renderCharts();
             } else {
                 let msg = 'Error!';
                 try {
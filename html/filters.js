@@ -154,7 +154,7 @@ export function applyColumnFilters(baseExpenses = null) {
         setFilteredExpenses(filtered);
         
         if (window.renderExpenses) window.renderExpenses(filtered);
-        if (window.renderCharts) window.renderCharts(filtered);
+        if (window.renderCharts) window.renderCharts();
         if (window.updateSpendingBlocks) window.updateSpendingBlocks(filtered);
     
     } catch (error) {
@@ -1,4 +1,5 @@
 import { CHART_COLORS } from './config.js';
+import { suggestDescriptions } from './api.js';
 
 // Generate colors for charts
 export function genColors(n) {
@@ -146,8 +147,8 @@ export function setupAnalyticsToggle() {
     if (!toggle) return;
     toggle.onchange = () => {
         // Trigger chart re-render when changed
-        if (window.renderCharts && window.filteredExpenses) {
-            window.renderCharts(window.filteredExpenses);
+        if (window.renderCharts) {
+            window.renderCharts();
         }
     };
 }
@@ -167,3 +168,37 @@ export function setupNotesArea() {
         });
     }
 }
+
+// Autocomplete a text input with matching expense descriptions through a <datalist>
+export function attachDescriptionSuggestions(input) {
+    if (!input) return;
+    const list = document.createElement('datalist');
+    list.id = `description-suggestions-${Math.random().toString(36).slice(2)}`;
+    input.setAttribute('list', list.id);
+    input.after(list);
+    let timer;
+    let latest = 0;
+    input.addEventListener('input', () => {
+        clearTimeout(timer);
+        const q = input.value.trim();
+        if (!q) {
+            list.innerHTML = '';
+            return;
+        }
+        timer = setTimeout(async () => {
+            const request = ++latest;
+            try {
+                const data = await suggestDescriptions(q);
+                if (request !== latest) return; // A newer keystroke already asked
+                list.innerHTML = '';
+                (data.suggestions || []).forEach(s => {
+                    const option = document.createElement('option');
+                    option.value = s.description;
+                    list.appendChild(option);
+                });
+            } catch (error) {
+                console.error('Error loading description suggestions:', error);
+            }
+        }, 150);
+    });
+}
@@ -87,6 +87,19 @@ export async function getMonthlyIncome(year, month) {
     }
 }
 
+// Monthly income for an inclusive range of 'YYYY-MM' months in one request
+export async function getMonthlyIncomeRange(start, end) {
+    try {
+        const params = new URLSearchParams({ start, end });
+        const response = await fetch(`/income/monthly?${params}`);
+        const data = await response.json();
+        return data;
+    } catch (error) {
+        console.error('Error getting monthly income range:', error);
+        return { success: false, error: 'Network error' };
+    }
+}
+
 export async function loadIncomeDistribution(startDate = null, endDate = null) {
     try {
         let url = '/income/distribution';
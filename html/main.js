@@ -1,216 +1,53 @@
 // Main application entry point
 
-// === Undo/Redo Stack ===
-const undoStack = [];
-const redoStack = [];
-let isRestoringState = false; // Prevent infinite loops during restoration
+// === Undo/Redo (server-side operation journal) ===
+// Every expense edit, delete, staging approval and category rename is journaled
+// by the server, so undo only sends a request and reloads what changed.
+let undoStatus = { undo_count: 0, redo_count: 0, next_undo: null, next_redo: null };
+let isUndoing = false;
 
-function getAppStateSnapshot() {
-    // Capture all relevant state: expenses, statements, filters, sort, etc.
-    const state = {
-        expenses: JSON.parse(JSON.stringify(window.allExpenses || [])),
-        filteredExpenses: JSON.parse(JSON.stringify(window.filteredExpenses || [])),
-        statements: JSON.parse(JSON.stringify(window.statementsList || [])),
-        filters: {
-            category: document.getElementById('filter-category')?.value || '',
-            card: document.getElementById('filter-card')?.value || '',
-            who: document.getElementById('filter-who')?.value || '',
-            needcat: document.getElementById('filter-needcat')?.value || ''
-        },
-        sortState: JSON.parse(JSON.stringify(window.sortState || { column: 'date', direction: -1 })),
-        timestamp: Date.now() // Add timestamp for debugging
-    };
-    
-    console.log('📸 Capturing state snapshot:', {
-        expensesCount: state.expenses.length,
-        filtersActive: Object.values(state.filters).some(v => v !== ''),
-        sortColumn: state.sortState.column,
-        timestamp: new Date(state.timestamp).toLocaleTimeString()
-    });
-    
-    return state;
+// Called after mutations; the server already journaled them, so just refresh the buttons
+function pushUndoState() {
+    refreshUndoStatus();
 }
 
-function restoreAppState(state) {
-    if (!state) {
-        console.warn('⚠️ No state to restore');
-        return;
-    }
-    
-    console.log('🔄 Restoring state:', {
-        expensesCount: state.expenses?.length || 0,
-        timestamp: new Date(state.timestamp).toLocaleTimeString()
-    });
-    
-    // Set flag to prevent triggering new undo states during restoration
-    isRestoringState = true;
-    
+async function refreshUndoStatus() {
     try {
-        // Restore expenses (most important)
-        if (state.expenses) {
-            window.allExpenses = state.expenses;
-            if (window.setAllExpenses) {
-                window.setAllExpenses(state.expenses);
-            }
-        }
-        
-        if (state.filteredExpenses) {
-            window.filteredExpenses = state.filteredExpenses;
-            if (window.setFilteredExpenses) {
-                window.setFilteredExpenses(state.filteredExpenses);
-            }
-        }
-        
-        // Restore statements (if available)
-        if (state.statements) {
-            window.statementsList = state.statements;
-            if (window.renderStatements) {
-                window.renderStatements(state.statements);
-            }
-        }
-        
-        // Restore filters
-        if (state.filters) {
-            const filterElements = {
-                'filter-category': state.filters.category,
-                'filter-card': state.filters.card,
-                'filter-who': state.filters.who,
-                'filter-needcat': state.filters.needcat
-            };
-            
-            Object.entries(filterElements).forEach(([id, value]) => {
-                const element = document.getElementById(id);
-                if (element && element.value !== value) {
-                    element.value = value;
-                }
-            });
-        }
-        
-        // Restore sort state
-        if (state.sortState) {
-            window.sortState = state.sortState;
-            if (window.setSortState) {
-                window.setSortState(state.sortState);
-            }
-        }
-        
-        // Re-render UI components
-        const expensesToRender = state.filteredExpenses || state.expenses || [];
-        
-        // Update sort arrows
-        if (window.updateSortArrows) {
-            window.updateSortArrows();
-        }
-        
-        // Apply filters (this should update filteredExpenses based on current filters)
-        if (window.applyColumnFilters) {
-            window.applyColumnFilters();
-        }
-        
-        // Re-render components with the restored data
-        if (window.renderExpenses) {
-            window.renderExpenses(window.filteredExpenses || expensesToRender);
-        }
-        
-        if (window.renderCharts) {
-            window.renderCharts(expensesToRender);
-        }
-        
-        if (window.renderFilters) {
-            window.renderFilters(state.expenses || []);
-        }
-        
-        if (window.updateSpendingBlocks) {
-            window.updateSpendingBlocks(expensesToRender);
-        }
-        
-        // Restore time period tabs
-        if (window.createTimePeriodTabs) {
-            window.createTimePeriodTabs();
-        }
-        
-        console.log('✅ State restored successfully');
-        
+        undoStatus = await getUndoStatus();
     } catch (error) {
-        console.error('❌ Error restoring state:', error);
-    } finally {
-        // Always reset the flag
-        isRestoringState = false;
+        console.warn('Could not load undo status:', error);
     }
+    updateUndoRedoButtons();
 }
 
-function pushUndoState() {
-    // Don't capture state if we're in the middle of restoring
-    if (isRestoringState) {
-        console.log('🚫 Skipping undo state capture (currently restoring)');
-        return;
-    }
-    
-    const currentState = getAppStateSnapshot();
-    
-    // Don't push identical states
-    if (undoStack.length > 0) {
-        const lastState = undoStack[undoStack.length - 1];
-        if (JSON.stringify(lastState.expenses) === JSON.stringify(currentState.expenses) &&
-            JSON.stringify(lastState.filters) === JSON.stringify(currentState.filters) &&
-            JSON.stringify(lastState.sortState) === JSON.stringify(currentState.sortState)) {
-            console.log('🚫 Skipping identical state');
+async function runJournalStep(step, verb) {
+    if (isUndoing) return;
+    isUndoing = true;
+    try {
+        const result = await step();
+        if (result.success === false) {
+            showUndoFeedback(result.error || `Nothing to ${verb}`);
             return;
         }
+        await initializeCategories();
+        await loadStatementsMain();
+        await loadExpensesMain();
+        showUndoFeedback(`${verb === 'undo' ? 'Undid' : 'Redid'}: ${result.summary || result.op}`);
+    } catch (error) {
+        console.error(`${verb} failed:`, error);
+        showUndoFeedback(`${verb === 'undo' ? 'Undo' : 'Redo'} failed`);
+    } finally {
+        isUndoing = false;
+        await refreshUndoStatus();
     }
-    
-    undoStack.push(currentState);
-    
-    // Limit undo stack size to prevent memory issues
-    if (undoStack.length > 50) {
-        undoStack.shift();
-    }
-    
-    // Clear redo stack on new action
-    redoStack.length = 0;
-    
-    console.log(`📚 Undo stack size: ${undoStack.length}, Redo stack size: ${redoStack.length}`);
-    
-    // Update undo/redo button states
-    updateUndoRedoButtons();
 }
 
 function undo() {
-    if (undoStack.length === 0) {
-        console.log('🚫 No states to undo');
-        return;
-    }
-    
-    console.log('⏪ Performing undo');
-    
-    // Save current state to redo stack before undoing
-    const currentState = getAppStateSnapshot();
-    redoStack.push(currentState);
-    
-    // Get and restore previous state
-    const previousState = undoStack.pop();
-    restoreAppState(previousState);
-    
-    updateUndoRedoButtons();
+    return runJournalStep(performUndo, 'undo');
 }
 
 function redo() {
-    if (redoStack.length === 0) {
-        console.log('🚫 No states to redo');
-        return;
-    }
-    
-    console.log('⏩ Performing redo');
-    
-    // Save current state to undo stack before redoing
-    const currentState = getAppStateSnapshot();
-    undoStack.push(currentState);
-    
-    // Get and restore next state
-    const nextState = redoStack.pop();
-    restoreAppState(nextState);
-    
-    updateUndoRedoButtons();
+    return runJournalStep(performRedo, 'redo');
 }
 
 function updateUndoRedoButtons() {
@@ -219,16 +56,39 @@ function updateUndoRedoButtons() {
     const redoBtn = document.getElementById('redoBtn');
     
     if (undoBtn) {
-        undoBtn.disabled = undoStack.length === 0;
-        undoBtn.title = undoStack.length === 0 ? 'Nothing to undo' : `Undo (${undoStack.length} actions available)`;
+        undoBtn.disabled = undoStatus.undo_count === 0;
+        undoBtn.title = undoStatus.next_undo ? `Undo: ${undoStatus.next_undo}` : 'Nothing to undo';
     }
     
     if (redoBtn) {
-        redoBtn.disabled = redoStack.length === 0;
-        redoBtn.title = redoStack.length === 0 ? 'Nothing to redo' : `Redo (${redoStack.length} actions available)`;
+        redoBtn.disabled = undoStatus.redo_count === 0;
+        redoBtn.title = undoStatus.next_redo ? `Redo: ${undoStatus.next_redo}` : 'Nothing to redo';
     }
 }
 
+// Show a short-lived notification for undo/redo results
+function showUndoFeedback(message) {
+    const notification = document.createElement('div');
+    notification.textContent = message;
+    notification.style.cssText = `
+        position: fixed;
+        top: 20px;
+        right: 20px;
+        background: #333;
+        color: white;
+        padding: 10px 15px;
+        border-radius: 5px;
+        z-index: 10000;
+        font-size: 14px;
+        transition: opacity 0.3s ease;
+    `;
+    document.body.appendChild(notification);
+    setTimeout(() => {
+        notification.style.opacity = '0';
+        setTimeout(() => notification.remove(), 300);
+    }, 2000);
+}
+
 // Enhanced keyboard shortcuts for undo/redo
 window.addEventListener('keydown', (e) => {
     // Skip if user is typing in an input field
@@ -283,8 +143,8 @@ function createUndoRedoButtons() {
 }
 
 import { setAllExpenses, setFilteredExpenses, setSortState } from './config.js';
-import { loadExpenses, loadStatements } from './api.js';
-import { renderCharts } from './charts.js';
+import { loadExpenses, loadStatements, performUndo, performRedo, getUndoStatus } from './api.js';
+import { renderCharts, loadAndRenderCharts } from './charts.js';
 import { initializeCategories } from './categories.js';
 import { applyColumnFilters, attachFilterAndSortListeners, updateSortArrows } from './filters.js';
 import { exportFilteredToCSV, setupDarkModeToggle, setupAnalyticsToggle, setupNotesArea } from './helpers.js';
@@ -328,15 +188,11 @@ async function loadExpensesMain() {
     applyColumnFilters();
     updateSortArrows();
     renderFilters(expenses);
-    renderCharts(expenses);
+    renderCharts();
     // Save state after loading
     window.allExpenses = expenses;
     
-    // Capture initial state after everything is loaded
-    setTimeout(() => {
-        pushUndoState();
-        console.log('📸 Initial state captured after expense loading');
-    }, 500);
+    refreshUndoStatus();
 }
 
 // Main load function for statements
@@ -415,15 +271,37 @@ window.addEventListener('DOMContentLoaded', async () => {
     const backupPushBtn = document.getElementById('backupPushBtn');
     if (backupPushBtn) {
         backupPushBtn.addEventListener('click', async () => {
-            const { backupAndPush } = await import('./api.js');
+            const { backupAndPush, getBackupStatus } = await import('./api.js');
+            const stageLabels = {
+                fetch: 'Fetching', snapshot: 'Snapshotting', compress: 'Compressing',
+                encrypt: 'Encrypting', commit: 'Committing', push: 'Pushing'
+            };
             
             // Disable button and show loading state
             backupPushBtn.disabled = true;
             const originalText = backupPushBtn.textContent;
             backupPushBtn.textContent = '🔄 Backing up...';
             
+            // Start the job (or follow the one already running) and poll until it finishes
+            const runJob = async (force) => {
+                const started = await backupAndPush(force);
+                if (!started.success && !started.job) return started;
+                while (true) {
+                    const { job } = await getBackupStatus();
+                    if (!job || job.state !== 'running') return { ...job, success: job?.state === 'succeeded', message: job?.error };
+                    const stage = job.stages[job.stage];
+                    const percent = stage && stage.total ? ` ${Math.floor(stage.done * 100 / stage.total)}%` : '';
+                    backupPushBtn.textContent = `🔄 ${stageLabels[job.stage] || 'Backing up'}...${percent}`;
+                    await new Promise(resolve => setTimeout(resolve, 1000));
+                }
+            };
+            
             try {
-                const result = await backupAndPush();
+                let result = await runJob(false);
+                if (result.state === 'conflict' &&
+                    confirm('The remote backup has been updated from another database. Overwrite it with this one?')) {
+                    result = await runJob(true);
+                }
                 
                 if (result.success) {
                     backupPushBtn.textContent = '✅ Success!';
@@ -440,7 +318,10 @@ window.addEventListener('DOMContentLoaded', async () => {
                             </div>
                             <div>
                                 <p class="font-bold">Backup Successful!</p>
-                                <p class="text-sm">Your expenses have been backed up and pushed to GitHub.</p>
+                                <p class="text-sm">${result.result && result.result.pushed === false
+                                    ? 'Nothing new to back up.'
+                                    : 'Your expenses have been backed up and pushed to GitHub.'}</p>
+                                ${result.result && result.result.bytes_saved != null ? `<p class="text-sm">Compression saved ${(result.result.bytes_saved / 1024).toFixed(1)} KB in ${result.seconds}s.</p>` : ''}
                             </div>
                         </div>
                     `;
@@ -466,7 +347,7 @@ window.addEventListener('DOMContentLoaded', async () => {
                             </div>
                             <div>
                                 <p class="font-bold">Backup Failed</p>
-                                <p class="text-sm">${result.message || 'Unknown error occurred'}</p>
+                                <p class="text-sm">${result.message || result.error || 'Unknown error occurred'}</p>
                             </div>
                         </div>
                     `;
@@ -544,6 +425,7 @@ window.loadExpenses = loadExpensesMain;
 window.loadStatements = loadStatementsMain;
 window.renderExpenses = renderExpenses;
 window.renderCharts = renderCharts;
+window.loadAndRenderCharts = loadAndRenderCharts;
 window.renderFilters = renderFilters;
 window.applyColumnFilters = applyColumnFilters;
 window.updateSpendingBlocks = updateSpendingBlocks;
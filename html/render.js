@@ -1,6 +1,7 @@
 import { CATEGORY_META, CATEGORY_LIST, allExpenses } from './config.js';
 import { getCategoryMeta, createCategoryDropdown, handleCategorySelection } from './categories.js';
-import { addExpense, updateExpense, deleteExpense, reimportStatement, bulkDeleteExpenses } from './api.js';
+import { addExpense, updateExpense, deleteExpense, reimportStatement, bulkDeleteExpenses, bulkUpdateExpenses } from './api.js';
+import { attachDescriptionSuggestions } from './helpers.js';
 
 // Utility: Format date as yyyy-month-dd (but keep original date for sorting)
 export function formatDate(dateStr) {
@@ -438,6 +439,7 @@ function addManualEntryRow(tbody) {
         <td class="py-2 px-3 text-center"><button class="add-expense-btn bg-green-500 text-white px-2 py-1 rounded">＋</button></td>
     `;
     tbody.appendChild(addTr);
+    attachDescriptionSuggestions(addTr.querySelector('.add-description'));
     
     setupManualEntryListeners(addTr);
 }
@@ -579,7 +581,6 @@ function setupRowListeners(tr, exp) {
             if (confirm('Delete this row?')) {
                 if (window.pushUndoState) window.pushUndoState();
                 await deleteExpense(exp.id);
-                if (window.pushUndoStateSelective) window.pushUndoStateSelective('delete');
 
                 // Reload data from server to ensure consistency
                 if (window.loadExpenses) {
@@ -674,9 +675,6 @@ function setupInlineEditing(tbody, expenses) {
 
     // saveInlineEdit function
     async function saveInlineEdit(cell, exp, field, value, closeCellAfter = false) {
-        if (window.pushUndoState) window.pushUndoState();
-        if (window.pushUndoStateSelective) window.pushUndoStateSelective('edit');
-
         const { API_URL } = await import('./config.js');
         
         try {
@@ -724,6 +722,7 @@ function setupInlineEditing(tbody, expenses) {
             if (!response.ok) {
                 throw new Error(`Server error: ${response.status}`);
             }
+            if (window.pushUndoState) window.pushUndoState();
             
             // Update local data
             exp[field] = value;
@@ -987,7 +986,6 @@ function setupAutofillButtons() {
         bulkDeleteBtn.onclick = async () => {
             await handleBulkDelete(bulkDeleteBtn);
         };
-        if (window.pushUndoStateSelective) window.pushUndoStateSelective('bulk_delete');
 
     }
     
@@ -1138,15 +1136,12 @@ function showAutofillInput(mode) {
             }
         }
         
-        // Update expenses
-        const { API_URL } = await import('./config.js');
-        for (const id of ids) {
-            const res = await fetch(`${API_URL}/expense/${id}`, {
-                method: 'PATCH',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ who: value })
-            });
-            if (!res.ok) success = false;
+        // Update all expenses in one request
+        try {
+            const result = await bulkUpdateExpenses(ids, { who: value });
+            if (result.updated_count !== ids.length) success = false;
+        } catch (err) {
+            success = false;
         }
         
         // Reload expenses
@@ -1,8 +1,16 @@
 import { API_URL } from './config.js';
 import { CATEGORY_LIST, CATEGORY_META } from './config.js';
+import { attachDescriptionSuggestions } from './helpers.js';
+import { importUserRules, userRulesExportUrl } from './api.js';
 
 let allUserRules = [];
 
+const MATCH_TYPE_LABELS = {
+    normalized: 'normalized',
+    prefix: 'starts with',
+    regex: 'regex'
+};
+
 // Show user rules management modal
 export async function showUserRulesModal() {
     const modal = document.getElementById('userRulesModal');
@@ -25,9 +33,17 @@ async function populateUserRulesModal() {
     await loadUserRules();
     populateCategorySelect();
     setupUserRulesSearch();
+    setupDescriptionSuggestions();
     renderUserRulesList();
 }
 
+// Suggest existing expense descriptions while typing a new rule
+function setupDescriptionSuggestions() {
+    const descriptionInput = document.getElementById('newUserRuleDescription');
+    if (!descriptionInput || descriptionInput.hasAttribute('list')) return;
+    attachDescriptionSuggestions(descriptionInput);
+}
+
 // Load all user rules from the backend
 async function loadUserRules() {
     try {
@@ -110,7 +126,9 @@ function renderUserRulesList() {
         <div class="user-rule-item bg-gray-50 border rounded p-3 mb-2">
             <div class="flex justify-between items-start">
                 <div class="flex-1">
-                    <div class="font-medium text-sm text-gray-900">${escapeHtml(userRule.description)}</div>
+                    <div class="font-medium text-sm text-gray-900">
+                        ${userRule.match_type && userRule.match_type !== 'exact' ? `<span class="text-xs text-indigo-600 mr-1">[${MATCH_TYPE_LABELS[userRule.match_type] || userRule.match_type}]</span>` : ''}${escapeHtml(userRule.description)}
+                    </div>
                     <div class="text-xs text-gray-600 mt-1">
                         ${userRule.category ? `Category: ${getCategoryDisplay(userRule.category)}` : ''}
                         ${userRule.category && userRule.need_category ? ' • ' : ''}
@@ -118,11 +136,11 @@ function renderUserRulesList() {
                     </div>
                 </div>
                 <div class="flex gap-1 ml-2">
-                    <button onclick="editUserRule('${escapeHtml(userRule.description)}')" 
+                    <button onclick="editUserRule(${ruleArg(userRule.description)})" 
                             class="text-blue-600 hover:text-blue-800 text-xs px-2 py-1 rounded border">
                         Edit
                     </button>
-                    <button onclick="deleteUserRuleConfirm('${escapeHtml(userRule.description)}')" 
+                    <button onclick="deleteUserRuleConfirm(${ruleArg(userRule.description)})" 
                             class="text-red-600 hover:text-red-800 text-xs px-2 py-1 rounded border">
                         Delete
                     </button>
@@ -146,6 +164,8 @@ export async function addNewUserRule() {
     const descriptionInput = document.getElementById('newUserRuleDescription');
     const categorySelect = document.getElementById('newUserRuleCategory');
     const needCategorySelect = document.getElementById('newUserRuleNeedCategory');
+    const matchTypeSelect = document.getElementById('newUserRuleMatchType');
+    const applyCheckbox = document.getElementById('newUserRuleApply');
     
     if (!descriptionInput || !categorySelect || !needCategorySelect) return;
     
@@ -172,7 +192,9 @@ export async function addNewUserRule() {
             body: JSON.stringify({
                 description,
                 category: category || null,
-                need_category: needCategory || null
+                need_category: needCategory || null,
+                match_type: matchTypeSelect ? matchTypeSelect.value : 'exact',
+                apply: applyCheckbox ? applyCheckbox.checked : false
             })
         });
         
@@ -189,7 +211,8 @@ export async function addNewUserRule() {
             renderUserRulesList();
             
             // Show success message
-            showNotification(data.message, 'success');
+            showNotification(appliedMessage(data), 'success');
+            await reloadIfApplied(data);
         } else {
             showNotification(data.error || 'Failed to add user rule', 'error');
         }
@@ -227,7 +250,7 @@ export async function editUserRule(description) {
                     }).join('')}
                 </select>
             </div>
-            <div class="mb-4">
+            <div class="mb-3">
                 <label class="block text-sm font-medium mb-1">Need Category</label>
                 <select id="editNeedCategory" class="w-full px-2 py-1 border rounded text-sm">
                     <option value="">Auto</option>
@@ -235,12 +258,17 @@ export async function editUserRule(description) {
                     <option value="Luxury" ${userRule.need_category === 'Luxury' ? 'selected' : ''}>Luxury</option>
                 </select>
             </div>
+            <div class="mb-4">
+                <label class="text-sm text-gray-600">
+                    <input type="checkbox" id="editApply" /> Apply to existing expenses
+                </label>
+            </div>
             <div class="flex gap-2 justify-end">
                 <button onclick="this.closest('.fixed').remove()" 
                         class="px-4 py-2 text-gray-600 border rounded hover:bg-gray-50">
                     Cancel
                 </button>
-                <button onclick="saveUserRuleEdit('${escapeHtml(userRule.description)}', this)" 
+                <button onclick="saveUserRuleEdit(${ruleArg(userRule.description)}, this)" 
                         class="px-4 py-2 bg-blue-600 text-white rounded hover:bg-blue-700">
                     Save
                 </button>
@@ -256,6 +284,7 @@ export async function saveUserRuleEdit(originalDescription, button) {
     const modal = button.closest('.fixed');
     const categorySelect = modal.querySelector('#editCategory');
     const needCategorySelect = modal.querySelector('#editNeedCategory');
+    const applyCheckbox = modal.querySelector('#editApply');
     
     const category = categorySelect.value;
     const needCategory = needCategorySelect.value;
@@ -273,7 +302,8 @@ export async function saveUserRuleEdit(originalDescription, button) {
             },
             body: JSON.stringify({
                 category: category || null,
-                need_category: needCategory || null
+                need_category: needCategory || null,
+                apply: applyCheckbox ? applyCheckbox.checked : false
             })
         });
         
@@ -283,7 +313,8 @@ export async function saveUserRuleEdit(originalDescription, button) {
             modal.remove();
             await loadUserRules();
             renderUserRulesList();
-            showNotification(data.message, 'success');
+            showNotification(appliedMessage(data), 'success');
+            await reloadIfApplied(data);
         } else {
             showNotification(data.error || 'Failed to update user rule', 'error');
         }
@@ -319,7 +350,60 @@ export async function deleteUserRuleConfirm(description) {
     }
 }
 
+// Download every rule
+export function exportUserRules(format = 'json') {
+    window.location.href = userRulesExportUrl(format);
+}
+
+// Import rules from the chosen file, then refresh the list
+export async function importUserRulesFile(input) {
+    const file = input.files && input.files[0];
+    if (!file) return;
+    try {
+        const data = await importUserRules(file);
+        await loadUserRules();
+        renderUserRulesList();
+        if (data.success) {
+            const skipped = data.skipped ? `, ${data.skipped} skipped` : '';
+            const summary = `Imported ${data.imported} rule(s): ${data.inserted} new, ${data.updated} updated${skipped}`;
+            if (data.complete === false) {
+                // The rules before the error were saved; the rest of the file was not read
+                showNotification(`${summary}, then stopped: ${data.error}`, 'error');
+            } else {
+                showNotification(summary, 'success');
+            }
+        } else {
+            showNotification(data.error || 'Failed to import user rules', 'error');
+        }
+    } catch (error) {
+        console.error('Error importing user rules:', error);
+        showNotification('Failed to import user rules. Please try again.', 'error');
+    } finally {
+        input.value = '';
+    }
+}
+
 // Utility functions
+
+// Success message, with how many existing rows a rule was applied to
+function appliedMessage(data) {
+    if (!data.applied) return data.message;
+    const expenses = data.applied.expenses || 0;
+    const staged = data.applied.staging_expenses || 0;
+    return `${data.message} (applied to ${expenses} expense(s)${staged ? ` and ${staged} staged row(s)` : ''})`;
+}
+
+async function reloadIfApplied(data) {
+    if (data.applied && data.applied.expenses && window.loadExpenses) {
+        await window.loadExpenses();
+    }
+}
+
+// A rule description as an inline onclick argument; regex rules contain quotes and backslashes
+function ruleArg(text) {
+    return `decodeURIComponent('${encodeURIComponent(text).replace(/'/g, '%27')}')`;
+}
+
 function escapeHtml(text) {
     const div = document.createElement('div');
     div.textContent = text;
@@ -359,4 +443,6 @@ window.editUserRule = editUserRule;
 window.saveUserRuleEdit = saveUserRuleEdit;
 window.deleteUserRuleConfirm = deleteUserRuleConfirm;
 window.addNewUserRule = addNewUserRule;
-window.closeUserRulesModal = closeUserRulesModal;
\ No newline at end of file
+window.closeUserRulesModal = closeUserRulesModal;
+window.exportUserRules = exportUserRules;
+window.importUserRulesFile = importUserRulesFile;
\ No newline at end of file
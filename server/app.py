@@ -10,7 +10,9 @@ except ImportError:
     CORS = None
 
 # Import service modules
-from services import database_service, expense_service, category_service, pdf_service, cleanup_service, statement_service, staging_service, user_rules_service, income_service
+from services import database_service, expense_service, category_service, pdf_service, cleanup_service, statement_service, staging_service, user_rules_service, income_service, archive_service, analytics_service, summary_service, change_log_service, journal_service, cashflow_service, backup_job_service
+from services.cache_service import conditional_get
+from services.response_service import compress_response, wants_columnar
 
 UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'csv', 'pdf'}
@@ -51,6 +53,9 @@ def ensure_database():
         database_service.init_db()
         print("Database reinitialized due to missing tables")
 
+# Gzip JSON responses for clients that accept it
+app.after_request(compress_response)
+
 # --- Utility ---
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -144,13 +149,79 @@ def delete_expense(row_id):
 def bulk_delete_expenses():
     return expense_service.bulk_delete_expenses(request)
 
+@app.route('/expenses/bulk_update', methods=['PATCH'])
+def bulk_patch_expenses():
+    return expense_service.bulk_patch_expenses(request)
+
 @app.route('/expense/<int:row_id>', methods=['PATCH'])
 def patch_expense(row_id):
     return expense_service.patch_expense(row_id, request)
 
 @app.route('/expenses', methods=['GET'])
+@conditional_get('expenses')
 def get_expenses():
-    return expense_service.get_expenses()
+    return expense_service.get_expenses(request.args)
+
+@app.route('/expenses/export', methods=['GET'])
+def export_expenses():
+    """Stream matching expenses as NDJSON, or CSV with ?format=csv"""
+    return expense_service.export_expenses(request.args)
+
+@app.route('/expenses/changes', methods=['GET'])
+def get_expense_changes():
+    return change_log_service.get_expense_changes(
+        request.args.get('since', 0),
+        request.args.get('limit', 1000)
+    )
+
+@app.route('/expenses/changes/compact', methods=['POST'])
+def compact_expense_changes():
+    return change_log_service.compact_expense_changes()
+
+@app.route('/expenses/descriptions', methods=['GET'])
+@conditional_get('expenses')
+def suggest_descriptions():
+    """Autocomplete distinct expense descriptions containing q"""
+    return expense_service.suggest_descriptions(request.args)
+
+@app.route('/expenses/search', methods=['GET'])
+def search_expenses():
+    return expense_service.search_expenses(request.args.get('q', ''), request.args)
+
+@app.route('/expenses/totals', methods=['GET'])
+@conditional_get('expenses')
+def get_expense_totals():
+    return expense_service.get_expense_totals(request.args)
+
+@app.route('/analytics', methods=['GET'])
+@conditional_get('expenses')
+def get_analytics():
+    """All dashboard aggregates for a date range and the /expenses filters"""
+    return analytics_service.get_analytics(request.args)
+
+@app.route('/summary/monthly', methods=['GET'])
+@conditional_get('expenses')
+def get_monthly_summary():
+    """Monthly totals from the incrementally maintained summary table"""
+    return summary_service.get_monthly_summary(request.args)
+
+@app.route('/summary/trends', methods=['GET'])
+@conditional_get('expenses')
+def get_summary_trends():
+    """Month-over-month and year-over-year spending changes"""
+    return summary_service.get_summary_trends(request.args)
+
+@app.route('/summary/rebuild', methods=['POST'])
+def rebuild_monthly_summary():
+    """Verify the summary table against raw expenses and rebuild it"""
+    return jsonify(summary_service.rebuild_monthly_summary())
+
+@app.cli.command('rebuild-summary')
+def rebuild_summary_command():
+    """Verify and rebuild the monthly expense summary table."""
+    report = summary_service.rebuild_monthly_summary()
+    status = 'consistent' if report['consistent'] else f"{report['mismatch_count']} mismatched group(s) fixed"
+    print(f"Rebuilt {report['groups']} summary group(s): {status}")
 
 # --- HTML Page Routes (must come before API routes to avoid conflicts) ---
 @app.route('/')
@@ -168,9 +239,10 @@ def get_pending_statements():
     return staging_service.get_all_pending_statements()
 
 @app.route('/api/staging/<int:statement_id>', methods=['GET'])
+@conditional_get('staging_expenses', 'statements')
 def get_staging_data(statement_id):
     """Get staging data for a specific statement"""
-    data = staging_service.get_staging_data(statement_id)
+    data = staging_service.get_staging_data(statement_id, wants_columnar())
     if not data:
         return jsonify({'error': 'Statement not found or no staging data'}), 404
     return jsonify(data)
@@ -202,6 +274,7 @@ def delete_staging_expense(staging_id):
     return staging_service.delete_staging_expense(staging_id)
 
 @app.route('/categories', methods=['GET'])
+@conditional_get('custom_categories')
 def get_categories():
     return jsonify({
         'categories': category_service.get_all_categories(),
@@ -266,6 +339,7 @@ def cleanup_null_rows():
     return cleanup_service.cleanup_null_rows()
 
 @app.route('/statements', methods=['GET'])
+@conditional_get('statements')
 def list_statements():
     return statement_service.list_statements()
 
@@ -275,11 +349,12 @@ def reimport_statement(statement_id):
 
 # --- User Override Rules Endpoints ---
 @app.route('/user_rules', methods=['GET'])
+@conditional_get('user_overrides')
 def get_user_rules():
     """Get all user override rules"""
     search_term = request.args.get('search', '')
     if search_term:
-        return user_rules_service.search_user_rules(search_term)
+        return user_rules_service.search_user_rules(search_term, request.args.get('limit'))
     return user_rules_service.get_all_user_rules()
 
 @app.route('/user_rules', methods=['POST'])
@@ -292,8 +367,29 @@ def add_user_rule():
     description = data.get('description', '').strip()
     category = data.get('category', '').strip() if data.get('category') else None
     need_category = data.get('need_category', '').strip() if data.get('need_category') else None
+    match_type = data.get('match_type') or 'exact'
     
-    return user_rules_service.add_user_rule(description, category, need_category)
+    return user_rules_service.add_user_rule(description, category, need_category, match_type,
+                                            apply=bool(data.get('apply')))
+
+@app.route('/user_rules/import', methods=['POST'])
+def import_user_rules():
+    """Bulk load user rules from an uploaded JSON or CSV file, or from the raw request body"""
+    upload = request.files.get('file')
+    name = upload.filename if upload else ''
+    default = 'csv' if name.lower().endswith('.csv') or request.mimetype == 'text/csv' else 'json'
+    fmt = request.args.get('format', default)
+    return user_rules_service.import_user_rules(upload.stream if upload else request.stream, fmt)
+
+@app.route('/user_rules/export', methods=['GET'])
+def export_user_rules():
+    """Download every user rule as JSON, NDJSON or CSV"""
+    return user_rules_service.export_user_rules(request.args.get('format', 'json'))
+
+@app.route('/user_rules/test', methods=['GET'])
+def test_user_rules():
+    """Show which user rules would categorize a description"""
+    return user_rules_service.test_user_rules(request.args.get('description', ''))
 
 @app.route('/user_rules/<rule_description>', methods=['PATCH'])
 def update_user_rule(rule_description):
@@ -305,7 +401,8 @@ def update_user_rule(rule_description):
     category = data.get('category', '').strip() if data.get('category') else None
     need_category = data.get('need_category', '').strip() if data.get('need_category') else None
     
-    return user_rules_service.update_user_rule(rule_description, category, need_category)
+    return user_rules_service.update_user_rule(rule_description, category, need_category,
+                                               apply=bool(data.get('apply')))
 
 @app.route('/user_rules/<rule_description>', methods=['DELETE'])
 def delete_user_rule(rule_description):
@@ -314,6 +411,7 @@ def delete_user_rule(rule_description):
 
 # --- Income Management Endpoints ---
 @app.route('/income', methods=['GET'])
+@conditional_get('income_records')
 def get_income_records():
     """Get all income records"""
     return income_service.get_all_income_records()
@@ -347,17 +445,31 @@ def delete_income_record(record_id):
     return income_service.delete_income_record(record_id)
 
 @app.route('/income/monthly/<int:year>/<int:month>', methods=['GET'])
+@conditional_get('income_records', 'monthly_income_overrides')
 def get_monthly_income(year, month):
     """Get monthly income for a specific month/year"""
     return income_service.get_monthly_income_with_overrides(year, month)
 
+@app.route('/income/monthly', methods=['GET'])
+@conditional_get('income_records', 'monthly_income_overrides')
+def get_monthly_income_batch():
+    """Monthly income for ?months=YYYY-MM,... and/or ?start=YYYY-MM&end=YYYY-MM"""
+    return income_service.get_monthly_income_batch(request.args)
+
 @app.route('/income/distribution', methods=['GET'])
+@conditional_get('income_records', 'monthly_income_overrides')
 def get_income_distribution():
     """Get income distribution data for analytics"""
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     return income_service.get_income_distribution(start_date, end_date)
 
+@app.route('/cashflow', methods=['GET'])
+@conditional_get('expenses', 'income_records', 'monthly_income_overrides')
+def get_cashflow():
+    """Income, spending and savings per month and user (?start_month=YYYY-MM&end_month=YYYY-MM)"""
+    return cashflow_service.get_cashflow(request.args)
+
 @app.route('/income/monthly_override', methods=['POST'])
 def add_monthly_income_override():
     """Add or update a monthly income override"""
@@ -383,64 +495,66 @@ def delete_monthly_income_override(year, month):
     """Delete a monthly income override"""
     return income_service.delete_monthly_income_override(year, month)
 
+# --- Undo/Redo Journal Endpoints ---
+@app.route('/undo', methods=['POST'])
+def undo():
+    """Revert the most recent expense, staging or category operation"""
+    return journal_service.undo()
+
+@app.route('/redo', methods=['POST'])
+def redo():
+    """Re-apply the most recently undone operation"""
+    return journal_service.redo()
+
+@app.route('/undo/status', methods=['GET'])
+def get_undo_status():
+    return journal_service.get_journal_status()
+
+# --- Cold History Archive Endpoints ---
+@app.route('/archive', methods=['GET'])
+def get_archive_summary():
+    """List archived years"""
+    return archive_service.get_archive_summary()
+
+@app.route('/archive', methods=['POST'])
+def archive_old_years():
+    """Move years outside the hot window into per-year archive databases"""
+    data = request.get_json(silent=True) or {}
+    return archive_service.archive_old_years(data.get('hot_years'))
+
+@app.route('/archive/<int:year>/restore', methods=['POST'])
+def restore_archived_year(year):
+    """Move an archived year back into the hot expenses table"""
+    return archive_service.restore_year(year)
+
 @app.route('/backup-and-push', methods=['POST'])
 def backup_and_push():
-    """Backup database and push changes to git repository"""
-    import subprocess
+    """Start backing up the database and pushing it to the database repository"""
     import os
     
-    try:
-        # Check if required environment variables are set
-        if 'EXPENSE_DB_PASSWORD' not in os.environ:
-            return jsonify({
-                'success': False,
-                'message': 'EXPENSE_DB_PASSWORD environment variable not set'
-            }), 400
-            
-        if 'EXPENSE_DB_REPO' not in os.environ:
-            return jsonify({
-                'success': False,
-                'message': 'EXPENSE_DB_REPO environment variable not set'
-            }), 400
-        
-        # Change to the parent directory (where db_manager.sh is located)
-        parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        
-        # Run the upload command with environment
-        result = subprocess.run(
-            ['bash', './db_manager.sh', 'upload'],
-            cwd=parent_dir,
-            capture_output=True,
-            text=True,
-            timeout=60,
-            env=dict(os.environ, LC_ALL='C', LANG='C'),
-            input='y\n'  # Auto-confirm any prompts
-        )
-        
-        if result.returncode == 0:
-            return jsonify({
-                'success': True,
-                'message': 'Database backed up and pushed successfully!',
-                'output': result.stdout
-            })
-        else:
-            return jsonify({
-                'success': False,
-                'message': 'Backup failed',
-                'error': result.stderr,
-                'output': result.stdout
-            }), 500
-            
-    except subprocess.TimeoutExpired:
+    # Check if required environment variables are set
+    if 'EXPENSE_DB_PASSWORD' not in os.environ:
         return jsonify({
             'success': False,
-            'message': 'Backup operation timed out'
-        }), 500
-    except Exception as e:
+            'message': 'EXPENSE_DB_PASSWORD environment variable not set'
+        }), 400
+        
+    if 'EXPENSE_DB_REPO' not in os.environ:
         return jsonify({
             'success': False,
-            'message': f'Backup failed: {str(e)}'
-        }), 500
+            'message': 'EXPENSE_DB_REPO environment variable not set'
+        }), 400
+    
+    # The job runs from the parent directory (where db_manager.sh and its
+    # .db_repo and db_backups directories are)
+    parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    data = request.get_json(silent=True) or {}
+    return backup_job_service.start_backup_job(parent_dir, force=bool(data.get('force')))
+
+@app.route('/backup-and-push/status', methods=['GET'])
+def backup_and_push_status():
+    parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return backup_job_service.get_backup_job_status(parent_dir)
 
 @app.route('/<path:filename>')
 def serve_static(filename):
@@ -0,0 +1,124 @@
+"""
+Measure request throughput of the production server as the worker count grows.
+
+Builds a throwaway database with N synthetic expenses (default 50,000), then
+for each worker count starts gunicorn with gunicorn.conf.py and drives it from
+concurrent keep-alive clients for a fixed time. Each request asks for a fresh
+/analytics query string, so the ETag body cache never answers it. Run from the
+server directory:
+
+    python benchmarks/load_test.py [rows] [workers,...] [seconds]
+
+For example: python benchmarks/load_test.py 50000 1,2,4 10
+"""
+import http.client
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from response_format import build_database
+
+CLIENTS = 16
+THREADS_PER_WORKER = 4
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(workdir, port, workers):
+    env = dict(os.environ,
+               EXPENSE_WORKERS=str(workers),
+               EXPENSE_THREADS=str(THREADS_PER_WORKER),
+               EXPENSE_BIND=f'127.0.0.1:{port}',
+               EXPENSE_ACCESS_LOG='')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(SERVER_DIR, 'gunicorn.conf.py'),
+         '--chdir', workdir, '--pythonpath', SERVER_DIR, 'wsgi:app'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/favicon.ico')
+            conn.getresponse().read()
+            conn.close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('gunicorn did not start')
+
+def drive(port, seconds):
+    latencies = []
+    lock = threading.Lock()
+    stop_at = time.time() + seconds
+
+    def client(index):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        n = 0
+        mine = []
+        while time.time() < stop_at:
+            n += 1
+            start = time.perf_counter()
+            conn.request('GET', f'/analytics?trend=weekly&client={index}&n={n}')
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                mine.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            latencies.extend(mine)
+
+    pool = [threading.Thread(target=client, args=(i,)) for i in range(CLIENTS)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    latencies.sort()
+    if not latencies:
+        return 0, 0, 0
+    return (len(latencies) / seconds,
+            latencies[len(latencies) // 2] * 1000,
+            latencies[int(len(latencies) * 0.95)] * 1000)
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    worker_counts = [int(n) for n in sys.argv[2].split(',')] if len(sys.argv) > 2 else [1, 2, 4]
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    workdir = tempfile.mkdtemp()
+    try:
+        # The app opens expense_tracker.db relative to its working directory
+        build_database(os.path.join(workdir, 'expense_tracker.db'), rows)
+        print(f'GET /analytics with {rows:,} rows, {CLIENTS} clients, '
+              f'{THREADS_PER_WORKER} threads per worker, {os.cpu_count()} CPU(s)')
+        if max(worker_counts) > (os.cpu_count() or 1):
+            print('Fewer CPUs than workers: the extra workers compete for the same cores, '
+                  'so these numbers say nothing about scaling')
+        print(f"{'workers':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for workers in worker_counts:
+            port = free_port()
+            process = start_server(workdir, port, workers)
+            try:
+                drive(port, 1)  # Warm up every worker
+                throughput, p50, p95 = drive(port, seconds)
+            finally:
+                process.terminate()
+                process.wait()
+            print(f'{workers:>8}{throughput:>10.1f}{p50:>10.1f}{p95:>10.1f}')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
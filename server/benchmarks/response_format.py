@@ -0,0 +1,75 @@
+"""
+Compare GET /expenses payload size and serialization time across response formats.
+
+Builds a throwaway database with N synthetic expenses (default 100,000) and
+requests the full list as row dicts and as columnar JSON, each with and
+without gzip. Run from the server directory:
+
+    python benchmarks/response_format.py [rows]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import database_service, category_service
+
+def build_database(path, rows):
+    database_service.DB_PATH = path
+    category_service.DB_PATH = path
+    database_service.init_db()
+    random.seed(42)
+    categories = ['food', 'groceries', 'travel', 'utilities', 'shopping', 'gifts']
+    cards = ['Chase Sapphire', 'Amex Gold', 'Discover It', 'Venture X']
+    with database_service.get_db_connection() as conn:
+        conn.executemany('''
+            INSERT INTO expenses (date, description, amount, category, need_category, card, who, notes, split_cost, outlier)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(
+            f'20{random.randint(20, 25)}-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}',
+            f'MERCHANT {random.randint(1, 2000)} STORE #{random.randint(100, 999)}',
+            round(random.uniform(1, 300), 2),
+            random.choice(categories),
+            random.choice(['Need', 'Luxury']),
+            random.choice(cards),
+            random.choice(['Ameya', 'Gautami']),
+            None,
+            random.random() < 0.1,
+            0
+        ) for _ in range(rows)])
+        conn.commit()
+
+def measure(client, query, gzip_enabled, repeat=3):
+    headers = {'Accept-Encoding': 'gzip'} if gzip_enabled else {'Accept-Encoding': 'identity'}
+    # Bypass the response caches so every request really serializes and compresses
+    from services import cache_service, response_service
+    best = None
+    for _ in range(repeat):
+        cache_service.clear_cache()
+        response_service.clear_compression_cache()
+        start = time.perf_counter()
+        response = client.get(query, headers=headers)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(response.get_data()), best
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    workdir = tempfile.mkdtemp()
+    build_database(os.path.join(workdir, 'bench.db'), rows)
+
+    import app as app_module
+    client = app_module.app.test_client()
+
+    print(f'GET /expenses with {rows:,} rows')
+    print(f"{'format':<12}{'encoding':<10}{'bytes':>14}{'seconds':>10}")
+    for label, query in (('rows', '/expenses'), ('columnar', '/expenses?format=columnar')):
+        for gzip_enabled in (False, True):
+            size, seconds = measure(client, query, gzip_enabled)
+            print(f"{label:<12}{'gzip' if gzip_enabled else 'identity':<10}{size:>14,}{seconds:>10.3f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+Measure user rule hit rate and categorization latency, exact rules only
+versus exact plus normalized rules.
+
+Replays an expense history in date order: the categories of the first 30%
+of expenses are learned as rules, and the rest are categorized against
+them. "exact" learns one exact rule per description, as editing an expense
+does; "patterns" also learns a normalized rule per description, so store
+numbers, dates and reference codes no longer defeat the rule. Uses a
+synthetic history of N expenses (default 50,000) or a copy of an existing
+database. Run from the server directory:
+
+    python benchmarks/rule_matching.py [rows | path/to/expense_tracker.db]
+"""
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import database_service, category_service, user_rules_service
+
+LEARNED_FRACTION = 0.3
+# Full categorizations timed per variant; rule misses run the embedding model
+GUESS_SAMPLE = 2000
+
+MERCHANTS = [
+    ('UBER *TRIP {code}', 'travel'),
+    ('UBER *EATS {code}', 'food'),
+    ('LYFT *RIDE {date} {code}', 'travel'),
+    ('AMZN Mktp US*{code}', 'shopping'),
+    ('STARBUCKS STORE #{store} SEATTLE WA', 'food'),
+    ('SHELL OIL {store} SAN JOSE CA', 'travel'),
+    ('TST* JOES PIZZA {date}', 'food'),
+    ('SAFEWAY #{store}', 'groceries'),
+    ('TRADER JOE S #{store}', 'groceries'),
+    ('CVS/PHARMACY #{store}', 'medicines'),
+    ('PG&E WEB ONLINE {date}', 'utilities'),
+    ('NETFLIX.COM {code}', 'entertainment'),
+    ('SQ *BLUE BOTTLE COFFEE {code}', 'food'),
+    ('TARGET T-{store}', 'shopping'),
+    ('DOORDASH*{code}', 'food'),
+]
+
+def synthetic_history(path, rows):
+    database_service.DB_PATH = path
+    category_service.DB_PATH = path
+    database_service.init_db()
+    random.seed(42)
+    alphabet = 'ABCDEFGHJKLMNPQRSTUVWXYZ23456789'
+    history = []
+    for _ in range(rows):
+        template, category = random.choice(MERCHANTS)
+        description = template.format(
+            code=''.join(random.choice(alphabet) for _ in range(4)),
+            store=random.randint(100, 9999),
+            date=f'{random.randint(1, 12):02d}/{random.randint(1, 28):02d}'
+        )
+        history.append((
+            f'20{random.randint(20, 25)}-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}',
+            description, round(random.uniform(1, 300), 2), category
+        ))
+    with database_service.get_db_connection() as conn:
+        conn.executemany('INSERT INTO expenses (date, description, amount, category) VALUES (?, ?, ?, ?)', history)
+        conn.commit()
+
+def copy_history(source, path):
+    shutil.copyfile(source, path)
+    database_service.DB_PATH = path
+    category_service.DB_PATH = path
+    database_service.init_db()
+
+def learn(conn, learned, with_patterns):
+    conn.execute('DELETE FROM user_overrides')
+    rules = {}
+    for description, category in learned:
+        rules[(user_rules_service.rule_key(description), 'exact')] = category
+        if with_patterns:
+            try:
+                rules[(user_rules_service.rule_key(description, 'normalized'), 'normalized')] = category
+            except ValueError:
+                pass  # Nothing but digits
+    conn.executemany(
+        'INSERT INTO user_overrides (description, category, match_type) VALUES (?, ?, ?)',
+        [(key, category, match_type) for (key, match_type), category in rules.items()]
+    )
+    conn.commit()
+    return len(rules)
+
+def exact_lookup(conn, description):
+    """The lookup guess_category made before pattern rules: one query per description."""
+    row = conn.execute('SELECT category FROM user_overrides WHERE description = ?',
+                       (description.strip().lower(),)).fetchone()
+    return row[0] if row else None
+
+def main():
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, 'bench.db')
+    source = sys.argv[1] if len(sys.argv) > 1 else '50000'
+    if source.isdigit():
+        synthetic_history(path, int(source))
+    else:
+        copy_history(source, path)
+
+    conn = sqlite3.connect(path)
+    history = conn.execute('''
+        SELECT description, category FROM expenses
+        WHERE trim(COALESCE(description, '')) != '' AND COALESCE(category, '') != ''
+        ORDER BY date_num, id
+    ''').fetchall()
+    split = int(len(history) * LEARNED_FRACTION)
+    learned, replay = history[:split], history[split:]
+    sample = random.Random(7).sample(replay, min(GUESS_SAMPLE, len(replay)))
+    print(f'{len(learned):,} expenses learned, {len(replay):,} categorized')
+    print(f"{'rules':<10}{'count':>8}{'hit rate':>10}{'correct':>9}{'lookup us':>11}{'guess ms':>10}")
+
+    for label, with_patterns in (('exact', False), ('patterns', True)):
+        count = learn(conn, learned, with_patterns)
+        if with_patterns:
+            user_rules_service.get_rule_matchers(conn)
+            lookup = lambda description: user_rules_service.match_user_rule(conn, description, 'category')
+        else:
+            lookup = lambda description: exact_lookup(conn, description)
+
+        hits = correct = 0
+        start = time.perf_counter()
+        for description, category in replay:
+            found = lookup(description)
+            if found:
+                hits += 1
+                correct += found == category
+        lookup_us = (time.perf_counter() - start) / len(replay) * 1e6
+
+        category_service.get_category_embeddings()
+        start = time.perf_counter()
+        for description, _ in sample:
+            category_service.guess_category(description)
+        guess_ms = (time.perf_counter() - start) / len(sample) * 1000
+
+        print(f'{label:<10}{count:>8,}{hits / len(replay):>10.1%}{correct / max(hits, 1):>9.1%}'
+              f'{lookup_us:>11.1f}{guess_ms:>10.2f}')
+    conn.close()
+
+if __name__ == '__main__':
+    main()
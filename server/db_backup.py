@@ -0,0 +1,72 @@
+"""
+Incremental encrypted backups of the expense database, used by db_manager.sh.
+
+    python db_backup.py backup   <backup dir> [--db expense_tracker.db] [--force] [--snapshot FILE]
+    python db_backup.py restore  <backup dir> [--db expense_tracker.db]
+    python db_backup.py status   <backup dir> [--db expense_tracker.db]
+    python db_backup.py snapshot <file>       [--db expense_tracker.db]
+
+The backup directory holds a base snapshot, the changesets written since and
+a copy of each archived year, each compressed and encrypted with
+EXPENSE_DB_PASSWORD (see
+services/backup_service.py). snapshot writes a consistent, integrity-checked
+copy of the database with the online backup API; backup --snapshot builds a
+new base from such a copy instead of taking another one. Exits with 3 when
+the backup has entries the database has not restored yet.
+"""
+import argparse
+import json
+import os
+import sys
+
+from services import backup_service, database_service
+
+def main():
+    parser = argparse.ArgumentParser(description='Incremental encrypted database backups')
+    parser.add_argument('command', choices=('backup', 'restore', 'status', 'snapshot'))
+    parser.add_argument('path', help='backup directory, or the snapshot file to write')
+    parser.add_argument('--db', default=database_service.DB_PATH)
+    parser.add_argument('--force', action='store_true', help='replace the backup with a new base')
+    parser.add_argument('--snapshot', help='snapshot to use if a new base is written')
+    args = parser.parse_args()
+    database_service.DB_PATH = args.db
+
+    try:
+        if args.command == 'restore':
+            result = backup_service.restore_backup(args.path, args.db)
+            print(f"Restored {result['entries']} backup entries ({result['rows_replayed']} changed rows replayed) "
+                  f"and {len(result['archives'])} archived year(s)")
+            database_service.init_db()
+            return 0
+
+        if not os.path.exists(args.db):
+            print(f'Database not found: {args.db}', file=sys.stderr)
+            return 1
+        if args.command == 'snapshot':
+            result = backup_service.create_snapshot(args.path)
+            print(f"Snapshot written: {result['path']} ({result['bytes']:,} bytes in {result['seconds']}s)")
+            return 0
+        database_service.init_db()
+        if args.command == 'status':
+            print(json.dumps(backup_service.get_backup_status(args.path), indent=2))
+            return 0
+
+        result = backup_service.write_backup(args.path, force=args.force, snapshot=args.snapshot)
+        if result is None:
+            print('No changes since the last backup')
+            return 0
+        for entry in filter(None, [result['entry']] + result['archives']):
+            name = f"entry {entry['number']}" if entry['kind'] != 'archive' else f"for {entry['year']}"
+            print(f"Wrote {entry['kind']} {name}: {entry['file']} "
+                  f"({entry['raw_bytes']:,} bytes, {entry['compressed_bytes']:,} after {entry['compression']}, "
+                  f"{entry['stored_bytes']:,} stored)")
+        return 0
+    except backup_service.BackupConflict as e:
+        print(str(e), file=sys.stderr)
+        return 3
+    except backup_service.BackupError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""
+Two-way row-level merge of the expense database with the other devices
+sharing a sync directory, used by db_manager.sh merge.
+
+    python db_sync.py run    <sync dir> [--db expense_tracker.db]
+    python db_sync.py status <sync dir> [--db expense_tracker.db]
+
+Each device writes numbered change bundles, encrypted with
+EXPENSE_DB_PASSWORD, to its own folder of the sync directory and merges the
+other devices' bundles field by field (see services/sync_service.py). Any
+directory works as the sync directory; db_manager.sh keeps it in the
+database repository.
+"""
+import argparse
+import json
+import os
+import sys
+
+from services import backup_service, database_service, sync_service
+
+def main():
+    parser = argparse.ArgumentParser(description='Row-level merge sync between devices')
+    parser.add_argument('command', choices=('run', 'status'))
+    parser.add_argument('sync_dir')
+    parser.add_argument('--db', default=database_service.DB_PATH)
+    args = parser.parse_args()
+    database_service.DB_PATH = args.db
+
+    if args.command == 'status':
+        if not os.path.exists(args.db):
+            print(f'Database not found: {args.db}', file=sys.stderr)
+            return 1
+        database_service.init_db()
+        print(json.dumps(sync_service.get_sync_status(args.sync_dir), indent=2))
+        return 0
+
+    # A new device may start from an empty database, receiving every row, or
+    # from a copy of another's, whose rows it adopts
+    database_service.init_db()
+
+    try:
+        result = sync_service.sync(args.sync_dir)
+    except backup_service.BackupError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    imported, exported = result['imported'], result['exported']
+    print(f"Device {result['device']}: {result['stamped']} local rows changed since the last sync")
+    print(f"Merged {imported['bundles']} bundles ({imported['rows']} rows: {imported['inserted']} inserted, "
+          f"{imported['updated']} updated, {imported['adopted']} matched to local rows, "
+          f"{imported['deleted']} deleted)")
+    if imported['archived']:
+        print(f"  Skipped {imported['archived']} changes to rows archived on this device")
+    for conflict in imported['conflicts']:
+        print(f"  Skipped {conflict['table']} row {conflict['gid']}: {conflict['error']}")
+    if exported:
+        print(f"Wrote {exported['file']}: {exported['rows']} rows, {exported['stored_bytes']:,} bytes")
+    else:
+        print('No local changes to send')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,35 @@
+"""
+Gunicorn settings for production serving: gunicorn -c gunicorn.conf.py wsgi:app
+
+Workers are forked from a master that has already imported wsgi.py, so the app
+and the embedding model are loaded once and shared copy-on-write. Each worker
+serves requests on a small thread pool.
+
+Graceful restart: `kill -HUP <master pid>` starts fresh workers and lets the old
+ones finish their in-flight requests within graceful_timeout. With preload_app
+the code itself is not reloaded on HUP; to deploy new code, send USR2 (starts a
+new master alongside the old one) and then QUIT to the old master.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('EXPENSE_BIND', '0.0.0.0:3001')
+workers = int(os.environ.get('EXPENSE_WORKERS', min(multiprocessing.cpu_count(), 4)))
+threads = int(os.environ.get('EXPENSE_THREADS', '4'))
+worker_class = 'gthread'
+preload_app = True
+
+# Uploads run PDF parsing and categorization inline, so allow slow requests
+timeout = int(os.environ.get('EXPENSE_TIMEOUT', '120'))
+graceful_timeout = int(os.environ.get('EXPENSE_GRACEFUL_TIMEOUT', '30'))
+keepalive = 5
+
+accesslog = os.environ.get('EXPENSE_ACCESS_LOG', '-') or None
+
+def post_fork(server, worker):
+    # One intra-op thread per worker keeps N workers from oversubscribing the CPUs
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(int(os.environ.get('EXPENSE_TORCH_THREADS', '1')))
@@ -0,0 +1,157 @@
+from datetime import date, timedelta
+from flask import jsonify
+from .database_service import get_db_connection
+from .expense_service import expense_filters
+from . import archive_service
+
+TREND_MODES = ('daily', 'weekly', 'monthly', 'yearly')
+DAY_NAMES = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat']
+
+# First word of the description, upper-cased, as the charts label merchants
+MERCHANT_SQL = (
+    "upper(substr(COALESCE(NULLIF(description, ''), 'Unknown'), 1, "
+    "instr(COALESCE(NULLIF(description, ''), 'Unknown') || ' ', ' ') - 1))"
+)
+
+def _dollars(cents):
+    return round((cents or 0) / 100, 2)
+
+def _to_date(date_num):
+    try:
+        return date(date_num // 10000, date_num // 100 % 100, date_num % 100)
+    except ValueError:
+        return None
+
+def _trend_key(day, mode):
+    """Trend bucket label: the day, the Sunday starting its week, the month or the year."""
+    if mode == 'daily':
+        return day.isoformat()
+    if mode == 'weekly':
+        return (day - timedelta(days=(day.weekday() + 1) % 7)).isoformat()
+    if mode == 'yearly':
+        return f'{day.year:04d}'
+    return f'{day.year:04d}-{day.month:02d}'
+
+def get_analytics(args):
+    """
+    Compute every dashboard aggregate for a date range and filters in one response.
+
+    Feeds the dashboard in charts.js (summary cards, trend, category,
+    need/luxury, spender, day-of-week and merchant charts), which sends the
+    table's current filters, and matches render.js's averages and spending
+    totals. The filtered rows are reduced by one SQL
+    GROUP BY and the charts are folded from those groups, so the browser
+    never has to download the rows themselves.
+    """
+    mode = args.get('trend', 'monthly')
+    if mode not in TREND_MODES:
+        return jsonify({'success': False, 'error': f'Invalid trend mode: {mode}'}), 400
+    try:
+        clauses, params, start_num, end_num = expense_filters(args)
+        merchant_limit = min(max(int(args.get('merchant_limit', 10)), 1), 100)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+
+    with get_db_connection() as conn:
+        source = archive_service.expenses_source(conn, start_num, end_num)
+        rows = f'(SELECT * FROM {source}{where})'
+
+        # One pass over the filtered rows; every chart is a fold over these groups
+        groups = conn.execute(f'''
+            SELECT date_num,
+                   lower(COALESCE(NULLIF(category, ''), 'unknown')),
+                   COALESCE(NULLIF(need_category, ''), 'Need'),
+                   who,
+                   COALESCE(split_cost, 0) != 0,
+                   SUM(amount_cents),
+                   COUNT(*)
+            FROM {rows}
+            GROUP BY 1, 2, 3, 4, 5
+        ''', params).fetchall()
+        merchants = conn.execute(f'''
+            SELECT {MERCHANT_SQL} AS merchant, SUM(amount_cents) FROM {rows}
+            GROUP BY merchant ORDER BY 2 DESC LIMIT ?
+        ''', params + [merchant_limit]).fetchall()
+        # Split costs are shared equally by everyone in the household, read
+        # from the same hot and archived rows as the totals but unfiltered
+        household = [row[0] for row in conn.execute(
+            f"SELECT DISTINCT who FROM {source} WHERE who IS NOT NULL AND who != '' ORDER BY who"
+        )]
+
+    total_cents = count = split_cents = 0
+    category_cents, need_cents, trend_cents = {}, {'Need': 0, 'Luxury': 0}, {}
+    person_cents = {person: 0 for person in household}
+    dow_cents = [0] * 7
+    days_seen = {}
+    for date_num, category, need, who, is_split, cents, n in groups:
+        cents = cents or 0
+        total_cents += cents
+        count += n
+        category_cents[category] = category_cents.get(category, 0) + cents
+        need_cents[need] = need_cents.get(need, 0) + cents
+        if is_split:
+            split_cents += cents
+        elif who:
+            person_cents[who] = person_cents.get(who, 0) + cents
+        if date_num is not None:
+            day = days_seen.get(date_num)
+            if day is None:
+                day = days_seen[date_num] = _to_date(date_num)
+            if day is not None:
+                key = _trend_key(day, mode)
+                trend_cents[key] = trend_cents.get(key, 0) + cents
+                dow_cents[(day.weekday() + 1) % 7] += cents
+
+    valid_days = [day for day in days_seen.values() if day is not None]
+    if valid_days:
+        first, last = min(valid_days), max(valid_days)
+        days = (last - first).days + 1
+        months = (last.year - first.year) * 12 + (last.month - first.month) + 1
+    else:
+        first = last = None
+        days = months = 1
+
+    category_totals = {key: _dollars(cents) for key, cents in sorted(category_cents.items())}
+    top_category = max(category_totals, key=category_totals.get) if category_totals else 'None'
+
+    share = split_cents / len(person_cents) if person_cents else 0
+    by_spender = {person: _dollars(cents + share) for person, cents in person_cents.items()}
+    trend_keys = sorted(trend_cents)
+
+    total = _dollars(total_cents)
+    return jsonify({
+        'success': True,
+        'range': {
+            'first_date': first.isoformat() if first else None,
+            'last_date': last.isoformat() if last else None,
+            'days': days,
+            'months': months
+        },
+        'summary': {
+            'total': total,
+            'transaction_count': count,
+            'avg_daily': round(total / days, 2) if count else 0,
+            'top_category': top_category,
+            'top_category_amount': category_totals.get(top_category, 0)
+        },
+        'averages': {
+            'per_day': round(total / days, 2),
+            'per_month': round(total / months, 2)
+        },
+        'spending_totals': {
+            'total': total,
+            'split_total': _dollars(split_cents),
+            'by_person': by_spender
+        },
+        'trend': {
+            'mode': mode,
+            'labels': trend_keys,
+            'values': [_dollars(trend_cents[key]) for key in trend_keys]
+        },
+        'by_category': category_totals,
+        'need_luxury': {key: _dollars(cents) for key, cents in need_cents.items()},
+        'by_spender': by_spender,
+        'day_of_week': {name: _dollars(cents) for name, cents in zip(DAY_NAMES, dow_cents)},
+        'top_merchants': [{'merchant': key, 'total': _dollars(cents)} for key, cents in merchants]
+    })
@@ -0,0 +1,266 @@
+import os
+import re
+import sqlite3
+from contextlib import closing
+from datetime import date
+from flask import jsonify
+from . import database_service
+from .database_service import get_db_connection
+
+# Number of calendar years (including the current one) kept in the hot expenses table
+HOT_YEARS = int(os.environ.get('EXPENSE_HOT_YEARS', '2'))
+
+_ARCHIVE_FILE_RE = re.compile(r'^expenses_(\d{4})\.db$')
+# SQLite attaches at most 10 databases to a connection by default
+MAX_ATTACHED = 10
+
+def get_archive_dir(db_path=None):
+    """Archive databases live in an 'archives' folder next to the main database (DB_PATH by default)."""
+    return os.path.join(os.path.dirname(db_path or database_service.DB_PATH) or '.', 'archives')
+
+def archive_path(year, archive_dir=None):
+    return os.path.join(archive_dir or get_archive_dir(), f'expenses_{int(year)}.db')
+
+def list_archived_years(archive_dir=None):
+    """Return the sorted list of years that have an archive database on disk."""
+    archive_dir = archive_dir or get_archive_dir()
+    if not os.path.isdir(archive_dir):
+        return []
+    years = []
+    for name in os.listdir(archive_dir):
+        match = _ARCHIVE_FILE_RE.match(name)
+        if match:
+            years.append(int(match.group(1)))
+    return sorted(years)
+
+def years_for_range(start_num=None, end_num=None):
+    """Archived years overlapping an inclusive YYYYMMDD range (None means open-ended)."""
+    return [
+        year for year in list_archived_years()
+        if (start_num is None or year >= start_num // 10000)
+        and (end_num is None or year <= end_num // 10000)
+    ]
+
+def _expense_columns(conn, schema='main'):
+    return [row[1] for row in conn.execute(f'PRAGMA {schema}.table_info(expenses)')]
+
+def _attach(conn, year, create=False):
+    """Attach the archive for a year as schema arch_<year> and bring its table up to date."""
+    schema = f'arch_{int(year)}'
+    path = archive_path(year)
+    if not create and not os.path.exists(path):
+        return None
+    os.makedirs(get_archive_dir(), exist_ok=True)
+    conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+
+    main_info = list(conn.execute('PRAGMA main.table_info(expenses)'))
+    archived = set(_expense_columns(conn, schema))
+    if not archived:
+        column_defs = ', '.join(
+            f'{name} {ctype} PRIMARY KEY' if pk else f'{name} {ctype}'
+            for _, name, ctype, _, _, pk in main_info
+        )
+        conn.execute(f'CREATE TABLE {schema}.expenses ({column_defs})')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {schema}.idx_expenses_date_num ON expenses(date_num, amount_cents)')
+    else:
+        # Columns added to the hot table after this archive was written
+        for _, name, ctype, _, _, _ in main_info:
+            if name not in archived:
+                conn.execute(f'ALTER TABLE {schema}.expenses ADD COLUMN {name} {ctype}')
+    return schema
+
+def attach_archives(conn, years):
+    """Attach the given archive years to an open connection, returning their schema names."""
+    schemas = []
+    for year in years:
+        schema = _attach(conn, year)
+        if schema:
+            schemas.append(schema)
+    return schemas
+
+def each_archive(conn, years):
+    """Attach the given archive years one at a time, yielding (year, schema) and detaching after each."""
+    for year in years:
+        schema = _attach(conn, year)
+        if schema:
+            try:
+                yield year, schema
+            finally:
+                conn.execute(f'DETACH DATABASE {schema}')
+
+def _free_attach_slots(conn):
+    """Detach the archives an earlier expenses_source left attached; returns the free attach slots."""
+    attached = [row[1] for row in conn.execute('PRAGMA database_list') if row[1] not in ('main', 'temp')]
+    for schema in [schema for schema in attached if schema.startswith('arch_')]:
+        conn.execute(f'DETACH DATABASE {schema}')
+        attached.remove(schema)
+    return MAX_ATTACHED - len(attached)
+
+def _fold_archives(conn, years, batch):
+    """
+    Copy the expenses of several archive years into the temp table
+    archived_expenses, attaching them batch at a time; returns the table.
+    The commits between batches only ever hold these temp inserts, as
+    expenses_source refuses a connection with a transaction open.
+    """
+    conn.execute('DROP TABLE IF EXISTS temp.archived_expenses')
+    conn.execute('CREATE TEMP TABLE archived_expenses AS SELECT * FROM main.expenses WHERE 0')
+    columns = ', '.join(_expense_columns(conn))
+    for start in range(0, len(years), batch):
+        schemas = attach_archives(conn, years[start:start + batch])
+        for schema in schemas:
+            conn.execute(f'INSERT INTO temp.archived_expenses ({columns}) SELECT {columns} FROM {schema}.expenses')
+        # ATTACH and DETACH are not allowed inside a transaction
+        conn.commit()
+        for schema in schemas:
+            conn.execute(f'DETACH DATABASE {schema}')
+    return 'temp.archived_expenses'
+
+def expenses_source(conn, start_num=None, end_num=None):
+    """
+    Return a FROM-clause source covering expenses in the requested range.
+
+    When the range lies entirely in the hot window this is just the expenses
+    table; otherwise the needed archives are attached to conn and UNION ALL'd
+    in with an identical column list. Years beyond what can be attached at
+    once (the oldest ones) are first copied into a temp table.
+
+    Attaching is not allowed inside a transaction, so conn must not have
+    one open; archives attached by an earlier call on it are detached.
+    """
+    years = years_for_range(start_num, end_num)
+    if not years:
+        return 'expenses'
+    if conn.in_transaction:
+        raise sqlite3.OperationalError('Archives cannot be attached while a transaction is open')
+    tables = []
+    slots = _free_attach_slots(conn)
+    if slots < 1:
+        raise sqlite3.OperationalError(f'No attach slot left for archives ({MAX_ATTACHED} databases attached)')
+    if len(years) > slots:
+        tables.append(_fold_archives(conn, years[:len(years) - slots + 1], slots))
+        years = years[len(years) - slots + 1:]
+    tables.extend(f'{schema}.expenses' for schema in attach_archives(conn, years))
+    if not tables:
+        return 'expenses'
+    columns = ', '.join(_expense_columns(conn))
+    selects = [f'SELECT {columns} FROM main.expenses']
+    selects.extend(f'SELECT {columns} FROM {table}' for table in tables)
+    return f"({' UNION ALL '.join(selects)})"
+
+def archived_year_of(expense_id):
+    """The archived year holding an expense id, or None if no archive has it."""
+    for year in list_archived_years():
+        try:
+            with closing(sqlite3.connect(archive_path(year))) as conn:
+                if conn.execute('SELECT 1 FROM expenses WHERE id = ?', (expense_id,)).fetchone():
+                    return year
+        except sqlite3.OperationalError:
+            continue  # Archive without an expenses table yet
+    return None
+
+def archive_old_years(hot_years=None):
+    """Move every complete year older than the hot window into its own archive database."""
+    hot_years = HOT_YEARS if hot_years is None else int(hot_years)
+    if hot_years < 1:
+        return jsonify({'success': False, 'error': 'hot_years must be at least 1'}), 400
+    cutoff_year = date.today().year - hot_years + 1
+
+    archived = []
+    with get_db_connection() as conn:
+        years = [row[0] for row in conn.execute('''
+            SELECT DISTINCT date_num / 10000 FROM expenses
+            WHERE date_num IS NOT NULL AND date_num < ?
+            ORDER BY 1
+        ''', (cutoff_year * 10000,))]
+
+        for year in years:
+            schema = _attach(conn, year, create=True)
+            columns = ', '.join(_expense_columns(conn))
+            bounds = (year * 10000, year * 10000 + 9999)
+            cur = conn.execute(f'''
+                INSERT OR REPLACE INTO {schema}.expenses ({columns})
+                SELECT {columns} FROM main.expenses WHERE date_num BETWEEN ? AND ?
+            ''', bounds)
+            moved = cur.rowcount
+            database_service.set_archive_move(conn, True)
+            conn.execute('DELETE FROM main.expenses WHERE date_num BETWEEN ? AND ?', bounds)
+            database_service.set_archive_move(conn, False)
+            # Copy and delete commit together, so a row is never in both or neither
+            conn.commit()
+            conn.execute(f'VACUUM {schema}')
+            conn.execute(f'DETACH DATABASE {schema}')
+            archived.append({'year': year, 'count': moved})
+
+        if archived:
+            conn.execute('VACUUM')
+
+    return jsonify({
+        'success': True,
+        'hot_from_year': cutoff_year,
+        'archived': archived
+    })
+
+def restore_year(year):
+    """Move an archived year back into the hot expenses table so it can be edited again."""
+    if not os.path.exists(archive_path(year)):
+        return jsonify({'success': False, 'error': f'No archive for {year}'}), 404
+    with get_db_connection() as conn:
+        schema = _attach(conn, year)
+        columns = ', '.join(_expense_columns(conn))
+        database_service.set_archive_move(conn, True)
+        cur = conn.execute(f'''
+            INSERT OR REPLACE INTO main.expenses ({columns})
+            SELECT {columns} FROM {schema}.expenses
+        ''')
+        restored = cur.rowcount
+        database_service.set_archive_move(conn, False)
+        conn.commit()
+        conn.execute(f'DETACH DATABASE {schema}')
+    os.remove(archive_path(year))
+    return jsonify({'success': True, 'year': int(year), 'count': restored})
+
+def get_archive_summary():
+    """List archived years with their row counts and totals."""
+    years = list_archived_years()
+    summary = []
+    with get_db_connection() as conn:
+        for year, schema in each_archive(conn, years):
+            count, total_cents = conn.execute(
+                f'SELECT COUNT(*), COALESCE(SUM(amount_cents), 0) FROM {schema}.expenses'
+            ).fetchone()
+            summary.append({
+                'year': year,
+                'count': count,
+                'total': total_cents / 100,
+                'size_bytes': os.path.getsize(archive_path(year))
+            })
+    return jsonify({'success': True, 'hot_years': HOT_YEARS, 'archives': summary})
+
+def delete_from_archives(where, params=()):
+    """
+    Apply a DELETE with the given WHERE clause to every archive database.
+    The deleted ids are logged and the expenses version bumped in the main
+    database, as a delete there would, so ETags and delta syncs see them.
+    """
+    deleted = []
+    for year in list_archived_years():
+        try:
+            with closing(sqlite3.connect(archive_path(year))) as conn:
+                ids = [row[0] for row in conn.execute(f'SELECT id FROM expenses WHERE {where}', params)]
+                conn.execute(f'DELETE FROM expenses WHERE {where}', params)
+                conn.commit()
+            deleted.extend(ids)
+        except sqlite3.OperationalError:
+            continue  # Archive without an expenses table yet
+    if deleted:
+        with get_db_connection() as conn:
+            conn.executemany("INSERT INTO expense_changes (expense_id, op) VALUES (?, 'delete')",
+                             [(expense_id,) for expense_id in deleted])
+            conn.execute("UPDATE data_versions SET version = version + 1 WHERE table_name = 'expenses'")
+            conn.commit()
+    return len(deleted)
+
+def remove_all_archives():
+    for year in list_archived_years():
+        os.remove(archive_path(year))
@@ -0,0 +1,231 @@
+import fcntl
+import json
+import os
+import subprocess
+import threading
+import time
+from datetime import datetime
+from flask import jsonify
+from . import backup_service
+
+# Stages of a backup-and-push run, in order. fetch brings the database
+# repository up to date before anything is written into it.
+STAGES = ('fetch', 'snapshot', 'compress', 'encrypt', 'commit', 'push')
+DB_REPO_DIR = '.db_repo'
+INCREMENTAL_DIR = 'incremental'
+LEGACY_ENCRYPTED_FILE = 'expense_tracker_encrypted.db'
+LOCAL_BACKUPS_KEPT = 7
+GIT_TIMEOUT = int(os.environ.get('EXPENSE_BACKUP_GIT_TIMEOUT', '600'))
+# Progress is written to the status file at most this often
+STATUS_INTERVAL = 0.25
+
+def _backup_dir(root):
+    return os.path.join(root, 'db_backups')
+
+def _lock_path(root):
+    return os.path.join(_backup_dir(root), 'backup_job.lock')
+
+def _status_path(root):
+    return os.path.join(_backup_dir(root), 'backup_job.json')
+
+def _try_lock(root):
+    """Open and lock the job lock file; returns the file, or None if a job holds it."""
+    os.makedirs(_backup_dir(root), exist_ok=True)
+    lock = open(_lock_path(root), 'a')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        return None
+    return lock
+
+def _read_status(root):
+    try:
+        with open(_status_path(root), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _git(repo, *args):
+    result = subprocess.run(
+        ['git', *args], cwd=repo, capture_output=True, text=True, timeout=GIT_TIMEOUT,
+        env=dict(os.environ, LC_ALL='C', LANG='C')
+    )
+    if result.returncode != 0:
+        raise backup_service.BackupError(f"git {args[0]} failed: {(result.stderr or result.stdout).strip()}")
+    return result
+
+def _prune_local_backups(backup_dir):
+    """Keep the LOCAL_BACKUPS_KEPT newest snapshots, as db_manager.sh does."""
+    snapshots = sorted(
+        (os.path.join(backup_dir, name) for name in os.listdir(backup_dir)
+         if name.startswith('expense_tracker_backup_') and name.endswith('.db')),
+        key=os.path.getmtime, reverse=True
+    )
+    for path in snapshots[LOCAL_BACKUPS_KEPT:]:
+        os.remove(path)
+
+class _BackupJob:
+    """One backup-and-push run, recording its progress in the status file."""
+
+    def __init__(self, root, force):
+        self.root = root
+        self.force = force
+        self.repo = os.path.join(root, DB_REPO_DIR)
+        self.status = {
+            'state': 'running',
+            'stage': None,
+            'force': force,
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'finished_at': None,
+            'pid': os.getpid(),
+            'stages': {name: {'state': 'pending', 'done': 0, 'total': 0, 'seconds': None} for name in STAGES},
+            'result': None,
+            'error': None,
+        }
+        self._stage_start = None
+        self._written = 0
+
+    def save(self, throttle=False):
+        now = time.monotonic()
+        if throttle and now - self._written < STATUS_INTERVAL:
+            return
+        self._written = now
+        path = _status_path(self.root)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.status, f)
+        os.replace(tmp, path)
+
+    def _finish_stage(self, state='done'):
+        name = self.status['stage']
+        if name and self.status['stages'][name]['state'] == 'running':
+            stage = self.status['stages'][name]
+            stage['state'] = state
+            stage['seconds'] = round(time.perf_counter() - self._stage_start, 3)
+            if state == 'done' and stage['total']:
+                stage['done'] = stage['total']
+
+    def enter(self, name):
+        if self.status['stage'] == name:
+            return
+        self._finish_stage()
+        self.status['stage'] = name
+        self.status['stages'][name]['state'] = 'running'
+        self._stage_start = time.perf_counter()
+        self.save()
+
+    def skip(self, name):
+        self.status['stages'][name]['state'] = 'skipped'
+
+    def progress(self, name, done, total):
+        self.enter(name)
+        self.status['stages'][name].update(done=done, total=total)
+        self.save(throttle=True)
+
+    def run(self):
+        backup_dir = _backup_dir(self.root)
+
+        self.enter('fetch')
+        if os.path.isdir(self.repo):
+            _git(self.repo, 'fetch', 'origin')
+            _git(self.repo, 'reset', '--hard', 'origin/main')
+        else:
+            _git(self.root, 'clone', os.environ['EXPENSE_DB_REPO'], DB_REPO_DIR)
+
+        self.enter('snapshot')
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        snapshot = backup_service.create_snapshot(
+            os.path.join(backup_dir, f'expense_tracker_backup_{timestamp}.db'),
+            progress=lambda remaining, total: self.progress('snapshot', total - remaining, total)
+        )
+        _prune_local_backups(backup_dir)
+
+        # Collecting the changes is counted as part of compressing them
+        self.enter('compress')
+        written = backup_service.write_backup(
+            os.path.join(self.repo, INCREMENTAL_DIR), force=self.force,
+            snapshot=snapshot['path'], progress=self.progress
+        )
+        if written is None:
+            self._finish_stage()
+            self.skip('encrypt')
+
+        self.enter('commit')
+        _git(self.repo, 'add', '-A', INCREMENTAL_DIR)
+        # The whole-file copy is superseded by the incremental chain
+        if os.path.exists(os.path.join(self.repo, LEGACY_ENCRYPTED_FILE)):
+            _git(self.repo, 'rm', '-q', LEGACY_ENCRYPTED_FILE)
+        staged = subprocess.run(['git', 'diff', '--cached', '--quiet'], cwd=self.repo).returncode != 0
+        if staged:
+            _git(self.repo, 'commit', '-m', f"Update expenses {datetime.now().strftime('%Y-%m-%d')}")
+            self.enter('push')
+            _git(self.repo, 'push', 'origin', 'main')
+            # Only now is the new entry safe to count as backed up; a failed
+            # push leaves its rows in the log for the next run to write again
+            backup_service.confirm_backup(os.path.join(self.repo, INCREMENTAL_DIR))
+        else:
+            self._finish_stage()
+            self.skip('push')
+        self._finish_stage()
+
+        result = {'snapshot': snapshot, 'entry': None, 'archives': [], 'pushed': staged}
+        if written:
+            result.update(written, bytes_saved=written['raw_bytes'] - written['stored_bytes'])
+        return result
+
+    def __call__(self, lock):
+        start = time.perf_counter()
+        try:
+            self.status['result'] = self.run()
+            self.status['state'] = 'succeeded'
+        except backup_service.BackupConflict as e:
+            self._finish_stage('failed')
+            self.status.update(state='conflict', error=str(e))
+        except Exception as e:
+            print(f"Error in backup job: {e}")
+            self._finish_stage('failed')
+            self.status.update(state='failed', error=str(e))
+        finally:
+            self.status['seconds'] = round(time.perf_counter() - start, 3)
+            self.status['finished_at'] = datetime.now().isoformat(timespec='seconds')
+            try:
+                self.save()
+            finally:
+                lock.close()
+
+def start_backup_job(root, force=False):
+    """
+    Start backing up the database and pushing it to the database repository
+    in a background thread. Only one job runs at a time, across server
+    worker processes too; starting another while it runs gives 409. With
+    force, a backup holding entries this database has not restored is
+    replaced by a new base instead of reporting a conflict.
+    """
+    lock = _try_lock(root)
+    if lock is None:
+        return jsonify({'success': False, 'error': 'A backup is already running', 'job': _read_status(root)}), 409
+    try:
+        job = _BackupJob(root, force)
+        job.save()
+        threading.Thread(target=job, args=(lock,), name='backup-job', daemon=True).start()
+    except Exception as e:
+        lock.close()
+        print(f"Error starting backup job: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+    return jsonify({'success': True, 'job': job.status}), 202
+
+def get_backup_job_status(root):
+    """The latest backup job's status; a running job whose process died reads as interrupted."""
+    status = _read_status(root)
+    if status is None:
+        return jsonify({'success': True, 'job': None})
+    if status['state'] == 'running':
+        lock = _try_lock(root)
+        if lock is not None:
+            lock.close()
+            # The job may have finished between the two reads
+            status = _read_status(root)
+            if status['state'] == 'running':
+                status.update(state='interrupted', error='The backup stopped before finishing')
+    return jsonify({'success': True, 'job': status})
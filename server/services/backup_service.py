@@ -0,0 +1,615 @@
+import base64
+import hashlib
+import json
+import lzma
+import os
+import shutil
+import sqlite3
+import subprocess
+import time
+import zlib
+from contextlib import closing
+from datetime import datetime
+from . import archive_service, database_service
+from .database_service import BACKUP_TABLES, get_db_connection
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_FORMAT = 1
+# A new base is written once the chain has this many changesets, or once they
+# add up to this fraction of the base's size
+REBASE_CHANGESETS = int(os.environ.get('EXPENSE_BACKUP_REBASE_CHANGESETS', '30'))
+REBASE_RATIO = float(os.environ.get('EXPENSE_BACKUP_REBASE_RATIO', '0.5'))
+PASSWORD_ENV = 'EXPENSE_DB_PASSWORD'
+# Compression applied to backup entries before encryption: 'zlib' or 'lzma'
+# (smaller, slower). Files are recognized by their header when read back.
+COMPRESSION = os.environ.get('EXPENSE_BACKUP_COMPRESSION', 'zlib')
+COMPRESSION_SUFFIXES = {'zlib': 'z', 'lzma': 'xz'}
+_XZ_MAGIC = b'\xfd7zXZ\x00'
+# Online snapshots copy this many pages per step and pause between steps so
+# requests can keep writing. A write from another connection restarts the
+# copy; after this many restarts the rest is copied in one step.
+SNAPSHOT_STEP_PAGES = int(os.environ.get('EXPENSE_SNAPSHOT_STEP_PAGES', '256'))
+SNAPSHOT_STEP_PAUSE = float(os.environ.get('EXPENSE_SNAPSHOT_STEP_PAUSE', '0.005'))
+SNAPSHOT_MAX_RESTARTS = int(os.environ.get('EXPENSE_SNAPSHOT_MAX_RESTARTS', '3'))
+_CHUNK_SIZE = 1024 * 1024
+
+class BackupError(Exception):
+    pass
+
+class BackupConflict(BackupError):
+    """The backup holds entries written from another copy of the database."""
+
+class _SnapshotRestarted(Exception):
+    pass
+
+# ---- compression and encryption -------------------------------------------
+
+def _openssl(args, data=None):
+    """Run openssl enc with the same cipher settings db_manager.sh has always used."""
+    if not os.environ.get(PASSWORD_ENV):
+        raise BackupError(f'{PASSWORD_ENV} environment variable not set')
+    result = subprocess.run(
+        ['openssl', 'enc', '-aes-256-cbc', '-pbkdf2', '-pass', f'env:{PASSWORD_ENV}', *args],
+        input=data, capture_output=True
+    )
+    if result.returncode != 0:
+        raise BackupError(f"openssl failed: {result.stderr.decode('utf-8', 'replace').strip()}")
+    return result.stdout
+
+def _compressor(method):
+    if method == 'zlib':
+        return zlib.compressobj(6)
+    if method == 'lzma':
+        return lzma.LZMACompressor(preset=6)
+    raise BackupError(f'Unknown compression: {method}')
+
+def compress_file(src, dest, method=None, progress=None):
+    """
+    Compress a file into dest a chunk at a time; returns the compressed size.
+    progress(done, total) is called with the input bytes read so far.
+    """
+    compressor = _compressor(method or COMPRESSION)
+    total, done = os.path.getsize(src), 0
+    with open(src, 'rb') as infile, open(dest, 'wb') as outfile:
+        for chunk in iter(lambda: infile.read(_CHUNK_SIZE), b''):
+            outfile.write(compressor.compress(chunk))
+            done += len(chunk)
+            if progress:
+                progress(done, total)
+        outfile.write(compressor.flush())
+    return os.path.getsize(dest)
+
+def encrypt_file(src, dest):
+    """Encrypt a file into dest; returns the encrypted size."""
+    _openssl(['-salt', '-in', src, '-out', dest])
+    return os.path.getsize(dest)
+
+def seal_bytes(data, dest, method='zlib'):
+    """Compress and encrypt bytes into dest; returns the stored size."""
+    compressor = _compressor(method)
+    _openssl(['-salt', '-out', dest], compressor.compress(data) + compressor.flush())
+    return os.path.getsize(dest)
+
+def _decompress(data):
+    return lzma.decompress(data) if data.startswith(_XZ_MAGIC) else zlib.decompress(data)
+
+def open_sealed(path):
+    """Decrypt and decompress an entry file into bytes."""
+    return _decompress(_openssl(['-d', '-in', path]))
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# ---- snapshots --------------------------------------------------------------
+
+def create_snapshot(dest, step_pages=None, pause=None, progress=None):
+    """
+    Copy the live database to dest with SQLite's online backup API.
+
+    Pages are copied step_pages at a time with a short pause between steps,
+    so the server keeps serving while the copy runs, and the result is a
+    consistent image of the database at one instant (unlike copying the file
+    while it is being written). Writes keep restarting a stepped copy, so
+    once it has restarted SNAPSHOT_MAX_RESTARTS times the copy is redone in
+    a single step, holding a read lock for just that long. The copy must
+    pass PRAGMA integrity_check before it is moved into place.
+    progress(remaining, total) is called after each step. Returns the
+    snapshot's size, page count, steps, restarts and timing.
+    """
+    step_pages = step_pages or SNAPSHOT_STEP_PAGES
+    pause = SNAPSHOT_STEP_PAUSE if pause is None else pause
+    tmp = dest + '.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    steps = restarts = 0
+    last_remaining = None
+
+    def on_step(status, remaining, total):
+        nonlocal steps, restarts, last_remaining
+        steps += 1
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > SNAPSHOT_MAX_RESTARTS:
+                raise _SnapshotRestarted()
+        last_remaining = remaining
+        if progress:
+            progress(remaining, total)
+
+    start = time.perf_counter()
+    try:
+        target = sqlite3.connect(tmp)
+        try:
+            with get_db_connection() as conn:
+                try:
+                    conn.backup(target, pages=step_pages, progress=on_step, sleep=pause)
+                except _SnapshotRestarted:
+                    conn.backup(target)
+                    if progress:
+                        progress(0, target.execute('PRAGMA page_count').fetchone()[0])
+            check = target.execute('PRAGMA integrity_check').fetchone()[0]
+            pages = target.execute('PRAGMA page_count').fetchone()[0]
+        finally:
+            target.close()
+        if check != 'ok':
+            raise BackupError(f'Snapshot failed the integrity check: {check}')
+        os.replace(tmp, dest)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return {
+        'path': dest,
+        'bytes': os.path.getsize(dest),
+        'pages': pages,
+        'steps': steps,
+        'restarts': restarts,
+        'seconds': round(time.perf_counter() - start, 3)
+    }
+
+# ---- manifest ---------------------------------------------------------------
+
+def load_manifest(backup_dir):
+    """
+    The manifest lists the current chain: one base snapshot followed by the
+    changesets written since, each with its sequence number, size and hash,
+    and under 'archives' one entry per archived year. It names files and
+    sizes only, so it is stored unencrypted.
+    """
+    path = os.path.join(backup_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {'format': MANIFEST_FORMAT, 'entries': []}
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get('format') != MANIFEST_FORMAT:
+        raise BackupError(f"Unsupported backup manifest format: {manifest.get('format')}")
+    return manifest
+
+def _save_manifest(backup_dir, manifest):
+    path = os.path.join(backup_dir, MANIFEST_NAME)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+def _schema_fingerprint(conn):
+    """Hash of the backed-up tables' definitions; changesets only replay onto the schema they were read from."""
+    rows = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'table' AND name IN (SELECT value FROM json_each(?)) ORDER BY name",
+        (json.dumps(list(BACKUP_TABLES)),)
+    ).fetchall()
+    return hashlib.sha256(json.dumps(rows).encode('utf-8')).hexdigest()[:16]
+
+def _backup_state(conn):
+    return dict(conn.execute(
+        "SELECT key, value FROM change_log_state WHERE key IN "
+        "('backup_seq', 'backup_number', 'backup_pending_seq', 'backup_pending_number')"
+    ).fetchall())
+
+def _set_pending(conn, seq, number):
+    conn.execute("UPDATE change_log_state SET value = ? WHERE key = 'backup_pending_seq'", (seq,))
+    conn.execute("UPDATE change_log_state SET value = ? WHERE key = 'backup_pending_number'", (number,))
+
+def _mark_backed_up(conn, seq, number):
+    """Record that the log up to seq is in backup entry `number` and drop those log entries."""
+    conn.execute("UPDATE change_log_state SET value = ? WHERE key = 'backup_seq'", (seq,))
+    conn.execute("UPDATE change_log_state SET value = ? WHERE key = 'backup_number'", (number,))
+    _set_pending(conn, 0, 0)
+    # Entries the sync has not looked at yet are kept for it
+    conn.execute('''
+        DELETE FROM backup_changes
+        WHERE seq <= ? AND seq <= COALESCE((SELECT value FROM change_log_state WHERE key = 'sync_seq'), ?)
+    ''', (seq, seq))
+
+# ---- writing ----------------------------------------------------------------
+
+def encode_value(value):
+    """JSON-safe form of a column value: blobs become {'$base64': ...}."""
+    if isinstance(value, bytes):
+        return {'$base64': base64.b64encode(value).decode('ascii')}
+    return value
+
+def decode_value(value):
+    if isinstance(value, dict):
+        return base64.b64decode(value['$base64'])
+    return value
+
+def _settle_pending(conn, chain):
+    """
+    Resolve the entry last written here, which is not counted as backed up
+    until it is known to be in the chain. If the chain has it (it was
+    pushed) the database is marked backed up to it; if not (the push failed
+    and the repository was reset) it is forgotten, and as its rows are
+    still in the log the next backup writes them again. Returns the state.
+    """
+    state = _backup_state(conn)
+    number, seq = state.get('backup_pending_number'), state.get('backup_pending_seq')
+    if number:
+        if any(entry['number'] == number and entry['seq'] == seq for entry in chain):
+            _mark_backed_up(conn, seq, number)
+        else:
+            _set_pending(conn, 0, 0)
+        conn.commit()
+        state = _backup_state(conn)
+    return state
+
+def confirm_backup(backup_dir):
+    """Mark the database backed up to the entry it last wrote, once backup_dir has been pushed."""
+    with get_db_connection() as conn:
+        state = _settle_pending(conn, load_manifest(backup_dir)['entries'])
+    return state.get('backup_number', 0)
+
+def _collect_changes(conn, since):
+    """
+    Read every row logged after `since` in one read transaction.
+
+    Returns (head seq, changeset, rows). A logged key whose row still exists
+    is stored as its current row image; one whose row is gone as a delete.
+    """
+    conn.execute('BEGIN')
+    try:
+        head = conn.execute('SELECT COALESCE(MAX(seq), ?) FROM backup_changes', (since,)).fetchone()[0]
+        tables, count = {}, 0
+        for table, key in BACKUP_TABLES.items():
+            keys = [row[0] for row in conn.execute(
+                'SELECT DISTINCT row_key FROM backup_changes WHERE table_name = ? AND seq > ? AND seq <= ?',
+                (table, since, head)
+            )]
+            if not keys:
+                continue
+            cur = conn.execute(
+                f'SELECT * FROM {table} WHERE {key} IN (SELECT value FROM json_each(?))', (json.dumps(keys),)
+            )
+            columns = [column[0] for column in cur.description]
+            rows = [[encode_value(value) for value in row] for row in cur.fetchall()]
+            found = {row[columns.index(key)] for row in rows}
+            tables[table] = {
+                'columns': columns,
+                'rows': rows,
+                'deleted': [k for k in keys if k not in found]
+            }
+            count += len(keys)
+    finally:
+        conn.rollback()
+    return head, {'seq': head, 'tables': tables}, count
+
+def _store_entry(raw, backup_dir, stem, progress=None):
+    """
+    Compress then encrypt a raw entry file into backup_dir as
+    <stem>.<compression>.enc. progress(stage, done, total) reports the
+    'compress' and 'encrypt' stages. Returns the entry's file and sizes.
+    """
+    name = f'{stem}.{COMPRESSION_SUFFIXES.get(COMPRESSION, COMPRESSION)}.enc'
+    compressed = os.path.join(backup_dir, f'.{name}.tmp')
+    try:
+        compressed_bytes = compress_file(
+            raw, compressed, progress=progress and (lambda done, total: progress('compress', done, total))
+        )
+        if progress:
+            progress('encrypt', 0, compressed_bytes)
+        stored = encrypt_file(compressed, os.path.join(backup_dir, name))
+        if progress:
+            progress('encrypt', compressed_bytes, compressed_bytes)
+    finally:
+        if os.path.exists(compressed):
+            os.remove(compressed)
+    return {'file': name, 'compression': COMPRESSION, 'raw_bytes': os.path.getsize(raw),
+            'compressed_bytes': compressed_bytes, 'stored_bytes': stored}
+
+def _write_base(backup_dir, number, snapshot=None, progress=None):
+    """
+    Turn a snapshot of the database into a new base entry, taking one if
+    none is given. The log position the base covers is read from the
+    snapshot itself, so no write can slip between.
+    """
+    raw = os.path.join(backup_dir, f'.base-{number:06d}.db')
+    if os.path.exists(raw):
+        os.remove(raw)
+    try:
+        if snapshot:
+            # Work on a copy; the caller's snapshot is left as it was
+            shutil.copyfile(snapshot, raw)
+        else:
+            create_snapshot(raw)
+        base = sqlite3.connect(raw)
+        try:
+            seq = base.execute('SELECT COALESCE(MAX(seq), 0) FROM backup_changes').fetchone()[0]
+            seq = max(seq, _backup_state(base).get('backup_seq', 0))
+            _mark_backed_up(base, seq, number)
+            schema = _schema_fingerprint(base)
+            base.commit()
+        finally:
+            base.close()
+        stored = _store_entry(raw, backup_dir, f'base-{number:06d}.db', progress)
+    finally:
+        if os.path.exists(raw):
+            os.remove(raw)
+    return {'number': number, 'kind': 'base', 'seq': seq, 'schema': schema, **stored}
+
+def _needs_rebase(chain, schema):
+    base, changesets = chain[0], chain[1:]
+    return (
+        base['schema'] != schema
+        or len(changesets) >= REBASE_CHANGESETS
+        or sum(entry['stored_bytes'] for entry in changesets) >= base['stored_bytes'] * REBASE_RATIO
+    )
+
+def _copy_database(src, dest):
+    """Consistent copy of an SQLite file through the online backup API."""
+    source, target = sqlite3.connect(src), sqlite3.connect(dest)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+def _write_archives(backup_dir, archives, force=False, progress=None):
+    """
+    Bring the archive entries up to date with the archive databases on disk.
+
+    Each archived year is stored whole, as an entry of its own, whenever its
+    file's content hash differs from the stored one (or always, when
+    forced). Entries of years no longer archived are dropped. Updates
+    `archives` ({year: entry}) in place; returns (written, replaced).
+    """
+    years = archive_service.list_archived_years()
+    written, replaced = [], []
+    for year in years:
+        path = archive_service.archive_path(year)
+        source_sha = _sha256(path)
+        old = archives.get(str(year))
+        if old and old['source_sha256'] == source_sha and not force:
+            continue
+        raw = os.path.join(backup_dir, f'.archive-{year}.db')
+        try:
+            _copy_database(path, raw)
+            stored = _store_entry(raw, backup_dir, f'archive-{year}-{source_sha[:12]}.db', progress)
+        finally:
+            if os.path.exists(raw):
+                os.remove(raw)
+        entry = {'year': year, 'kind': 'archive', 'source_sha256': source_sha, **stored}
+        entry['sha256'] = _sha256(os.path.join(backup_dir, entry['file']))
+        entry['created_at'] = datetime.now().isoformat(timespec='seconds')
+        if old and old['file'] != entry['file']:
+            replaced.append(old)
+        archives[str(year)] = entry
+        written.append(entry)
+    for year in [year for year in archives if int(year) not in years]:
+        replaced.append(archives.pop(year))
+    return written, replaced
+
+def write_backup(backup_dir, force=False, snapshot=None, progress=None):
+    """
+    Add the database's changes since its last backup to the chain in backup_dir.
+
+    Normally this writes one changeset holding only the rows written since
+    the last entry, so a backup costs the size of the edits. A new base is
+    written instead for the first backup, after a schema change, once the
+    chain is long enough to rebase, when a year was archived or restored
+    (those moves are not logged), when the chain is missing entries this
+    database wrote whose rows the log no longer has, or when forced; the
+    previous chain's files are then removed. Archived years are stored as
+    entries of their own, rewritten when their file changes. Raises
+    BackupConflict if the chain has entries this database has not
+    restored, unless force replaces them with a base.
+
+    The new entry only counts as backed up, and its rows only leave the
+    log, once it is seen in the chain again (see confirm_backup), so an
+    entry lost to a failed push is written again by the next backup. A base is built from `snapshot` (a file from
+    create_snapshot) when given. progress(stage, done, total) follows the
+    compress and encrypt stages.
+
+    Returns what was written: the chain entry (or None), the archive
+    entries and their byte totals; None when there was nothing to back up.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    manifest = load_manifest(backup_dir)
+    chain = manifest['entries']
+    archives = manifest.setdefault('archives', {})
+
+    with get_db_connection() as conn:
+        state = _settle_pending(conn, chain)
+        schema = _schema_fingerprint(conn)
+        latest = chain[-1]['number'] if chain else 0
+        # Entries this database wrote that never reached the chain, from
+        # before it waited for them to be pushed; their rows are out of the log
+        behind = latest < state.get('backup_number', 0)
+        if chain and latest > state.get('backup_number', 0) and not force:
+            raise BackupConflict(
+                f'The backup is at entry {latest} but this database was last backed up or restored at '
+                f"entry {state.get('backup_number')}; restore the backup first, or force a new base"
+            )
+        number = max(latest, state.get('backup_number', 0)) + 1
+        # Archive moves are not logged, so a year archived or restored since
+        # the last entry leaves the chain out of step with the hot table
+        archived = {str(year) for year in archive_service.list_archived_years()}
+        moved_years = archived ^ set(archives)
+
+        entry, head, replaced = None, None, []
+        if chain and not force and not behind and not moved_years and not _needs_rebase(chain, schema):
+            since = state['backup_seq']
+            head, changeset, count = _collect_changes(conn, since)
+            if count:
+                raw = os.path.join(backup_dir, f'.changes-{number:06d}.json')
+                try:
+                    with open(raw, 'w', encoding='utf-8') as f:
+                        json.dump(changeset, f, separators=(',', ':'))
+                    stored = _store_entry(raw, backup_dir, f'changes-{number:06d}.json', progress)
+                finally:
+                    os.remove(raw)
+                entry = {'number': number, 'kind': 'changes', 'seq': head, 'rows': count, **stored}
+        else:
+            entry = _write_base(backup_dir, number, snapshot, progress)
+            head = entry['seq']
+            replaced = chain
+            chain = []
+
+        written, replaced_archives = _write_archives(backup_dir, archives, force, progress)
+        if entry is None and not written and not replaced_archives:
+            return None
+        if entry:
+            entry['sha256'] = _sha256(os.path.join(backup_dir, entry['file']))
+            entry['created_at'] = datetime.now().isoformat(timespec='seconds')
+            chain = chain + [entry]
+        manifest['entries'] = chain
+        _save_manifest(backup_dir, manifest)
+        for old in replaced + replaced_archives:
+            path = os.path.join(backup_dir, old['file'])
+            if os.path.exists(path):
+                os.remove(path)
+
+        if entry:
+            _set_pending(conn, head, number)
+            conn.commit()
+
+    stored = ([entry] if entry else []) + written
+    return {
+        'entry': entry,
+        'archives': written,
+        'compression': COMPRESSION,
+        **{size: sum(item[size] for item in stored) for size in ('raw_bytes', 'compressed_bytes', 'stored_bytes')}
+    }
+
+# ---- restoring --------------------------------------------------------------
+
+def _apply_changeset(conn, changeset):
+    """Replay one changeset through the normal triggers, so derived tables follow."""
+    for table, change in changeset['tables'].items():
+        key = BACKUP_TABLES[table]
+        if change['deleted']:
+            conn.execute(
+                f'DELETE FROM {table} WHERE {key} IN (SELECT value FROM json_each(?))',
+                (json.dumps(change['deleted']),)
+            )
+        columns = change['columns']
+        if change['rows']:
+            updates = ', '.join(f'{column} = excluded.{column}' for column in columns if column != key)
+            conn.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT({key}) DO UPDATE SET {updates}",
+                [[decode_value(value) for value in row] for row in change['rows']]
+            )
+
+def _restore_archives(conn, archives, backup_dir, staging):
+    """
+    Decrypt the archive entries into staging and check their integrity.
+    The chain is rebased whenever the archived years change, so the
+    restored database never holds their rows. Returns the restored years.
+    """
+    os.makedirs(staging, exist_ok=True)
+    years = []
+    for year, entry in sorted(archives.items()):
+        path = archive_service.archive_path(year, staging)
+        with open(path, 'wb') as f:
+            f.write(open_sealed(os.path.join(backup_dir, entry['file'])))
+        with closing(sqlite3.connect(path)) as archive:
+            check = archive.execute('PRAGMA integrity_check').fetchone()[0]
+        if check != 'ok':
+            raise BackupError(f'Archive for {year} failed the integrity check: {check}')
+        years.append(int(year))
+    return years
+
+def restore_backup(backup_dir, dest):
+    """
+    Rebuild the database at dest from the chain in backup_dir: decrypt the
+    base, replay each changeset in order and check integrity, then rebuild
+    the archive databases next to it. dest and its archives are only
+    replaced once the restored copies are complete.
+    """
+    manifest = load_manifest(backup_dir)
+    chain, archives = manifest['entries'], manifest.get('archives', {})
+    if not chain:
+        raise BackupError(f'No backup found in {backup_dir}')
+    for entry in chain + list(archives.values()):
+        if _sha256(os.path.join(backup_dir, entry['file'])) != entry['sha256']:
+            raise BackupError(f"Backup file {entry['file']} does not match the manifest")
+
+    tmp = dest + '.restore'
+    archive_dir = archive_service.get_archive_dir(dest)
+    staging = archive_dir + '.restore'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    shutil.rmtree(staging, ignore_errors=True)
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(open_sealed(os.path.join(backup_dir, chain[0]['file'])))
+        conn = sqlite3.connect(tmp)
+        try:
+            rows = 0
+            for entry in chain[1:]:
+                changeset = json.loads(open_sealed(os.path.join(backup_dir, entry['file'])))
+                _apply_changeset(conn, changeset)
+                rows += entry.get('rows', 0)
+            conn.commit()
+            years = _restore_archives(conn, archives, backup_dir, staging)
+            # Everything replayed is already in the chain
+            seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM backup_changes').fetchone()[0]
+            _mark_backed_up(conn, max(seq, _backup_state(conn).get('backup_seq', 0)), chain[-1]['number'])
+            # This copy must sync under a device id of its own, not the one it was backed up from
+            try:
+                conn.execute("DELETE FROM sync_state WHERE key IN ('device', 'bundle')")
+            except sqlite3.OperationalError:
+                pass  # Backed up before sync existed
+            conn.commit()
+            check = conn.execute('PRAGMA integrity_check').fetchone()[0]
+        finally:
+            conn.close()
+        if check != 'ok':
+            raise BackupError(f'Restored database failed the integrity check: {check}')
+        # Archives go first: until dest is replaced its rows may be in both, never in neither
+        for year in archive_service.list_archived_years(archive_dir):
+            os.remove(archive_service.archive_path(year, archive_dir))
+        if years:
+            os.makedirs(archive_dir, exist_ok=True)
+        for year in years:
+            os.replace(archive_service.archive_path(year, staging), archive_service.archive_path(year, archive_dir))
+        os.replace(tmp, dest)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        shutil.rmtree(staging, ignore_errors=True)
+    return {'entries': len(chain), 'number': chain[-1]['number'], 'rows_replayed': rows, 'archives': years}
+
+def get_backup_status(backup_dir):
+    """The chain and archive entries in backup_dir and how far the database is ahead of them."""
+    manifest = load_manifest(backup_dir)
+    chain, archives = manifest['entries'], manifest.get('archives', {})
+    with get_db_connection() as conn:
+        state = _backup_state(conn)
+        pending = conn.execute(
+            'SELECT COUNT(DISTINCT table_name || char(0) || row_key) FROM backup_changes WHERE seq > ?',
+            (state.get('backup_seq', 0),)
+        ).fetchone()[0]
+    return {
+        'db_path': database_service.DB_PATH,
+        'entries': len(chain),
+        'latest': chain[-1]['number'] if chain else 0,
+        'database_at': state.get('backup_number', 0),
+        'awaiting_push': state.get('backup_pending_number') or None,
+        'pending_rows': pending,
+        'chain_bytes': sum(entry['stored_bytes'] for entry in chain),
+        'base_bytes': chain[0]['stored_bytes'] if chain else 0,
+        'archived_years': sorted(int(year) for year in archives),
+        'archive_bytes': sum(entry['stored_bytes'] for entry in archives.values())
+    }
@@ -0,0 +1,87 @@
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import request, make_response
+from .database_service import get_table_versions
+
+# Upper bound on the bytes of response bodies kept in memory
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+_cache = OrderedDict()
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+
+def _make_etag(key, versions):
+    raw = key + '|' + ','.join(f'{table}:{versions.get(table, 0)}' for table in sorted(versions))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def _cache_get(etag):
+    with _cache_lock:
+        entry = _cache.get(etag)
+        if entry is not None:
+            _cache.move_to_end(etag)
+        return entry
+
+def _cache_put(etag, entry):
+    global _cache_bytes
+    size = len(entry[0])
+    if size > MAX_CACHE_BYTES // 4:
+        return  # Too big to be worth evicting everything else for
+    with _cache_lock:
+        if etag in _cache:
+            return
+        _cache[etag] = entry
+        _cache_bytes += size
+        while _cache_bytes > MAX_CACHE_BYTES and _cache:
+            _, (body, _, _) = _cache.popitem(last=False)
+            _cache_bytes -= len(body)
+
+def clear_cache():
+    global _cache_bytes
+    with _cache_lock:
+        _cache.clear()
+        _cache_bytes = 0
+
+def conditional_get(*tables):
+    """
+    Decorate a GET view with strong ETags derived from the versions of the tables it reads.
+
+    A request whose If-None-Match carries the current ETag gets 304 Not Modified.
+    Otherwise a cached body for the same URL and table versions is served
+    without calling the view; on a miss the view runs and its 200 response is
+    cached. Any write to one of the tables bumps its version (see
+    database_service.init_data_versions), which changes the ETag.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            versions = get_table_versions(tables)
+            etag = _make_etag(request.full_path, versions)
+
+            # Gzipped bodies carry a '-gzip' variant of the tag (see response_service)
+            matched = next((tag for tag in (etag, etag + '-gzip') if request.if_none_match.contains(tag)), None)
+            if matched:
+                response = make_response('', 304)
+                response.set_etag(matched)
+                response.headers['Cache-Control'] = 'no-cache'
+                return response
+            else:
+                cached = _cache_get(etag)
+                if cached is not None:
+                    body, mimetype, headers = cached
+                    response = make_response(body, 200)
+                    response.mimetype = mimetype
+                    response.headers.extend(headers)
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200 or response.is_streamed:
+                        return response
+                    _cache_put(etag, (response.get_data(), response.mimetype, []))
+
+            response.set_etag(etag)
+            # Let browsers keep the body but always revalidate it with If-None-Match
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,145 @@
+from datetime import date
+from flask import jsonify
+from .database_service import get_db_connection
+from .income_service import build_income_timeline, parse_month_index, MAX_BATCH_MONTHS
+from . import archive_service
+
+UNASSIGNED = 'Unassigned'
+
+def _month_index(yyyymm):
+    return yyyymm // 100 * 12 + yyyymm % 100 - 1
+
+def _dollars(cents):
+    return round(cents / 100, 2)
+
+def _flows(income, need, luxury):
+    """Money in and out for one month or user, with savings and savings rate."""
+    spend = need + luxury
+    savings = income - spend
+    return {
+        'income': _dollars(income),
+        'spend': _dollars(spend),
+        'need': _dollars(need),
+        'luxury': _dollars(luxury),
+        'savings': _dollars(savings),
+        'savings_rate': round(savings / income, 4) if income > 0 else None
+    }
+
+def _spend_by_month(conn, first, last):
+    """
+    (month index, who, is_luxury) -> cents between two month indexes.
+
+    Hot years come from the trigger-maintained expense_monthly_summary table;
+    archived years are not in it, so their archives are aggregated directly.
+    """
+    bounds = ((first // 12) * 100 + first % 12 + 1, (last // 12) * 100 + last % 12 + 1)
+    luxury = "COALESCE(NULLIF(need_category, ''), 'Need') = 'Luxury'"
+    rows = conn.execute(f'''
+        SELECT month, who, {luxury}, SUM(total_cents) FROM expense_monthly_summary
+        WHERE month BETWEEN ? AND ?
+        GROUP BY 1, 2, 3
+    ''', bounds).fetchall()
+    years = archive_service.years_for_range(bounds[0] * 100, bounds[1] * 100 + 99)
+    for _, schema in archive_service.each_archive(conn, years):
+        rows.extend(conn.execute(f'''
+            SELECT date_num / 100, COALESCE(who, ''), {luxury}, SUM(amount_cents) FROM {schema}.expenses
+            WHERE date_num BETWEEN ? AND ? AND amount_cents IS NOT NULL
+            GROUP BY 1, 2, 3
+        ''', (bounds[0] * 100, bounds[1] * 100 + 99)).fetchall())
+
+    spend = {}
+    for month, who, is_luxury, cents in rows:
+        key = (_month_index(month), who or UNASSIGNED, bool(is_luxury))
+        spend[key] = spend.get(key, 0) + cents
+    return spend
+
+def get_cashflow(args):
+    """
+    Income, spending and savings per month and per user in one response.
+
+    Income comes from the income timeline (overrides replace a month's
+    records, attributed to the user who set them); spending comes from the
+    monthly expense aggregates, split into need and luxury. Takes optional
+    start_month/end_month as YYYY-MM; by default the range runs from the
+    earliest income or expense to the current month.
+    """
+    try:
+        first = parse_month_index(args['start_month']) if args.get('start_month') else None
+        last = parse_month_index(args['end_month']) if args.get('end_month') else None
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    with get_db_connection() as conn:
+        if last is None:
+            today = date.today()
+            last = today.year * 12 + today.month - 1
+        if first is None:
+            first_summary = conn.execute('SELECT MIN(month) FROM expense_monthly_summary').fetchone()[0]
+            archived = archive_service.list_archived_years()
+            earliest = [
+                conn.execute('SELECT MIN(start_month) FROM income_records').fetchone()[0],
+                _month_index(first_summary) if first_summary is not None else None,
+                archived[0] * 12 if archived else None
+            ]
+            earliest = [month for month in earliest if month is not None]
+            first = min(earliest) if earliest else last
+        if last < first:
+            return jsonify({'success': False, 'error': 'end_month is before start_month'}), 400
+        if last - first + 1 > MAX_BATCH_MONTHS:
+            return jsonify({'success': False, 'error': f'At most {MAX_BATCH_MONTHS} months per request'}), 400
+
+        timeline = build_income_timeline(conn, first, last, by=('user',))
+        spend = _spend_by_month(conn, first, last)
+
+    income_users, income_cents, _ = timeline['series']['user']
+    users = sorted(set(income_users) | {who for _, who, _ in spend})
+
+    months = []
+    totals = {'income': 0, 'need': 0, 'luxury': 0}
+    user_totals = {user: {'income': 0, 'need': 0, 'luxury': 0} for user in users}
+    for offset in range(last - first + 1):
+        index = first + offset
+        is_override = bool(timeline['override_mask'][offset])
+        if is_override:
+            user_income = timeline['override_users'][offset]
+        else:
+            user_income = {user: int(income_cents[i, offset]) for i, user in enumerate(income_users)}
+
+        month_totals = {'income': int(timeline['totals'][offset]), 'need': 0, 'luxury': 0}
+        by_user = {}
+        for user in users:
+            flows = {
+                'income': user_income.get(user, 0),
+                'need': spend.get((index, user, False), 0),
+                'luxury': spend.get((index, user, True), 0)
+            }
+            month_totals['need'] += flows['need']
+            month_totals['luxury'] += flows['luxury']
+            for key, cents in flows.items():
+                user_totals[user][key] += cents
+            if any(flows.values()):
+                by_user[user] = _flows(**flows)
+        for key, cents in month_totals.items():
+            totals[key] += cents
+
+        year, month = divmod(index, 12)
+        months.append({
+            'year': year,
+            'month': month + 1,
+            **_flows(**month_totals),
+            'is_override': is_override,
+            'users': by_user
+        })
+
+    first_year, first_month = divmod(first, 12)
+    last_year, last_month = divmod(last, 12)
+    return jsonify({
+        'success': True,
+        'range': {
+            'start_month': f'{first_year:04d}-{first_month + 1:02d}',
+            'end_month': f'{last_year:04d}-{last_month + 1:02d}'
+        },
+        'users': users,
+        'totals': {**_flows(**totals), 'users': {user: _flows(**flows) for user, flows in user_totals.items()}},
+        'months': months
+    })
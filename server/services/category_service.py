@@ -1,11 +1,14 @@
 import sqlite3
 import string
+from contextlib import nullcontext
 import numpy as np
 from flask import jsonify
 from sentence_transformers import SentenceTransformer
 from sklearn.metrics.pairwise import cosine_similarity
 
 from category_examples import CATEGORY_EXAMPLES
+from . import journal_service
+from .user_rules_service import match_user_rule
 
 DB_PATH = 'expense_tracker.db'
 DEFAULT_CATEGORY_LABELS = [
@@ -17,6 +20,7 @@ DEFAULT_CATEGORY_LABELS = [
 _embedder = None
 _category_embeddings = None
 _current_categories = None
+_categories_version = None
 
 # --------------------------- #
 #      Utility Functions      #
@@ -39,18 +43,36 @@ def refresh_categories():
     _current_categories = None
     _category_embeddings = None
 
+def _connection(conn=None):
+    """Use the caller's connection when given, otherwise open one for the block."""
+    return nullcontext(conn) if conn is not None else sqlite3.connect(DB_PATH)
+
+def _sync_category_cache(conn):
+    """Drop the caches when custom_categories changed, possibly in another worker process."""
+    global _categories_version
+    try:
+        row = conn.execute(
+            "SELECT version FROM data_versions WHERE table_name = 'custom_categories'"
+        ).fetchone()
+    except sqlite3.OperationalError:
+        return  # Database not initialized yet
+    version = row[0] if row else None
+    if version != _categories_version:
+        refresh_categories()
+        _categories_version = version
+
 # --------------------------- #
 #   Category DB Operations    #
 # --------------------------- #
 
-def get_all_categories():
+def get_all_categories(conn=None):
     """Return all categories (default + custom from DB)."""
     global _current_categories
-    if _current_categories is None:
-        _current_categories = DEFAULT_CATEGORY_LABELS.copy()
-        with sqlite3.connect(DB_PATH) as conn:
+    with _connection(conn) as conn:
+        _sync_category_cache(conn)
+        if _current_categories is None:
             rows = conn.execute('SELECT name FROM custom_categories').fetchall()
-            _current_categories.extend(row[0] for row in rows)
+            _current_categories = DEFAULT_CATEGORY_LABELS + [row[0] for row in rows]
     return _current_categories
 
 def add_custom_category(name, icon='🏷️', color='#818cf8'):
@@ -131,8 +153,16 @@ def rename_custom_category(old_name, new_name):
             if not result:
                 return False
 
+            expense_ids = [row[0] for row in conn.execute(
+                'SELECT id FROM expenses WHERE category = ?', (old_name,))]
+            journal = [
+                journal_service.begin(conn, 'expenses', 'id', expense_ids),
+                journal_service.begin(conn, 'custom_categories', 'name', [old_name, new_name])
+            ]
             conn.execute('UPDATE expenses SET category = ? WHERE category = ?', (new_name, old_name))
             conn.execute('UPDATE custom_categories SET name = ? WHERE name = ?', (new_name, old_name))
+            journal_service.record(conn, 'rename_category', f'Rename category "{old_name}" to "{new_name}"',
+                                   [journal_service.finish(conn, change) for change in journal])
             conn.commit()
             refresh_categories()
             return True
@@ -162,30 +192,35 @@ def get_category_metadata():
             base[name] = {'icon': icon, 'color': color}
     return base
 
-def get_category_embeddings():
+def get_category_embeddings(conn=None):
     """Generate and cache category embeddings from examples."""
     global _category_embeddings
+    # get_all_categories drops both caches when the categories changed
+    categories = get_all_categories(conn)
     if _category_embeddings is None:
         embedder = get_embedder()
         embeddings = []
-        for cat in get_all_categories():
+        for cat in categories:
             examples = CATEGORY_EXAMPLES.get(cat, [cat])
             avg_embedding = np.mean(embedder.encode(examples), axis=0)
             embeddings.append(avg_embedding)
         _category_embeddings = np.stack(embeddings)
     return _category_embeddings
 
-def guess_category(description):
-    """Guess category for a given expense description."""
+def guess_category(description, conn=None):
+    """Guess category for a given expense description, on the caller's connection if given."""
     desc = (description or "").strip()
     if not desc:
         return "shopping"
 
-    desc_norm = desc.lower().strip()
-    with sqlite3.connect(DB_PATH) as conn:
-        row = conn.execute('SELECT category FROM user_overrides WHERE description = ?', (desc_norm,)).fetchone()
-        if row:
-            return row[0]
+    with _connection(conn) as conn:
+        return _guess_category(conn, desc)
+
+def _guess_category(conn, desc):
+    # Exact, normalized, prefix and regex user rules, compiled once per rule change
+    category = match_user_rule(conn, desc, 'category')
+    if category:
+        return category
 
     try:
         from category_examples import MERCHANT_MAP
@@ -199,25 +234,25 @@ def guess_category(description):
 
     embedder = get_embedder()
     desc_embed = embedder.encode([desc])[0]
-    cat_embeddings = get_category_embeddings()
+    cat_embeddings = get_category_embeddings(conn)
 
     if cat_embeddings is None or not len(cat_embeddings):
         return "shopping"
 
     sims = cosine_similarity([desc_embed], cat_embeddings)[0]
     best_idx = np.argmax(sims)
-    return get_all_categories()[best_idx]
+    return get_all_categories(conn)[best_idx]
 
-def guess_need_category(description, category=None):
+def guess_need_category(description, category=None, conn=None):
     """Determine if a transaction is a 'Need' or 'Luxury'."""
     desc = (description or "").strip().lower()
     if not desc:
         return 'Need'
 
-    with sqlite3.connect(DB_PATH) as conn:
-        row = conn.execute('SELECT need_category FROM user_overrides WHERE description = ?', (desc,)).fetchone()
-        if row and row[0]:
-            return row[0]
+    with _connection(conn) as conn:
+        need_category = match_user_rule(conn, desc, 'need_category')
+    if need_category:
+        return need_category
 
     NEED_CATEGORIES = {'groceries', 'utilities', 'medicines', 'school', 'charity'}
     if category and isinstance(category, str) and category.lower() in NEED_CATEGORIES:
@@ -0,0 +1,113 @@
+import json
+from flask import jsonify
+from .database_service import get_db_connection
+from . import archive_service
+
+# Tombstones older than this are dropped by compaction
+TOMBSTONE_RETENTION_DAYS = 30
+
+def get_expense_changes(since, limit=1000):
+    """
+    Return expense upserts and tombstones recorded after sequence number `since`.
+
+    Entries are read in sequence order up to `limit`, collapsed to the latest
+    operation per expense, and upserts carry the current row. The response's
+    'latest_seq' is the cursor for the next call; 'has_more' means another
+    call is needed to catch up. If `since` predates the compacted history the
+    response has 'reset': True and the client must reload the full list.
+    """
+    try:
+        since = int(since or 0)
+        limit = min(max(int(limit), 1), 10000)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'since and limit must be integers'}), 400
+
+    with get_db_connection() as conn:
+        floor = conn.execute("SELECT value FROM change_log_state WHERE key = 'expense_floor'").fetchone()[0]
+        head = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM expense_changes').fetchone()[0]
+        head = max(head, floor)
+        if since < floor:
+            return jsonify({'success': True, 'reset': True, 'latest_seq': head})
+
+        entries = conn.execute('''
+            SELECT seq, expense_id, op FROM expense_changes
+            WHERE seq > ? ORDER BY seq LIMIT ?
+        ''', (since, limit + 1)).fetchall()
+        has_more = len(entries) > limit
+        entries = entries[:limit]
+
+        latest_op = {}
+        for _, expense_id, op in entries:
+            latest_op[expense_id] = op
+        upsert_ids = [expense_id for expense_id, op in latest_op.items() if op == 'upsert']
+
+        upserts = []
+        for start in range(0, len(upsert_ids), 500):
+            chunk = upsert_ids[start:start + 500]
+            cur = conn.execute(
+                f"SELECT * FROM expenses WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+            )
+            columns = [column[0] for column in cur.description]
+            upserts.extend(dict(zip(columns, row)) for row in cur.fetchall())
+
+        # Rows edited and then archived are read from their archive
+        found = {row['id'] for row in upserts}
+        missing = [expense_id for expense_id in upsert_ids if expense_id not in found]
+        if missing and archive_service.list_archived_years():
+            source = archive_service.expenses_source(conn)
+            cur = conn.execute(
+                f'SELECT * FROM {source} WHERE id IN (SELECT value FROM json_each(?))', (json.dumps(missing),)
+            )
+            columns = [column[0] for column in cur.description]
+            upserts.extend(dict(zip(columns, row)) for row in cur.fetchall())
+
+        # An upsert whose row is already gone is reported as a delete
+        found = {row['id'] for row in upserts}
+        deleted = [expense_id for expense_id, op in latest_op.items() if op == 'delete' or expense_id not in found]
+
+    return jsonify({
+        'success': True,
+        'reset': False,
+        'since': since,
+        'latest_seq': entries[-1][0] if entries else max(since, head),
+        'has_more': has_more,
+        'upserts': upserts,
+        'deleted': deleted
+    })
+
+def compact_expense_changes(retention_days=TOMBSTONE_RETENTION_DAYS):
+    """
+    Shrink the change log without changing what an up-to-date client would see.
+
+    Only the newest entry per expense is needed to bring any cursor current,
+    so older entries for the same expense are dropped. Tombstones older than
+    the retention window are dropped too, and the resume floor is raised past
+    them so clients with older cursors are told to reload instead.
+    """
+    with get_db_connection() as conn:
+        superseded = conn.execute('''
+            DELETE FROM expense_changes
+            WHERE seq < (SELECT MAX(c.seq) FROM expense_changes c WHERE c.expense_id = expense_changes.expense_id)
+        ''').rowcount
+
+        expired_floor = conn.execute('''
+            SELECT MAX(seq) FROM expense_changes
+            WHERE op = 'delete' AND changed_at < datetime('now', ?)
+        ''', (f'-{int(retention_days)} days',)).fetchone()[0]
+        expired = 0
+        if expired_floor is not None:
+            expired = conn.execute(
+                "DELETE FROM expense_changes WHERE op = 'delete' AND seq <= ?", (expired_floor,)
+            ).rowcount
+            conn.execute('''
+                UPDATE change_log_state SET value = MAX(value, ?) WHERE key = 'expense_floor'
+            ''', (expired_floor,))
+        conn.commit()
+        remaining = conn.execute('SELECT COUNT(*) FROM expense_changes').fetchone()[0]
+
+    return jsonify({
+        'success': True,
+        'superseded_removed': superseded,
+        'tombstones_expired': expired,
+        'remaining': remaining
+    })
@@ -7,6 +7,135 @@ except ImportError:
 
 DB_PATH = 'expense_tracker.db'
 
+# Sort keys for the /expenses listing. NULLs are folded into a constant so that
+# (key, id) keyset comparisons work, and each expression has a matching index.
+EXPENSE_SORT_KEYS = {
+    'date': 'COALESCE(date_num, 0)',
+    'amount': 'COALESCE(amount_cents, 0)',
+    'description': "COALESCE(description, '')",
+    'category': "COALESCE(category, '')",
+    'who': "COALESCE(who, '')",
+    'id': 'id',
+}
+
+# Code points str.strip() removes; SQL trim() on its own only removes spaces
+WHITESPACE_CODES = (
+    9, 10, 11, 12, 13, 28, 29, 30, 31, 32, 133, 160, 5760, *range(8192, 8203),
+    8232, 8233, 8239, 8287, 12288
+)
+
+def strip_sql(col):
+    """SQL expression for col.strip()."""
+    return f"trim({col}, char({', '.join(map(str, WHITESPACE_CODES))}))"
+
+def description_key_sql(col):
+    """SQL expression for the key user rules match descriptions on."""
+    return f'lower({strip_sql(col)})'
+
+# Expenses and staging rows have an index on the description key
+DESCRIPTION_KEY = description_key_sql('description')
+
+def normalized_description_sql(col):
+    """
+    SQL expression for user_rules_service.normalize_description: the words
+    of [a-z0-9] runs (joined inside a word by ' or &) that have no digits,
+    lowercased and separated by single spaces. It walks the text one
+    character at a time, carrying the character at i, the word being read
+    and the words kept.
+    """
+    in_word = ("(c GLOB '[a-z0-9]' OR (c IN ('''', '&') AND word != '' "
+               "AND substr(s, i + 1, 1) GLOB '[a-z0-9]'))")
+    return f'''(
+        WITH RECURSIVE walk(i, s, c, word, words) AS (
+            SELECT 1, lower(COALESCE({col}, '')), substr(lower(COALESCE({col}, '')), 1, 1), '', ''
+            UNION ALL
+            SELECT i + 1, s, substr(s, i + 1, 1),
+                CASE WHEN {in_word} THEN word || c ELSE '' END,
+                CASE WHEN {in_word} OR word = '' OR word GLOB '*[0-9]*' THEN words ELSE words || ' ' || word END
+            FROM walk WHERE c != '' OR word != ''
+        )
+        SELECT substr(words, 2) FROM walk WHERE c = '' AND word = ''
+    )'''
+
+def day_number_sql(col):
+    """SQL expression turning a free-form date column into a YYYYMMDD integer.
+
+    Understands the ISO dates written by the PDF parsers and manual entry
+    ('2024-03-07', optionally followed by a time) as well as US style dates
+    from bank CSVs ('3/7/2024', '03/07/24'). Anything else maps to NULL.
+    """
+    rest = f"substr({col}, instr({col}, '/') + 1)"
+    month = f"CAST(substr({col}, 1, instr({col}, '/') - 1) AS INTEGER)"
+    day = f"CAST(substr({rest}, 1, instr({rest}, '/') - 1) AS INTEGER)"
+    year_str = f"substr({rest}, instr({rest}, '/') + 1, 4)"
+    year = (f"(CASE WHEN length(trim({year_str})) = 2 THEN 2000 + CAST({year_str} AS INTEGER) "
+            f"ELSE CAST({year_str} AS INTEGER) END)")
+    return f"""(CASE
+        WHEN {col} GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*'
+            THEN CAST(substr({col}, 1, 4) || substr({col}, 6, 2) || substr({col}, 9, 2) AS INTEGER)
+        WHEN {col} GLOB '[0-9]*/[0-9]*/[0-9][0-9]*'
+            THEN {year} * 10000 + {month} * 100 + {day}
+        ELSE NULL END)"""
+
+def month_index_sql(col):
+    """SQL expression turning a date column into a month index, year * 12 + (month - 1)."""
+    day = day_number_sql(col)
+    return f'({day} / 10000 * 12 + {day} / 100 % 100 - 1)'
+
+def cents_sql(col):
+    """SQL expression turning a REAL amount column into integer cents."""
+    return f"(CASE WHEN {col} IS NULL OR {col} = '' THEN NULL ELSE CAST(ROUND(CAST({col} AS REAL) * 100) AS INTEGER) END)"
+
+def parse_day_number(value):
+    """Parse a 'YYYY-MM-DD' (or 'YYYYMMDD') query value into a YYYYMMDD integer."""
+    if value is None or value == '':
+        return None
+    text = str(value).strip()
+    if len(text) >= 10 and text[4] == '-' and text[7] == '-':
+        text = text[:4] + text[5:7] + text[8:10]
+    if len(text) != 8 or not text.isdigit():
+        raise ValueError(f"Invalid date: {value}")
+    return int(text)
+
+# Columns recomputed by triggers from a row's other columns on every write
+DERIVED_COLUMNS = {
+    'expenses': ('date_num', 'amount_cents', 'description_norm'),
+    'staging_expenses': ('description_norm',),
+    'income_records': ('start_month', 'end_month'),
+}
+
+# Change logs skip writes made while this is set. It is set and cleared
+# inside the transaction that moves rows between the hot expenses table and
+# an archive, so no other connection ever sees it set.
+NOT_ARCHIVE_MOVE = "(SELECT value FROM change_log_state WHERE key = 'archive_move') = 0"
+
+def set_archive_move(conn, moving):
+    conn.execute("UPDATE change_log_state SET value = ? WHERE key = 'archive_move'", (int(moving),))
+
+def _define(conn, kind, name, definition):
+    sql = f'CREATE {kind.upper()} {name} {definition.strip()}'
+    row = conn.execute('SELECT sql FROM sqlite_master WHERE type = ? AND name = ?', (kind, name)).fetchone()
+    if row and row[0] == sql:
+        return False
+    if row:
+        conn.execute(f'DROP {kind.upper()} {name}')
+    conn.execute(sql)
+    return True
+
+def define_trigger(conn, name, definition):
+    """Create a trigger, replacing an existing one of that name whose definition differs; True if it did."""
+    return _define(conn, 'trigger', name, definition)
+
+def define_index(conn, name, definition):
+    """Create an index from 'ON table(...)', replacing an existing one whose definition differs; True if it did."""
+    return _define(conn, 'index', name, definition)
+
+def update_of_written(conn, table):
+    """'UPDATE OF <columns>' for every column but the derived ones, so trigger fix-ups are not seen as writes."""
+    derived = DERIVED_COLUMNS.get(table, ())
+    columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})') if row[1] not in derived]
+    return f"UPDATE OF {', '.join(columns)}"
+
 @contextmanager
 def get_db_connection():
     conn = sqlite3.connect(DB_PATH)
@@ -126,5 +255,536 @@ def init_db():
         # Update existing records with default user if user column is NULL
         conn.execute("UPDATE income_records SET user = 'Ameya' WHERE user IS NULL")
         conn.execute("UPDATE monthly_income_overrides SET user = 'Ameya' WHERE user IS NULL")
+
+        # How a user rule's description matches: exact, prefix, normalized or regex
+        try:
+            conn.execute("ALTER TABLE user_overrides ADD COLUMN match_type TEXT NOT NULL DEFAULT 'exact'")
+        except sqlite3.OperationalError:
+            pass  # Column already exists
+
+        # Income record ranges as integer month indexes (end_month NULL = ongoing)
+        for column in ('start_month', 'end_month'):
+            try:
+                conn.execute(f'ALTER TABLE income_records ADD COLUMN {column} INTEGER')
+            except sqlite3.OperationalError:
+                pass  # Column already exists
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS income_records_months_insert AFTER INSERT ON income_records
+            BEGIN
+                UPDATE income_records
+                SET start_month = {month_index_sql('NEW.start_date')}, end_month = {month_index_sql('NEW.end_date')}
+                WHERE id = NEW.id;
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS income_records_months_update AFTER UPDATE OF start_date, end_date ON income_records
+            BEGIN
+                UPDATE income_records
+                SET start_month = {month_index_sql('NEW.start_date')}, end_month = {month_index_sql('NEW.end_date')}
+                WHERE id = NEW.id;
+            END
+        ''')
+        conn.execute(f'''
+            UPDATE income_records
+            SET start_month = {month_index_sql('start_date')}, end_month = {month_index_sql('end_date')}
+            WHERE start_month IS NULL
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_income_records_months ON income_records(start_month, end_month)')
+
+        # Canonical typed columns: date as a YYYYMMDD integer, amount as integer cents.
+        # Triggers keep them in sync with every write to date/amount, whatever the code path.
+        try:
+            conn.execute('ALTER TABLE expenses ADD COLUMN date_num INTEGER')
+        except sqlite3.OperationalError:
+            pass  # Column already exists
         
+        try:
+            conn.execute('ALTER TABLE expenses ADD COLUMN amount_cents INTEGER')
+        except sqlite3.OperationalError:
+            pass  # Column already exists
+        
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS expenses_typed_insert AFTER INSERT ON expenses
+            BEGIN
+                UPDATE expenses
+                SET date_num = {day_number_sql('NEW.date')}, amount_cents = {cents_sql('NEW.amount')}
+                WHERE id = NEW.id;
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS expenses_typed_update AFTER UPDATE OF date, amount ON expenses
+            BEGIN
+                UPDATE expenses
+                SET date_num = {day_number_sql('NEW.date')}, amount_cents = {cents_sql('NEW.amount')}
+                WHERE id = NEW.id;
+            END
+        ''')
+        
+        # Backfill rows written before the typed columns existed
+        conn.execute(f'''
+            UPDATE expenses
+            SET date_num = {day_number_sql('date')}, amount_cents = {cents_sql('amount')}
+            WHERE date_num IS NULL OR amount_cents IS NULL
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_expenses_date_num ON expenses(date_num, amount_cents)')
+        
+        # Indexes backing the server-side filters and keyset pagination of /expenses
+        for column in ('category', 'who', 'card', 'statement_id'):
+            conn.execute(f'CREATE INDEX IF NOT EXISTS idx_expenses_{column} ON expenses({column}, date_num)')
+        for name, expr in EXPENSE_SORT_KEYS.items():
+            if name != 'id':
+                conn.execute(f'CREATE INDEX IF NOT EXISTS idx_expenses_sort_{name} ON expenses({expr}, id)')
+        for table in ('expenses', 'staging_expenses'):
+            define_index(conn, f'idx_{table}_description_key', f'ON {table}({DESCRIPTION_KEY})')
+            init_normalized_description(conn, table)
+        
+        init_expense_search(conn)
+        init_trigram_search(conn)
+        init_monthly_summary(conn)
+        init_data_versions(conn)
+        init_expense_change_log(conn)
+        init_backup_change_log(conn)
+        init_sync_tables(conn)
+        init_operation_journal(conn)
+
         conn.commit()
+
+def init_normalized_description(conn, table):
+    """Add the description_norm column normalized user rules match on, kept current by triggers."""
+    try:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN description_norm TEXT')
+    except sqlite3.OperationalError:
+        pass  # Column already exists
+    for name, event in (('insert', 'INSERT'), ('update', 'UPDATE OF description')):
+        define_trigger(conn, f'{table}_description_norm_{name}', f'''
+            AFTER {event} ON {table}
+            BEGIN
+                UPDATE {table} SET description_norm = {normalized_description_sql('NEW.description')}
+                WHERE id = NEW.id;
+            END
+        ''')
+    conn.execute(f'''
+        UPDATE {table} SET description_norm = {normalized_description_sql('description')}
+        WHERE description_norm IS NULL
+    ''')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_description_norm ON {table}(description_norm)')
+
+def init_expense_search(conn):
+    """Create the FTS5 index over expense descriptions and notes, kept in sync by triggers."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'expenses_fts'"
+    ).fetchone()
+    try:
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5(
+                description, notes,
+                content='expenses', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"[WARNING] FTS5 not available, expense search will use LIKE scans: {e}")
+        return
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_insert AFTER INSERT ON expenses
+        BEGIN
+            INSERT INTO expenses_fts (rowid, description, notes) VALUES (NEW.id, NEW.description, NEW.notes);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_delete AFTER DELETE ON expenses
+        BEGIN
+            INSERT INTO expenses_fts (expenses_fts, rowid, description, notes) VALUES ('delete', OLD.id, OLD.description, OLD.notes);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS expenses_fts_update AFTER UPDATE OF description, notes ON expenses
+        BEGIN
+            INSERT INTO expenses_fts (expenses_fts, rowid, description, notes) VALUES ('delete', OLD.id, OLD.description, OLD.notes);
+            INSERT INTO expenses_fts (rowid, description, notes) VALUES (NEW.id, NEW.description, NEW.notes);
+        END
+    ''')
+    if not exists:
+        # Index rows that were written before the search table existed
+        conn.execute("INSERT INTO expenses_fts (expenses_fts) VALUES ('rebuild')")
+
+# Grouping keys of expense_monthly_summary; NULLs are stored as '' so they can be part of the key
+SUMMARY_KEYS = ('category', 'need_category', 'who', 'card')
+
+def monthly_summary_select(where=''):
+    """SELECT that aggregates raw expenses into expense_monthly_summary rows."""
+    keys = ', '.join(f"COALESCE({k}, '')" for k in SUMMARY_KEYS)
+    return f'''
+        SELECT date_num / 100, {keys},
+               SUM(amount_cents), COUNT(*), MIN(amount_cents), MAX(amount_cents)
+        FROM expenses
+        WHERE date_num IS NOT NULL AND amount_cents IS NOT NULL {where}
+        GROUP BY 1, 2, 3, 4, 5
+    '''
+
+def init_monthly_summary(conn):
+    """
+    Create expense_monthly_summary and the triggers that keep it current.
+
+    Each row holds sum/count/min/max of amount_cents for one
+    (month, category, need_category, who, card) group of expenses that have a
+    parseable date. Inserts add to their group, deletes subtract, and updates
+    do both; min/max are recomputed from the raw rows of a group only when the
+    removed amount was its min or max.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'expense_monthly_summary'"
+    ).fetchone()
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS expense_monthly_summary (
+            month INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            need_category TEXT NOT NULL,
+            who TEXT NOT NULL,
+            card TEXT NOT NULL,
+            total_cents INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            min_cents INTEGER,
+            max_cents INTEGER,
+            PRIMARY KEY (month, category, need_category, who, card)
+        ) WITHOUT ROWID
+    ''')
+
+    def group_match(row):
+        return ' AND '.join(
+            ['month = ' + f'{row}.date_num / 100'] + [f"{k} = COALESCE({row}.{k}, '')" for k in SUMMARY_KEYS]
+        )
+
+    def add_sql(row):
+        keys = ', '.join(f"COALESCE({row}.{k}, '')" for k in SUMMARY_KEYS)
+        return f'''
+            INSERT INTO expense_monthly_summary
+                (month, {', '.join(SUMMARY_KEYS)}, total_cents, count, min_cents, max_cents)
+            SELECT {row}.date_num / 100, {keys},
+                   {row}.amount_cents, 1, {row}.amount_cents, {row}.amount_cents
+            WHERE {row}.date_num IS NOT NULL AND {row}.amount_cents IS NOT NULL
+            ON CONFLICT (month, {', '.join(SUMMARY_KEYS)}) DO UPDATE SET
+                total_cents = total_cents + excluded.total_cents,
+                count = count + 1,
+                min_cents = MIN(min_cents, excluded.min_cents),
+                max_cents = MAX(max_cents, excluded.max_cents);
+        '''
+
+    def remove_sql(row):
+        match = group_match(row)
+        raw_match = ' AND '.join(
+            [f'e.date_num BETWEEN {row}.date_num / 100 * 100 AND {row}.date_num / 100 * 100 + 99']
+            + [f"COALESCE(e.{k}, '') = COALESCE({row}.{k}, '')" for k in SUMMARY_KEYS]
+        )
+        return f'''
+            UPDATE expense_monthly_summary
+            SET total_cents = total_cents - {row}.amount_cents, count = count - 1
+            WHERE {match} AND {row}.amount_cents IS NOT NULL;
+            DELETE FROM expense_monthly_summary WHERE {match} AND count <= 0;
+            UPDATE expense_monthly_summary
+            SET min_cents = (SELECT MIN(e.amount_cents) FROM expenses e WHERE {raw_match}),
+                max_cents = (SELECT MAX(e.amount_cents) FROM expenses e WHERE {raw_match})
+            WHERE {match} AND {row}.amount_cents IN (min_cents, max_cents);
+        '''
+
+    # Created after the typed-column triggers, so SQLite fires these first on
+    # insert; a row inserted with stale date_num/amount_cents is then fixed up by
+    # the typed trigger's UPDATE, which the update trigger below accounts for.
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS expenses_summary_insert AFTER INSERT ON expenses
+        BEGIN {add_sql('NEW')} END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS expenses_summary_delete AFTER DELETE ON expenses
+        BEGIN {remove_sql('OLD')} END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS expenses_summary_update
+        AFTER UPDATE OF date_num, amount_cents, {', '.join(SUMMARY_KEYS)} ON expenses
+        BEGIN {remove_sql('OLD')} {add_sql('NEW')} END
+    ''')
+
+    if not exists:
+        conn.execute(f'''
+            INSERT INTO expense_monthly_summary
+                (month, {', '.join(SUMMARY_KEYS)}, total_cents, count, min_cents, max_cents)
+            {monthly_summary_select()}
+        ''')
+
+# Tables whose writes bump a version counter, used for ETags on the read endpoints
+VERSIONED_TABLES = (
+    'expenses', 'statements', 'custom_categories', 'user_overrides',
+    'income_records', 'monthly_income_overrides', 'staging_expenses'
+)
+
+def init_data_versions(conn):
+    """Create the per-table version counters and the triggers that bump them on every write."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    for table in VERSIONED_TABLES:
+        conn.execute('INSERT OR IGNORE INTO data_versions (table_name, version) VALUES (?, 0)', (table,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            # The derived-column fix-up after an insert is part of that insert
+            when = update_of_written(conn, table) if event == 'UPDATE' else event
+            define_trigger(conn, f'{table}_version_{event.lower()}', f'''
+                AFTER {when} ON {table}
+                BEGIN
+                    UPDATE data_versions SET version = version + 1 WHERE table_name = '{table}';
+                END
+            ''')
+
+def init_expense_change_log(conn):
+    """Create the expense change log: one sequenced entry per insert, update or delete."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS expense_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            expense_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            changed_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_expense_changes_expense ON expense_changes(expense_id, seq)')
+    # Lowest sequence a client can still resume from; older cursors must reload in full
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS change_log_state (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    ''')
+    conn.execute("INSERT OR IGNORE INTO change_log_state (key, value) VALUES ('expense_floor', 0)")
+    conn.execute("INSERT OR IGNORE INTO change_log_state (key, value) VALUES ('archive_move', 0)")
+    # Archiving and restoring a year only moves rows that clients list either
+    # way, so those moves are not logged
+    for event, row, op in (('INSERT', 'NEW', 'upsert'), ('UPDATE', 'NEW', 'upsert'), ('DELETE', 'OLD', 'delete')):
+        when = update_of_written(conn, 'expenses') if event == 'UPDATE' else event
+        define_trigger(conn, f'expenses_changes_{event.lower()}', f'''
+            AFTER {when} ON expenses WHEN {NOT_ARCHIVE_MOVE}
+            BEGIN
+                INSERT INTO expense_changes (expense_id, op) VALUES ({row}.id, '{op}');
+            END
+        ''')
+
+# Tables holding user data, with the column each row is keyed on in backups.
+# Everything else (search indexes, summaries, counters) is derived from these.
+BACKUP_TABLES = {
+    'statements': 'id',
+    'expenses': 'id',
+    'user_overrides': 'description',
+    'custom_categories': 'name',
+    'staging_expenses': 'id',
+    'staging_metadata': 'statement_id',
+    'income_records': 'id',
+    'monthly_income_overrides': 'id',
+}
+
+def init_backup_change_log(conn):
+    """Create the row change log: the key and time of every write to BACKUP_TABLES not yet backed up or synced."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS backup_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_key NOT NULL,
+            changed_at REAL DEFAULT (julianday('now'))
+        )
+    ''')
+    try:
+        # Logs created without it read NULL, treated as the time of the next sync
+        conn.execute('ALTER TABLE backup_changes ADD COLUMN changed_at REAL')
+    except sqlite3.OperationalError:
+        pass  # Column already exists
+    # Last logged change included in the backup, and the backup entry that holds it
+    conn.execute("INSERT OR IGNORE INTO change_log_state (key, value) VALUES ('backup_seq', 0)")
+    conn.execute("INSERT OR IGNORE INTO change_log_state (key, value) VALUES ('backup_number', 0)")
+    # The entry written last, until it is seen in the pushed chain
+    conn.execute("INSERT OR IGNORE INTO change_log_state (key, value) VALUES ('backup_pending_seq', 0)")
+    conn.execute("INSERT OR IGNORE INTO change_log_state (key, value) VALUES ('backup_pending_number', 0)")
+    for table, key in BACKUP_TABLES.items():
+        # Rows moving to or from an archive are not logged; the archive files
+        # are backed up as entries of their own
+        define_trigger(conn, f'{table}_backup_insert', f'''
+            AFTER INSERT ON {table} WHEN {NOT_ARCHIVE_MOVE}
+            BEGIN
+                INSERT INTO backup_changes (table_name, row_key) VALUES ('{table}', NEW.{key});
+            END
+        ''')
+        define_trigger(conn, f'{table}_backup_delete', f'''
+            AFTER DELETE ON {table} WHEN {NOT_ARCHIVE_MOVE}
+            BEGIN
+                INSERT INTO backup_changes (table_name, row_key) VALUES ('{table}', OLD.{key});
+            END
+        ''')
+        # A changed key is logged under both keys, so the old one reads back as deleted
+        define_trigger(conn, f'{table}_backup_update', f'''
+            AFTER {update_of_written(conn, table)} ON {table} WHEN {NOT_ARCHIVE_MOVE}
+            BEGIN
+                INSERT INTO backup_changes (table_name, row_key)
+                SELECT '{table}', OLD.{key} WHERE OLD.{key} IS NOT NEW.{key};
+                INSERT INTO backup_changes (table_name, row_key) VALUES ('{table}', NEW.{key});
+            END
+        ''')
+
+def init_sync_tables(conn):
+    """Create the row sync metadata: a global id and per-field version stamps for every synced row."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        )
+    ''')
+    # fields is {column: [value hash, stamp]}; row_key is NULL once the row is deleted
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sync_rows (
+            table_name TEXT NOT NULL,
+            gid TEXT NOT NULL,
+            row_key,
+            fields TEXT NOT NULL,
+            deleted_stamp TEXT,
+            local_stamp TEXT,
+            PRIMARY KEY (table_name, gid)
+        )
+    ''')
+    conn.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_sync_rows_key ON sync_rows(table_name, row_key)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sync_rows_local ON sync_rows(local_stamp)')
+    # Last bundle applied from each other device
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS sync_peers (
+            device TEXT PRIMARY KEY,
+            applied INTEGER NOT NULL
+        )
+    ''')
+
+def init_operation_journal(conn):
+    """Create the undo/redo journal: before and after images of the rows each operation changed."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS operation_journal (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            op TEXT NOT NULL,
+            summary TEXT,
+            changes TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            undone INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL DEFAULT (datetime('now'))
+        )
+    ''')
+
+def get_table_versions(tables):
+    """Return {table: version} for the given tables."""
+    with get_db_connection() as conn:
+        placeholders = ', '.join('?' * len(tables))
+        return dict(conn.execute(
+            f'SELECT table_name, version FROM data_versions WHERE table_name IN ({placeholders})',
+            list(tables)
+        ).fetchall())
+
+def init_trigram_search(conn):
+    """
+    Create the trigram indexes behind substring search: one over user rule
+    descriptions, one over the distinct expense descriptions (with how many
+    expenses use each) for autocomplete. Both are kept in sync by triggers.
+    """
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'expense_descriptions'"
+    ).fetchone()
+    try:
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS user_overrides_fts USING fts5(
+                description, content='user_overrides', content_rowid='rowid', tokenize='trigram'
+            )
+        ''')
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS expense_descriptions_fts USING fts5(
+                description, content='expense_descriptions', content_rowid='id', tokenize='trigram'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"[WARNING] FTS5 trigram tokenizer not available, substring search will use LIKE scans: {e}")
+        return
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS expense_descriptions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            key TEXT NOT NULL UNIQUE,
+            description TEXT NOT NULL,
+            uses INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    for table, key in (('user_overrides', 'rowid'), ('expense_descriptions', 'id')):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO {table}_fts (rowid, description) VALUES (NEW.{key}, NEW.description);
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table}
+            BEGIN
+                INSERT INTO {table}_fts ({table}_fts, rowid, description) VALUES ('delete', OLD.{key}, OLD.description);
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF description ON {table}
+            BEGIN
+                INSERT INTO {table}_fts ({table}_fts, rowid, description) VALUES ('delete', OLD.{key}, OLD.description);
+                INSERT INTO {table}_fts (rowid, description) VALUES (NEW.{key}, NEW.description);
+            END
+        ''')
+
+    # Distinct descriptions keep the spelling they were first seen with
+    add_use = f'''
+        INSERT INTO expense_descriptions (key, description, uses)
+        SELECT {description_key_sql('NEW.description')}, {strip_sql('NEW.description')}, 1
+        WHERE {strip_sql("COALESCE(NEW.description, '')")} != ''
+        ON CONFLICT(key) DO UPDATE SET uses = uses + 1;
+    '''
+    drop_use = f'''
+        UPDATE expense_descriptions SET uses = uses - 1
+        WHERE key = {description_key_sql('OLD.description')};
+        DELETE FROM expense_descriptions
+        WHERE key = {description_key_sql('OLD.description')} AND uses <= 0;
+    '''
+    rekeyed = define_trigger(conn, 'expense_descriptions_insert', f'AFTER INSERT ON expenses BEGIN {add_use} END')
+    define_trigger(conn, 'expense_descriptions_delete', f'AFTER DELETE ON expenses BEGIN {drop_use} END')
+    define_trigger(conn, 'expense_descriptions_update', f'''
+        AFTER UPDATE OF description ON expenses
+        WHEN OLD.description IS NOT NEW.description
+        BEGIN {drop_use} {add_use} END
+    ''')
+
+    if not exists or rekeyed:
+        # Index expenses written before the search tables existed, or re-key
+        # them after the description key changed
+        conn.execute('DELETE FROM expense_descriptions')
+        conn.execute(f'''
+            INSERT INTO expense_descriptions (key, description, uses)
+            SELECT {DESCRIPTION_KEY}, MIN({strip_sql('description')}), COUNT(*) FROM expenses
+            WHERE {strip_sql("COALESCE(description, '')")} != ''
+            GROUP BY 1
+        ''')
+    if not exists:
+        conn.execute("INSERT INTO user_overrides_fts (user_overrides_fts) VALUES ('rebuild')")
+
+def has_trigram_search(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'expense_descriptions'"
+    ).fetchone() is not None
+
+# Trigrams need three characters; shorter search terms match as prefixes instead
+TRIGRAM_MIN_LENGTH = 3
+
+def trigram_match(term):
+    """FTS5 query matching a literal substring in a trigram index."""
+    return '"' + term.replace('"', '""') + '"'
+
+def prefix_range(prefix):
+    """(low, high) bounds such that low <= text < high exactly when text starts with prefix."""
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+def has_expense_search(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'expenses_fts'"
+    ).fetchone() is not None
@@ -1,8 +1,17 @@
-from flask import request, abort, jsonify
-from .database_service import get_db_connection
+from flask import request, abort, jsonify, Response, stream_with_context
+from .database_service import (
+    get_db_connection, parse_day_number, has_expense_search, has_trigram_search, trigram_match, prefix_range,
+    EXPENSE_SORT_KEYS, DESCRIPTION_KEY, TRIGRAM_MIN_LENGTH, strip_sql
+)
 from .category_service import guess_category, guess_need_category
-from . import user_rules_service
+from . import user_rules_service, archive_service, journal_service
+from .response_service import encode_rows
 import pandas as pd
+import base64
+import csv
+import io
+import json
+import re
 
 def read_csv(filepath):
     """Read and parse CSV file for expense data"""
@@ -26,11 +35,11 @@ def add_expense(req):
     outlier = int(bool(data.get('outlier', False)))
     if not date or not description or not amount:
         return jsonify({'error': 'Missing required fields'}), 400
-    if not category:
-        category = guess_category(description)
-    if not need_category:
-        need_category = guess_need_category(description, category)
     with get_db_connection() as conn:
+        if not category:
+            category = guess_category(description, conn)
+        if not need_category:
+            need_category = guess_need_category(description, category, conn)
         cur = conn.execute('''
             INSERT INTO expenses (date, description, amount, category, need_category, card, who, notes, split_cost, outlier)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
@@ -39,13 +48,24 @@ def add_expense(req):
         row_id = cur.lastrowid
     return jsonify({'success': True, 'id': row_id})
 
+def _missing_expense(row_id):
+    """404 for an unknown expense id, 409 for one in a year that has been archived."""
+    year = archive_service.archived_year_of(row_id)
+    if year is not None:
+        return jsonify({'error': f'Expense {row_id} is archived with {year}; restore the year to edit it'}), 409
+    return jsonify({'error': f'Expense {row_id} not found'}), 404
+
 def update_expense_category(row_id, req):
     data = req.get_json()
     new_cat = data.get('category')
     if not new_cat:
         abort(400, 'Missing category')
     with get_db_connection() as conn:
-        conn.execute('UPDATE expenses SET category = ? WHERE id = ?', (new_cat, row_id))
+        change = journal_service.begin(conn, 'expenses', 'id', [row_id])
+        cur = conn.execute('UPDATE expenses SET category = ? WHERE id = ?', (new_cat, row_id))
+        if cur.rowcount == 0:
+            return _missing_expense(row_id)
+        rules = _begin_override_change(conn, [row_id])
         cur = conn.execute('SELECT description FROM expenses WHERE id = ?', (row_id,))
         row = cur.fetchone()
         if row:
@@ -53,6 +73,9 @@ def update_expense_category(row_id, req):
             user_rules_service.update_user_override_for_expense(
                 row[0], category=new_cat, conn=conn
             )
+        journal_service.record(conn, 'patch', f'Set category of expense {row_id} to {new_cat}', [
+            journal_service.finish(conn, change), journal_service.finish(conn, rules)
+        ])
         conn.commit()
     return jsonify({'success': True, 'id': row_id, 'category': new_cat})
 
@@ -62,7 +85,11 @@ def update_expense_need_category(row_id, req):
     if not new_need:
         abort(400, 'Missing need_category')
     with get_db_connection() as conn:
-        conn.execute('UPDATE expenses SET need_category = ? WHERE id = ?', (new_need, row_id))
+        change = journal_service.begin(conn, 'expenses', 'id', [row_id])
+        cur = conn.execute('UPDATE expenses SET need_category = ? WHERE id = ?', (new_need, row_id))
+        if cur.rowcount == 0:
+            return _missing_expense(row_id)
+        rules = _begin_override_change(conn, [row_id])
         cur = conn.execute('SELECT description FROM expenses WHERE id = ?', (row_id,))
         row = cur.fetchone()
         if row:
@@ -70,6 +97,9 @@ def update_expense_need_category(row_id, req):
             user_rules_service.update_user_override_for_expense(
                 row[0], need_category=new_need, conn=conn
             )
+        journal_service.record(conn, 'patch', f'Set need category of expense {row_id} to {new_need}', [
+            journal_service.finish(conn, change), journal_service.finish(conn, rules)
+        ])
         conn.commit()
     return jsonify({'success': True, 'id': row_id, 'need_category': new_need})
 
@@ -86,8 +116,12 @@ def patch_expense(row_id, req):
         return jsonify({'error': 'No fields to update'}), 400
     values.append(row_id)
     with get_db_connection() as conn:
-        conn.execute(f"UPDATE expenses SET {', '.join(updates)} WHERE id = ?", values)
+        changes = [journal_service.begin(conn, 'expenses', 'id', [row_id])]
+        cur = conn.execute(f"UPDATE expenses SET {', '.join(updates)} WHERE id = ?", values)
+        if cur.rowcount == 0:
+            return _missing_expense(row_id)
         if 'category' in data or 'need_category' in data:
+            changes.append(_begin_override_change(conn, [row_id]))
             cur = conn.execute('SELECT description FROM expenses WHERE id = ?', (row_id,))
             row = cur.fetchone()
             if row:
@@ -97,12 +131,89 @@ def patch_expense(row_id, req):
                 user_rules_service.update_user_override_for_expense(
                     row[0], category=cat, need_category=need, conn=conn
                 )
+        journal_service.record(conn, 'patch', f'Edit expense {row_id}',
+                               [journal_service.finish(conn, change) for change in changes])
         conn.commit()
     return jsonify({'success': True, 'id': row_id})
 
+def _begin_override_change(conn, ids):
+    """Start journaling the user override rules keyed by these expenses' descriptions."""
+    keys = [row[0] for row in conn.execute(f'''
+        SELECT DISTINCT {DESCRIPTION_KEY} FROM expenses
+        WHERE id IN (SELECT value FROM json_each(?)) AND {DESCRIPTION_KEY} != ''
+    ''', (json.dumps(ids),))]
+    return journal_service.begin(conn, 'user_overrides', 'description', keys)
+
+def bulk_patch_expenses(req):
+    """
+    Apply one set of field changes to many expenses in a single transaction.
+
+    Expects {'ids': [...], 'changes': {field: value, ...}} with the same fields
+    patch_expense accepts. The rows are changed by one set-based UPDATE, and
+    category/need_category changes are learned as user overrides once per
+    distinct description. Returns the updated rows.
+    """
+    data = req.get_json() or {}
+    ids = data.get('ids')
+    changes = data.get('changes')
+    if not isinstance(ids, list) or not ids:
+        return jsonify({'error': 'Invalid or empty expense IDs list'}), 400
+    if not isinstance(changes, dict) or not changes:
+        return jsonify({'error': 'No fields to update'}), 400
+    try:
+        ids = [int(id) for id in ids]
+    except (ValueError, TypeError):
+        return jsonify({'error': 'All expense IDs must be valid integers'}), 400
+    fields = ['date', 'description', 'amount', 'category', 'need_category', 'card', 'who', 'notes', 'split_cost', 'outlier']
+    unknown = [f for f in changes if f not in fields]
+    if unknown:
+        return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+
+    updates = [f'{f} = ?' for f in changes]
+    values = list(changes.values())
+    # The whole id list is bound as one JSON parameter, so its size is not
+    # limited by SQLite's host parameter cap
+    id_set = 'SELECT value FROM json_each(?)'
+    ids_json = json.dumps(ids)
+    with get_db_connection() as conn:
+        journal = [journal_service.begin(conn, 'expenses', 'id', ids)]
+        cur = conn.execute(
+            f"UPDATE expenses SET {', '.join(updates)} WHERE id IN ({id_set})",
+            values + [ids_json]
+        )
+        updated = cur.rowcount
+        category = changes.get('category')
+        need_category = changes.get('need_category')
+        if category is not None or need_category is not None:
+            journal.append(_begin_override_change(conn, ids))
+            # Same merge as update_user_override_for_expense: a value left out keeps the existing rule's
+            conn.execute(f'''
+                INSERT INTO user_overrides (description, category, need_category)
+                SELECT DISTINCT {DESCRIPTION_KEY}, ?, ? FROM expenses
+                WHERE id IN ({id_set}) AND {DESCRIPTION_KEY} != ''
+                ON CONFLICT(description) DO UPDATE SET
+                    category = COALESCE(excluded.category, user_overrides.category),
+                    need_category = COALESCE(excluded.need_category, user_overrides.need_category)
+            ''', (category, need_category, ids_json))
+        journal_service.record(conn, 'bulk_update', f"Edit {updated} expense(s): {', '.join(changes)}",
+                               [journal_service.finish(conn, change) for change in journal])
+        conn.commit()
+        cur = conn.execute(f'SELECT * FROM expenses WHERE id IN ({id_set}) ORDER BY id', (ids_json,))
+        columns = [column[0] for column in cur.description]
+        rows = encode_rows(columns, cur.fetchall(), columnar=False)
+
+    return jsonify({
+        'success': True,
+        'updated_count': updated,
+        'requested_count': len(ids),
+        'expenses': rows
+    })
+
 def delete_expense(row_id):
     with get_db_connection() as conn:
+        change = journal_service.begin(conn, 'expenses', 'id', [row_id])
         conn.execute('DELETE FROM expenses WHERE id = ?', (row_id,))
+        journal_service.record(conn, 'delete', f'Delete expense {row_id}', [journal_service.finish(conn, change)])
         conn.commit()
     return jsonify({'success': True, 'message': f'Row {row_id} deleted.'})
 
@@ -124,9 +235,12 @@ def bulk_delete_expenses(req):
     
     deleted_count = 0
     with get_db_connection() as conn:
+        change = journal_service.begin(conn, 'expenses', 'id', ids)
         for expense_id in ids:
             cursor = conn.execute('DELETE FROM expenses WHERE id = ?', (expense_id,))
             deleted_count += cursor.rowcount
+        journal_service.record(conn, 'bulk_delete', f'Delete {deleted_count} expense(s)',
+                               [journal_service.finish(conn, change)])
         conn.commit()
     
     return jsonify({
@@ -136,22 +250,358 @@ def bulk_delete_expenses(req):
         'requested_count': len(ids)
     })
 
-def get_expenses():
-    """Fetch all expenses from the database and return as JSON list of dicts."""
+FILTER_COLUMNS = ('category', 'need_category', 'who', 'card')
+
+def expense_filters(args, prefix=''):
+    """
+    Translate listing query args into WHERE clauses on the expenses table.
+
+    Supports start_date/end_date (inclusive, on the indexed date_num column),
+    category/need_category/who/card (repeat the arg to match any of several
+    values), min_amount/max_amount, statement_id, and description/notes
+    (case-insensitive substring).
+
+    Returns (clauses, params, start_num, end_num); raises ValueError on bad input.
+    """
+    clauses, params = [], []
+    start_num = parse_day_number(args.get('start_date'))
+    end_num = parse_day_number(args.get('end_date'))
+    if start_num is not None:
+        clauses.append(f'{prefix}date_num >= ?')
+        params.append(start_num)
+    if end_num is not None:
+        clauses.append(f'{prefix}date_num <= ?')
+        params.append(end_num)
+
+    for column in FILTER_COLUMNS:
+        values = [v for v in args.getlist(column) if v != '']
+        if len(values) == 1:
+            clauses.append(f'{prefix}{column} = ?')
+            params.append(values[0])
+        elif values:
+            clauses.append(f"{prefix}{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+
+    if args.get('min_amount') not in (None, ''):
+        clauses.append(f'{prefix}amount_cents >= ?')
+        params.append(round(float(args.get('min_amount')) * 100))
+    if args.get('max_amount') not in (None, ''):
+        clauses.append(f'{prefix}amount_cents <= ?')
+        params.append(round(float(args.get('max_amount')) * 100))
+    if args.get('statement_id') not in (None, ''):
+        clauses.append(f'{prefix}statement_id = ?')
+        params.append(int(args.get('statement_id')))
+    for column in ('description', 'notes'):
+        if args.get(column):
+            clauses.append(f'instr(lower({prefix}{column}), ?) > 0')
+            params.append(args.get(column).lower())
+
+    return clauses, params, start_num, end_num
+
+def _encode_cursor(sort_value, row_id):
+    raw = json.dumps([sort_value, row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def _decode_cursor(cursor):
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return sort_value, int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def get_expenses(args):
+    """
+    Fetch expenses as JSON, filtered, sorted and optionally paginated on the server.
+
+    Without limit/cursor this returns the plain list of row dicts the UI has
+    always received. With limit (and then cursor) it returns one page:
+    {'items', 'next_cursor', 'has_more'} plus 'total' on the first page.
+    Pages are keyset-based on (sort key, id), so deep pages cost the same as
+    the first one. Archived years are unioned in only when the date range
+    reaches back into them.
+    """
+    sort = args.get('sort', 'date')
+    order = args.get('order', 'desc').lower()
+    if sort not in EXPENSE_SORT_KEYS:
+        return jsonify({'error': f'Invalid sort key: {sort}'}), 400
+    if order not in ('asc', 'desc'):
+        return jsonify({'error': f'Invalid sort order: {order}'}), 400
+    try:
+        clauses, params, start_num, end_num = expense_filters(args)
+        paginate = bool(args.get('limit') or args.get('cursor'))
+        limit = min(max(int(args.get('limit') or 100), 1), 1000)
+        cursor = _decode_cursor(args['cursor']) if args.get('cursor') else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    key = EXPENSE_SORT_KEYS[sort]
+    direction = 'DESC' if order == 'desc' else 'ASC'
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+
     with get_db_connection() as conn:
-        cur = conn.execute('SELECT * FROM expenses')
+        source = archive_service.expenses_source(conn, start_num, end_num)
+
+        if not paginate:
+            order_by = f' ORDER BY {key} {direction}, id {direction}' if 'sort' in args else ''
+            cur = conn.execute(f'SELECT * FROM {source}{where}{order_by}', params)
+            columns = [column[0] for column in cur.description]
+            return jsonify(encode_rows(columns, cur.fetchall()))
+
+        page_clauses, page_params = list(clauses), list(params)
+        if cursor:
+            # The plain bound on the key lets SQLite seek the sort index; the
+            # row-value comparison then breaks ties on id.
+            op = '<' if order == 'desc' else '>'
+            page_clauses.append(f"{key} {op}= ? AND ({key}, id) {op} (?, ?)")
+            page_params.extend([cursor[0], cursor[0], cursor[1]])
+        page_where = f" WHERE {' AND '.join(page_clauses)}" if page_clauses else ''
+
+        cur = conn.execute(f'''
+            SELECT *, {key} AS _sort_key FROM {source}{page_where}
+            ORDER BY {key} {direction}, id {direction}
+            LIMIT ?
+        ''', page_params + [limit + 1])
+        columns = [column[0] for column in cur.description]
+        rows = cur.fetchall()
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        # Drop the trailing _sort_key column once the cursor is taken from it
+        next_cursor = _encode_cursor(rows[-1][-1], rows[-1][columns.index('id')]) if has_more else None
+        result = {
+            'items': encode_rows(columns[:-1], [row[:-1] for row in rows]),
+            'has_more': has_more,
+            'next_cursor': next_cursor
+        }
+        # Counting is only needed once per listing, not on every page
+        if cursor is None:
+            result['total'] = conn.execute(f'SELECT COUNT(*) FROM {source}{where}', params).fetchone()[0]
+
+    return jsonify(result)
+
+# Columns written by the export, in order; the derived date_num/amount_cents are left out
+EXPORT_COLUMNS = ('id', 'date', 'description', 'amount', 'category', 'need_category',
+                  'card', 'who', 'notes', 'split_cost', 'outlier', 'statement_id')
+EXPORT_BATCH_SIZE = 1000
+
+def export_expenses(args):
+    """
+    Stream every expense matching the listing filters as NDJSON or CSV.
+
+    Rows are pulled from the cursor EXPORT_BATCH_SIZE at a time and each batch
+    is written out as one chunk, so memory stays flat however large the table.
+    Pass format=csv for CSV; the default is one JSON object per line.
+    """
+    fmt = args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return jsonify({'error': f'Invalid export format: {fmt}'}), 400
+    sort = args.get('sort', 'date')
+    order = args.get('order', 'asc').lower()
+    if sort not in EXPENSE_SORT_KEYS:
+        return jsonify({'error': f'Invalid sort key: {sort}'}), 400
+    if order not in ('asc', 'desc'):
+        return jsonify({'error': f'Invalid sort order: {order}'}), 400
+    try:
+        clauses, params, start_num, end_num = expense_filters(args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    key = EXPENSE_SORT_KEYS[sort]
+    direction = 'DESC' if order == 'desc' else 'ASC'
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+
+    def generate():
+        # The connection stays open for as long as the response is streaming
+        with get_db_connection() as conn:
+            source = archive_service.expenses_source(conn, start_num, end_num)
+            cur = conn.execute(f'''
+                SELECT {', '.join(EXPORT_COLUMNS)} FROM {source}{where}
+                ORDER BY {key} {direction}, id {direction}
+            ''', params)
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if fmt == 'csv':
+                writer.writerow(EXPORT_COLUMNS)
+                yield buffer.getvalue()
+            while True:
+                rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                if fmt == 'csv':
+                    buffer.seek(0)
+                    buffer.truncate()
+                    writer.writerows(rows)
+                    yield buffer.getvalue()
+                else:
+                    yield ''.join(json.dumps(dict(zip(EXPORT_COLUMNS, row))) + '\n' for row in rows)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv' if fmt == 'csv' else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename=expenses.{fmt}'}
+    )
+
+def _fts_query(text):
+    """Turn free text into an FTS5 query: every word must match, each as a prefix."""
+    tokens = re.findall(r'\w+', text.lower())
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+def search_expenses(query, args):
+    """Ranked, paginated full-text search over expense descriptions and notes.
+
+    Matches come from the expenses_fts index (prefix match on every word, ranked
+    by bm25) and accept the same filters as the /expenses listing. Archived years
+    are not indexed and therefore not searched.
+    """
+    match = _fts_query(query or '')
+    if not match:
+        return jsonify({'error': 'Search query is required'}), 400
+    try:
+        clauses, params, _, _ = expense_filters(args, prefix='e.')
+        page = max(int(args.get('page', 1)), 1)
+        page_size = min(max(int(args.get('page_size', 50)), 1), 500)
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    with get_db_connection() as conn:
+        if has_expense_search(conn):
+            source = 'expenses_fts JOIN expenses e ON e.id = expenses_fts.rowid'
+            clauses.insert(0, 'expenses_fts MATCH ?')
+            params.insert(0, match)
+            # Description hits outrank notes hits
+            order = 'bm25(expenses_fts, 2.0, 1.0), e.date_num DESC'
+        else:
+            source = 'expenses e'
+            for token in re.findall(r'\w+', query.lower()):
+                clauses.insert(0, "(lower(e.description) LIKE ? OR lower(COALESCE(e.notes, '')) LIKE ?)")
+                params[0:0] = [f'%{token}%', f'%{token}%']
+            order = 'e.date_num DESC'
+        where = ' AND '.join(clauses)
+
+        total = conn.execute(f'SELECT COUNT(*) FROM {source} WHERE {where}', params).fetchone()[0]
+        cur = conn.execute(f'''
+            SELECT e.* FROM {source}
+            WHERE {where}
+            ORDER BY {order}
+            LIMIT ? OFFSET ?
+        ''', params + [page_size, (page - 1) * page_size])
         rows = [dict(zip([column[0] for column in cur.description], row)) for row in cur.fetchall()]
-    return jsonify(rows)
+
+    return jsonify({
+        'results': rows,
+        'total': total,
+        'page': page,
+        'page_size': page_size,
+        'has_more': page * page_size < total
+    })
+
+# Default and largest number of description suggestions
+SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 50
+
+def suggest_descriptions(args):
+    """Distinct expense descriptions containing q, for autocomplete.
+
+    Matches come from the expense_descriptions trigram index (a term shorter
+    than a trigram matches descriptions starting with it). Descriptions that
+    start with the term rank first, then the most used ones.
+    """
+    term = (args.get('q') or '').strip().lower()
+    if not term:
+        return jsonify({'error': 'q is required'}), 400
+    try:
+        limit = min(max(int(args.get('limit', SUGGEST_LIMIT)), 1), MAX_SUGGEST_LIMIT)
+    except (ValueError, TypeError):
+        return jsonify({'error': 'limit must be an integer'}), 400
+
+    with get_db_connection() as conn:
+        if not has_trigram_search(conn):
+            rows = conn.execute(f'''
+                SELECT MIN({strip_sql('description')}), COUNT(*) FROM expenses
+                WHERE {DESCRIPTION_KEY} LIKE ?
+                GROUP BY {DESCRIPTION_KEY}
+                ORDER BY instr({DESCRIPTION_KEY}, ?) != 1, COUNT(*) DESC, length({DESCRIPTION_KEY})
+                LIMIT ?
+            ''', (f'%{term}%', term, limit)).fetchall()
+        elif len(term) < TRIGRAM_MIN_LENGTH:
+            rows = conn.execute('''
+                SELECT description, uses FROM expense_descriptions
+                WHERE key >= ? AND key < ?
+                ORDER BY uses DESC, length(key)
+                LIMIT ?
+            ''', (*prefix_range(term), limit)).fetchall()
+        else:
+            rows = conn.execute('''
+                SELECT d.description, d.uses FROM expense_descriptions_fts
+                JOIN expense_descriptions d ON d.id = expense_descriptions_fts.rowid
+                WHERE expense_descriptions_fts MATCH ?
+                ORDER BY instr(d.key, ?) != 1, d.uses DESC, length(d.key)
+                LIMIT ?
+            ''', (trigram_match(term), term, limit)).fetchall()
+
+    return jsonify({'suggestions': [{'description': description, 'count': uses} for description, uses in rows]})
+
+TOTALS_GROUP_COLUMNS = {
+    'category': 'category',
+    'need_category': 'need_category',
+    'who': 'who',
+    'card': 'card',
+    'month': 'date_num / 100',
+    'day': 'date_num',
+}
+
+def get_expense_totals(args):
+    """Sum and count expenses matching the listing filters, optionally grouped.
+
+    Sums are taken over integer cents so they are exact; the float amount is
+    derived from the cents total only at the end.
+    """
+    group_by = args.get('group_by')
+    if group_by and group_by not in TOTALS_GROUP_COLUMNS:
+        return jsonify({'error': f'Invalid group_by: {group_by}'}), 400
+    try:
+        clauses, params, start_num, end_num = expense_filters(args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+
+    with get_db_connection() as conn:
+        source = archive_service.expenses_source(conn, start_num, end_num)
+        if group_by:
+            key = TOTALS_GROUP_COLUMNS[group_by]
+            cur = conn.execute(f'''
+                SELECT {key} AS grp, COALESCE(SUM(amount_cents), 0), COUNT(*)
+                FROM {source}{where}
+                GROUP BY grp
+                ORDER BY grp
+            ''', params)
+            groups = [
+                {'key': row[0], 'total_cents': row[1], 'total': row[1] / 100, 'count': row[2]}
+                for row in cur.fetchall()
+            ]
+            total_cents = sum(g['total_cents'] for g in groups)
+            count = sum(g['count'] for g in groups)
+        else:
+            groups = None
+            total_cents, count = conn.execute(
+                f'SELECT COALESCE(SUM(amount_cents), 0), COUNT(*) FROM {source}{where}', params
+            ).fetchone()
+
+    result = {'total_cents': total_cents, 'total': total_cents / 100, 'count': count}
+    if groups is not None:
+        result['group_by'] = group_by
+        result['groups'] = groups
+    return jsonify(result)
 
 def insert_expenses(df, statement_id=None, default_spender=None):
     with get_db_connection() as conn:
         for _, row in df.iterrows():
             category = row.get('category')
             if not category or pd.isna(category):
-                category = guess_category(row.get('description'))
+                category = guess_category(row.get('description'), conn)
             need_category = row.get('need_category')
             if not need_category or pd.isna(need_category):
-                need_category = guess_need_category(row.get('description'), category)
+                need_category = guess_need_category(row.get('description'), category, conn)
             
             # Use default_spender if provided, otherwise default to 'Gautami'
             who = row.get('who')
@@ -1,8 +1,11 @@
 import sqlite3
 import json
+import threading
 from datetime import datetime, date
+import numpy as np
 from flask import jsonify
 from .database_service import get_db_connection
+from .response_service import encode_rows
 
 def add_monthly_offset(date_obj, months):
     """Add months to a date object"""
@@ -45,20 +48,8 @@ def get_all_income_records():
                 FROM income_records
                 ORDER BY start_date DESC
             ''')
-            records = cursor.fetchall()
-            
-            income_records = []
-            for record in records:
-                income_records.append({
-                    'id': record[0],
-                    'amount': record[1],
-                    'source': record[2],
-                    'user': record[3],
-                    'start_date': record[4],
-                    'end_date': record[5],
-                    'notes': record[6],
-                    'created_at': record[7]
-                })
+            columns = [column[0] for column in cursor.description]
+            income_records = encode_rows(columns, cursor.fetchall())
             
             return jsonify({'success': True, 'income_records': income_records})
     except Exception as e:
@@ -107,119 +98,147 @@ def delete_income_record(record_id):
         print(f"Error deleting income record: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def _interval_series(keys, cents, starts, ends, n):
+    """
+    Spread amounts active over [start, end) month offsets into one monthly
+    series per key, using a difference array and a prefix sum.
+
+    Returns (labels, totals, counts): totals and counts are (len(labels), n)
+    arrays of integer cents and of how many records were active.
+    """
+    labels = sorted(set(keys))
+    index = {label: i for i, label in enumerate(labels)}
+    codes = np.array([index[key] for key in keys], dtype=np.int64)
+    totals = np.zeros((len(labels), n + 1), dtype=np.int64)
+    counts = np.zeros((len(labels), n + 1), dtype=np.int64)
+    np.add.at(totals, (codes, starts), cents)
+    np.add.at(totals, (codes, ends), -cents)
+    np.add.at(counts, (codes, starts), 1)
+    np.add.at(counts, (codes, ends), -1)
+    return labels, np.cumsum(totals, axis=1)[:, :n], np.cumsum(counts, axis=1)[:, :n]
+
+def build_income_timeline(conn, first, last, by=('source',)):
+    """
+    Monthly income between two month indexes (inclusive) in one pass.
+
+    Each record's amount is spread over its active months (the stored
+    start_month/end_month indexes) per value of every column in `by`. All
+    overrides in the range come from one query; a month with overrides takes
+    their sum as its income instead of the records. Amounts are integer cents.
+    """
+    n = max(last - first + 1, 0)
+    columns = ''.join(f', {column}' for column in by)
+    records = conn.execute(f'''
+        SELECT amount, start_month, end_month{columns} FROM income_records
+        WHERE start_month IS NOT NULL
+    ''').fetchall()
+
+    cents = np.array([round(r[0] * 100) for r in records], dtype=np.int64)
+    # Offsets into the range, clipped to it; ends are exclusive
+    starts = np.clip(np.array([r[1] for r in records], dtype=np.int64) - first, 0, n)
+    ends = np.clip(np.array([r[2] + 1 if r[2] is not None else last + 1 for r in records], dtype=np.int64) - first, 0, n)
+    active = starts < ends
+    cents, starts, ends = cents[active], starts[active], ends[active]
+    kept = [r for r, keep in zip(records, active) if keep]
+
+    series = {
+        column: _interval_series([r[3 + i] for r in kept], cents, starts, ends, n)
+        for i, column in enumerate(by)
+    }
+    diff = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(diff, starts, cents)
+    np.add.at(diff, ends, -cents)
+    record_totals = np.cumsum(diff)[:n]
+
+    override_mask = np.zeros(n, dtype=bool)
+    override_totals = np.zeros(n, dtype=np.int64)
+    override_users = {}
+    override_notes = {}
+    for year, month, user, amount, notes in conn.execute('''
+        SELECT year, month, user, amount, notes FROM monthly_income_overrides
+        WHERE year * 12 + month - 1 BETWEEN ? AND ?
+        ORDER BY id
+    ''', (first, last)):
+        offset = year * 12 + month - 1 - first
+        override_mask[offset] = True
+        override_totals[offset] += round(amount * 100)
+        users = override_users.setdefault(offset, {})
+        users[user] = users.get(user, 0) + round(amount * 100)
+        if notes and offset not in override_notes:
+            override_notes[offset] = notes
+
+    return {
+        'first': first,
+        'series': series,
+        'record_totals': record_totals,
+        'override_mask': override_mask,
+        'override_users': override_users,
+        'override_notes': override_notes,
+        'totals': np.where(override_mask, override_totals, record_totals)
+    }
+
 def get_income_distribution(start_date=None, end_date=None):
     """Get income distribution data for charts/analytics"""
     try:
         with get_db_connection() as conn:
-            # Get all income records
-            cursor = conn.execute('''
-                SELECT amount, source, start_date, end_date
-                FROM income_records
-                ORDER BY start_date
-            ''')
-            records = cursor.fetchall()
-            
-            if not records:
+            earliest = conn.execute('SELECT MIN(start_date) FROM income_records').fetchone()[0]
+            if earliest is None:
                 return jsonify({
                     'success': True,
                     'monthly_data': [],
                     'source_breakdown': [],
                     'total_income': 0
                 })
-            
+
             # Determine date range
-            if not start_date:
-                start_date = datetime.fromisoformat(records[0][2]).date()
-            else:
-                start_date = datetime.fromisoformat(start_date).date()
-                
-            if not end_date:
-                end_date = date.today()
-            else:
-                end_date = datetime.fromisoformat(end_date).date()
-            
-            # Generate monthly data
-            monthly_data = []
-            source_totals = {}
-            total_income = 0
-            
-            current_date = start_date.replace(day=1)  # Start from first of month
-            
-            while current_date <= end_date:
-                month_income = 0
-                month_sources = {}
-                is_override = False
-                override_notes = None
-                
-                # First check for manual override for this month
-                cursor = conn.execute('''
-                    SELECT amount, notes FROM monthly_income_overrides 
-                    WHERE year = ? AND month = ?
-                ''', (current_date.year, current_date.month))
-                
-                override = cursor.fetchone()
-                
-                if override:
-                    # Use override values
-                    month_income = override[0]
-                    override_notes = override[1]
-                    is_override = True
-                    # Don't calculate from records when override exists
-                else:
-                    # Calculate from regular records
-                    for record in records:
-                        amount = record[0]
-                        source = record[1]
-                        record_start = datetime.fromisoformat(record[2]).date()
-                        record_end = datetime.fromisoformat(record[3]).date() if record[3] else None
-                        
-                        # Check if this record applies to current month (compare year/month only)
-                        record_start_ym = (record_start.year, record_start.month)
-                        record_end_ym = (record_end.year, record_end.month) if record_end else None
-                        current_ym = (current_date.year, current_date.month)
-                        
-                        # Record applies if: start <= current AND (no end OR end >= current)
-                        if record_start_ym <= current_ym and (record_end_ym is None or record_end_ym >= current_ym):
-                            month_income += amount
-                            month_sources[source] = month_sources.get(source, 0) + amount
-                            source_totals[source] = source_totals.get(source, 0) + amount
-
-                month_data = {
-                    'year': current_date.year,
-                    'month': current_date.month,
-                    'month_name': current_date.strftime('%B %Y'),
-                    'total_income': month_income,
-                    'sources': month_sources,
-                    'is_override': is_override
-                }
-                
-                if override_notes:
-                    month_data['notes'] = override_notes
-                    
-                monthly_data.append(month_data)
-                
-                total_income += month_income
-                
-                # Move to next month
-                current_date = add_monthly_offset(current_date, 1)
-            
-            # Prepare source breakdown
-            source_breakdown = [
-                {'source': source, 'total': total}
-                for source, total in source_totals.items()
-            ]
-            
-            return jsonify({
-                'success': True,
-                'monthly_data': monthly_data,
-                'source_breakdown': source_breakdown,
-                'total_income': total_income,
-                'date_range': {
-                    'start': start_date.isoformat(),
-                    'end': end_date.isoformat()
-                }
-            })
-            
+            start_date = datetime.fromisoformat(start_date or earliest).date()
+            end_date = datetime.fromisoformat(end_date).date() if end_date else date.today()
+            first = start_date.year * 12 + start_date.month - 1
+            last = end_date.year * 12 + end_date.month - 1
+            timeline = build_income_timeline(conn, first, last)
+
+        sources, source_cents, source_counts = timeline['series']['source']
+        # Records don't count in override months
+        override_mask = timeline['override_mask']
+        source_cents = np.where(override_mask, 0, source_cents)
+        source_counts = np.where(override_mask, 0, source_counts)
+
+        monthly_data = []
+        for offset, total in enumerate(timeline['totals'].tolist()):
+            year, month = divmod(first + offset, 12)
+            month += 1
+            month_data = {
+                'year': year,
+                'month': month,
+                'month_name': date(year, month, 1).strftime('%B %Y'),
+                'total_income': total / 100,
+                'sources': {
+                    source: int(source_cents[i, offset]) / 100
+                    for i, source in enumerate(sources) if source_counts[i, offset]
+                },
+                'is_override': bool(override_mask[offset])
+            }
+            if offset in timeline['override_notes']:
+                month_data['notes'] = timeline['override_notes'][offset]
+            monthly_data.append(month_data)
+
+        # Prepare source breakdown
+        source_breakdown = [
+            {'source': source, 'total': int(source_cents[i].sum()) / 100}
+            for i, source in enumerate(sources) if source_counts[i].any()
+        ]
+
+        return jsonify({
+            'success': True,
+            'monthly_data': monthly_data,
+            'source_breakdown': source_breakdown,
+            'total_income': int(timeline['totals'].sum()) / 100,
+            'date_range': {
+                'start': start_date.isoformat(),
+                'end': end_date.isoformat()
+            }
+        })
+
     except Exception as e:
         print(f"Error getting income distribution: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -257,68 +276,165 @@ def add_monthly_income_override(year, month, user, amount, notes=''):
         print(f"Error adding monthly income override: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
-def get_monthly_income_with_overrides(year, month):
-    """Get monthly income considering both regular records and manual overrides"""
-    try:
-        with get_db_connection() as conn:
-            # First check for manual override
-            cursor = conn.execute('''
-                SELECT amount, notes FROM monthly_income_overrides 
-                WHERE year = ? AND month = ?
-            ''', (year, month))
-            
-            override = cursor.fetchone()
-            
-            if override:
-                return jsonify({
-                    'success': True,
-                    'year': year,
-                    'month': month,
-                    'total_income': override[0],
-                    'notes': override[1],
-                    'is_override': True
-                })
-            
-            # No override, calculate from regular records
-            # Get all records and filter by year/month only
+class IncomeIntervalIndex:
+    """
+    Centered interval tree over income records' [start_month, end_month] ranges.
+
+    A point lookup walks one root-to-leaf path and, at each node, reads only
+    the sorted run of ranges that contain the month, so it touches the
+    records active in that month plus O(log n) nodes. Ongoing records
+    (end_month NULL) never end.
+    """
+    def __init__(self, records):
+        items = [(r['start_month'], r['end_month'] if r['end_month'] is not None else float('inf'), r)
+                 for r in records]
+        # A record that ends before it starts is never active
+        items = [item for item in items if item[0] <= item[1]]
+        self.size = len(items)
+        self._root = self._build(items)
+
+    def _build(self, items):
+        if not items:
+            return None
+        points = sorted(p for start, end, _ in items for p in (start, end) if p != float('inf'))
+        center = points[len(points) // 2]
+        left = [item for item in items if item[1] < center]
+        right = [item for item in items if item[0] > center]
+        here = [item for item in items if item[0] <= center <= item[1]]
+        return (
+            center,
+            sorted(here, key=lambda item: item[0]),
+            sorted(here, key=lambda item: item[1], reverse=True),
+            self._build(left),
+            self._build(right)
+        )
+
+    def at(self, month):
+        """Records whose range contains the month index, in id order."""
+        hits = []
+        node = self._root
+        while node:
+            center, by_start, by_end, left, right = node
+            if month < center:
+                for start, _, record in by_start:
+                    if start > month:
+                        break
+                    hits.append(record)
+                node = left
+            elif month > center:
+                for _, end, record in by_end:
+                    if end < month:
+                        break
+                    hits.append(record)
+                node = right
+            else:
+                hits.extend(record for _, _, record in by_start)
+                break
+        return sorted(hits, key=lambda record: record['id'])
+
+_income_index = None
+_income_index_version = None
+_income_index_lock = threading.Lock()
+
+def get_income_index(conn):
+    """The interval index over income records, rebuilt whenever income_records has changed."""
+    global _income_index, _income_index_version
+    # The version counter is bumped by triggers, so writes from any worker invalidate it
+    row = conn.execute("SELECT version FROM data_versions WHERE table_name = 'income_records'").fetchone()
+    version = row[0] if row else None
+    with _income_index_lock:
+        if _income_index is None or version != _income_index_version:
             cursor = conn.execute('''
-                SELECT amount, source, start_date, end_date
-                FROM income_records
+                SELECT id, amount, source, user, start_month, end_month FROM income_records
+                WHERE start_month IS NOT NULL
             ''')
-            
-            records = cursor.fetchall()
-            total_income = 0
-            sources = []
-            
-            for record in records:
-                amount = record[0]
-                source = record[1]
-                record_start = datetime.fromisoformat(record[2]).date()
-                record_end = datetime.fromisoformat(record[3]).date() if record[3] else None
-                
-                # Compare year/month only
-                record_start_ym = (record_start.year, record_start.month)
-                record_end_ym = (record_end.year, record_end.month) if record_end else None
-                target_ym = (year, month)
-                
-                # Record applies if: start <= target AND (no end OR end >= target)
-                if record_start_ym <= target_ym and (record_end_ym is None or record_end_ym >= target_ym):
-                    total_income += amount
-                    sources.append({'source': source, 'amount': amount})
-            
-            return jsonify({
-                'success': True,
-                'year': year,
-                'month': month,
-                'total_income': total_income,
-                'sources': sources,
+            columns = [column[0] for column in cursor.description]
+            _income_index = IncomeIntervalIndex([dict(zip(columns, row)) for row in cursor.fetchall()])
+            _income_index_version = version
+        return _income_index
+
+def _monthly_income(conn, month_indexes):
+    """Income for each month index: its overrides if it has any, else the records active in it."""
+    overrides = {}
+    for year, month, amount, notes in conn.execute('''
+        SELECT year, month, amount, notes FROM monthly_income_overrides
+        WHERE year * 12 + month - 1 IN (SELECT value FROM json_each(?))
+        ORDER BY id
+    ''', (json.dumps(month_indexes),)):
+        total, first_notes = overrides.get(year * 12 + month - 1, (0, None))
+        overrides[year * 12 + month - 1] = (total + round(amount * 100), first_notes or notes)
+    index = get_income_index(conn)
+
+    results = []
+    for month_index in month_indexes:
+        year, month = divmod(month_index, 12)
+        result = {'year': year, 'month': month + 1}
+        if month_index in overrides:
+            total, notes = overrides[month_index]
+            result.update({'total_income': total / 100, 'notes': notes, 'is_override': True})
+        else:
+            records = index.at(month_index)
+            result.update({
+                'total_income': sum(round(r['amount'] * 100) for r in records) / 100,
+                'sources': [{'source': r['source'], 'amount': r['amount']} for r in records],
                 'is_override': False
             })
-            
+        results.append(result)
+    return results
+
+def get_monthly_income_with_overrides(year, month):
+    """Get monthly income considering both regular records and manual overrides"""
+    try:
+        with get_db_connection() as conn:
+            result = _monthly_income(conn, [year * 12 + month - 1])[0]
+        return jsonify({'success': True, **result})
     except Exception as e:
         print(f"Error getting monthly income with overrides: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# Upper bound on months per batch request (50 years)
+MAX_BATCH_MONTHS = 600
+
+def parse_month_index(value):
+    """Parse 'YYYY-MM' into a month index, year * 12 + (month - 1)."""
+    year, month = str(value).split('-')[:2]
+    year, month = int(year), int(month)
+    if not 1 <= month <= 12:
+        raise ValueError(f'Invalid month: {value}')
+    return year * 12 + month - 1
+
+def get_monthly_income_batch(args):
+    """
+    Monthly income for many months in one call.
+
+    Takes months=YYYY-MM,YYYY-MM,... and/or an inclusive start=YYYY-MM and
+    end=YYYY-MM range, up to MAX_BATCH_MONTHS in total.
+    """
+    try:
+        month_indexes = [parse_month_index(v) for value in args.getlist('months') for v in value.split(',') if v]
+        if args.get('start') or args.get('end'):
+            if not (args.get('start') and args.get('end')):
+                raise ValueError('start and end must be given together')
+            first, last = parse_month_index(args['start']), parse_month_index(args['end'])
+            if last - first + 1 > MAX_BATCH_MONTHS:
+                raise ValueError(f'At most {MAX_BATCH_MONTHS} months per request')
+            month_indexes.extend(range(first, last + 1))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    month_indexes = sorted(set(month_indexes))
+    if not month_indexes:
+        return jsonify({'success': False, 'error': 'No months requested'}), 400
+    if len(month_indexes) > MAX_BATCH_MONTHS:
+        return jsonify({'success': False, 'error': f'At most {MAX_BATCH_MONTHS} months per request'}), 400
+
+    try:
+        with get_db_connection() as conn:
+            months = _monthly_income(conn, month_indexes)
+        return jsonify({'success': True, 'months': months})
+    except Exception as e:
+        print(f"Error getting monthly income batch: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 def delete_monthly_income_override(year, month):
     """Delete a monthly income override"""
     try:
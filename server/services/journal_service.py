@@ -0,0 +1,170 @@
+import json
+import os
+from flask import jsonify
+from .database_service import get_db_connection
+
+# Retention bounds for the undo journal; the newest entry is always kept
+JOURNAL_MAX_ENTRIES = int(os.environ.get('JOURNAL_MAX_ENTRIES', '100'))
+JOURNAL_MAX_BYTES = int(os.environ.get('JOURNAL_MAX_BYTES', str(32 * 1024 * 1024)))
+JOURNAL_MAX_AGE_DAYS = int(os.environ.get('JOURNAL_MAX_AGE_DAYS', '7'))
+
+def capture(conn, table, key, keys):
+    """Return the current rows of `table` whose `key` column is in `keys`, as dicts."""
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return []
+    cur = conn.execute(
+        f'SELECT * FROM {table} WHERE {key} IN (SELECT value FROM json_each(?))',
+        (json.dumps(keys),)
+    )
+    columns = [column[0] for column in cur.description]
+    return [dict(zip(columns, row)) for row in cur.fetchall()]
+
+def begin(conn, table, key, keys):
+    """Start tracking rows of a table before an operation changes them."""
+    return {'table': table, 'key': key, 'keys': list(dict.fromkeys(keys)), 'before': capture(conn, table, key, keys)}
+
+def finish(conn, change, new_keys=()):
+    """Take the after image of a tracked change; new_keys adds rows the operation created."""
+    change['keys'] = list(dict.fromkeys(change['keys'] + list(new_keys)))
+    change['after'] = capture(conn, change['table'], change['key'], change['keys'])
+    return change
+
+def record(conn, op, summary, changes):
+    """
+    Journal an operation on conn, inside the caller's transaction.
+
+    Each change holds the before and after images of only the rows the
+    operation touched, so an entry costs the size of the change. Recording a
+    new operation discards anything that was undone and not redone, then
+    prunes the journal to its entry, byte and age bounds.
+    """
+    changes = [
+        {'table': c['table'], 'key': c['key'], 'before': c['before'], 'after': c['after']}
+        for c in changes if c['before'] != c['after']
+    ]
+    if not changes:
+        return None
+    payload = json.dumps(changes)
+    conn.execute('DELETE FROM operation_journal WHERE undone = 1')
+    entry_id = conn.execute(
+        'INSERT INTO operation_journal (op, summary, changes, size) VALUES (?, ?, ?, ?)',
+        (op, summary, payload, len(payload))
+    ).lastrowid
+    _prune(conn, entry_id)
+    return entry_id
+
+def _prune(conn, newest_id):
+    conn.execute(
+        "DELETE FROM operation_journal WHERE id != ? AND created_at < datetime('now', ?)",
+        (newest_id, f'-{JOURNAL_MAX_AGE_DAYS} days')
+    )
+    # Keep the newest entries whose running size and count fit the bounds
+    conn.execute('''
+        DELETE FROM operation_journal WHERE id IN (
+            SELECT id FROM (
+                SELECT id,
+                       SUM(size) OVER (ORDER BY id DESC) AS running_size,
+                       ROW_NUMBER() OVER (ORDER BY id DESC) AS position
+                FROM operation_journal
+            )
+            WHERE id != ? AND (running_size > ? OR position > ?)
+        )
+    ''', (newest_id, JOURNAL_MAX_BYTES, JOURNAL_MAX_ENTRIES))
+
+def _rows_by_key(rows, key):
+    return {json.dumps(row[key]): row for row in rows}
+
+def _apply(conn, changes, target, current):
+    """
+    Put every tracked row back to its `target` image ('before' for undo,
+    'after' for redo), provided each still matches its `current` image.
+    Returns the name of the first table that no longer matches, or None.
+    """
+    for change in changes:
+        table, key = change['table'], change['key']
+        keys = [row[key] for row in change['before']] + [row[key] for row in change['after']]
+        now = _rows_by_key(capture(conn, table, key, keys), key)
+        if now != _rows_by_key(change[current], key):
+            return table
+
+    for change in changes:
+        table, key = change['table'], change['key']
+        remove = [row[key] for row in change[current]]
+        if remove:
+            conn.execute(
+                f'DELETE FROM {table} WHERE {key} IN (SELECT value FROM json_each(?))',
+                (json.dumps(remove),)
+            )
+        rows = change[target]
+        if rows:
+            columns = list(rows[0])
+            conn.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                [[row[column] for column in columns] for row in rows]
+            )
+    return None
+
+def _step(undo):
+    if undo:
+        query = 'SELECT id, op, summary, changes FROM operation_journal WHERE undone = 0 ORDER BY id DESC LIMIT 1'
+        target, current, verb = 'before', 'after', 'undo'
+    else:
+        query = 'SELECT id, op, summary, changes FROM operation_journal WHERE undone = 1 ORDER BY id ASC LIMIT 1'
+        target, current, verb = 'after', 'before', 'redo'
+
+    with get_db_connection() as conn:
+        entry = conn.execute(query).fetchone()
+        if not entry:
+            return jsonify({'success': False, 'error': f'Nothing to {verb}'}), 404
+        entry_id, op, summary, payload = entry
+        changes = json.loads(payload)
+        conflict = _apply(conn, changes, target, current)
+        if conflict:
+            conn.rollback()
+            return jsonify({
+                'success': False,
+                'error': f'Cannot {verb} "{summary or op}": {conflict} changed since'
+            }), 409
+        conn.execute('UPDATE operation_journal SET undone = ? WHERE id = ?', (int(undo), entry_id))
+        conn.commit()
+
+    if any(change['table'] == 'custom_categories' for change in changes):
+        from . import category_service
+        category_service.refresh_categories()
+
+    return jsonify({
+        'success': True,
+        'id': entry_id,
+        'op': op,
+        'summary': summary,
+        'rows': sum(len(change[target]) + len(change[current]) for change in changes)
+    })
+
+def undo():
+    """Revert the most recent journaled operation in one transaction."""
+    return _step(undo=True)
+
+def redo():
+    """Re-apply the most recently undone operation in one transaction."""
+    return _step(undo=False)
+
+def get_journal_status():
+    """What undo and redo would do next, for enabling the buttons."""
+    with get_db_connection() as conn:
+        undo_count, redo_count = conn.execute(
+            'SELECT COALESCE(SUM(undone = 0), 0), COALESCE(SUM(undone = 1), 0) FROM operation_journal'
+        ).fetchone()
+        next_undo = conn.execute(
+            'SELECT op, summary FROM operation_journal WHERE undone = 0 ORDER BY id DESC LIMIT 1'
+        ).fetchone()
+        next_redo = conn.execute(
+            'SELECT op, summary FROM operation_journal WHERE undone = 1 ORDER BY id ASC LIMIT 1'
+        ).fetchone()
+    return jsonify({
+        'success': True,
+        'undo_count': undo_count,
+        'redo_count': redo_count,
+        'next_undo': next_undo[1] or next_undo[0] if next_undo else None,
+        'next_redo': next_redo[1] or next_redo[0] if next_redo else None
+    })
@@ -0,0 +1,96 @@
+import gzip
+import threading
+from collections import OrderedDict
+from flask import request
+
+# Low-cardinality columns sent as an index into a per-column value list in columnar responses
+DICTIONARY_COLUMNS = {'category', 'need_category', 'card', 'who', 'source', 'user'}
+
+# Responses smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+
+_gzip_cache = OrderedDict()
+_gzip_cache_lock = threading.Lock()
+_GZIP_CACHE_ENTRIES = 32
+
+def clear_compression_cache():
+    with _gzip_cache_lock:
+        _gzip_cache.clear()
+
+def wants_columnar():
+    return request.args.get('format') == 'columnar'
+
+def encode_rows(columns, rows, columnar=None):
+    """
+    Encode query rows for a JSON response.
+
+    By default this is the familiar list of per-row dicts. With columnar=True
+    (or ?format=columnar on the request) column names are sent once and each
+    column becomes one array; columns in DICTIONARY_COLUMNS are further
+    encoded as indexes into a 'dictionaries' list of their distinct values.
+    """
+    if columnar is None:
+        columnar = wants_columnar()
+    if not columnar:
+        return [dict(zip(columns, row)) for row in rows]
+
+    data = [list(values) for values in zip(*rows)] if rows else [[] for _ in columns]
+    dictionaries = {}
+    for i, name in enumerate(columns):
+        if name not in DICTIONARY_COLUMNS:
+            continue
+        lookup = {}
+        values = []
+        codes = []
+        for value in data[i]:
+            code = lookup.get(value)
+            if code is None:
+                code = lookup[value] = len(values)
+                values.append(value)
+            codes.append(code)
+        data[i] = codes
+        dictionaries[name] = values
+
+    return {
+        'format': 'columnar',
+        'count': len(rows),
+        'columns': list(columns),
+        'dictionaries': dictionaries,
+        'data': data
+    }
+
+def compress_response(response):
+    """Gzip a JSON response when the client accepts it (used as an after_request hook)."""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype != 'application/json'
+            or 'gzip' not in request.headers.get('Accept-Encoding', '').lower()):
+        return response
+
+    body = response.get_data()
+    if len(body) < MIN_COMPRESS_BYTES:
+        return response
+
+    # Bodies with an ETag are immutable for that tag, so their gzip can be reused
+    etag, _ = response.get_etag()
+    compressed = None
+    if etag:
+        with _gzip_cache_lock:
+            compressed = _gzip_cache.get(etag)
+    if compressed is None:
+        compressed = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        if etag:
+            with _gzip_cache_lock:
+                _gzip_cache[etag] = compressed
+                while len(_gzip_cache) > _GZIP_CACHE_ENTRIES:
+                    _gzip_cache.popitem(last=False)
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Content-Length'] = str(len(compressed))
+    response.vary.add('Accept-Encoding')
+    if etag:
+        # A different encoding is a different representation for a strong validator
+        response.set_etag(etag + '-gzip')
+    return response
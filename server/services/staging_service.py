@@ -1,7 +1,8 @@
 from flask import request, abort, jsonify
 from .database_service import get_db_connection
 from .category_service import guess_category, guess_need_category
-from . import expense_service, user_rules_service
+from . import user_rules_service, journal_service
+from .response_service import encode_rows
 import pandas as pd
 import json
 
@@ -14,11 +15,11 @@ def save_staging_data(statement_id, df, metadata=None):
         for _, row in df.iterrows():
             category = row.get('category')
             if not category or pd.isna(category):
-                category = guess_category(row.get('description'))
+                category = guess_category(row.get('description'), conn)
             
             need_category = row.get('need_category')
             if not need_category or pd.isna(need_category):
-                need_category = guess_need_category(row.get('description'), category)
+                need_category = guess_need_category(row.get('description'), category, conn)
             
             # Default spender from metadata if provided
             who = row.get('who')
@@ -56,7 +57,7 @@ def save_staging_data(statement_id, df, metadata=None):
         
         conn.commit()
 
-def get_staging_data(statement_id):
+def get_staging_data(statement_id, columnar=False):
     """Get staging data for a specific statement"""
     with get_db_connection() as conn:
         # Get statement info
@@ -74,8 +75,8 @@ def get_staging_data(statement_id):
             'SELECT * FROM staging_expenses WHERE statement_id = ? ORDER BY date DESC', 
             (statement_id,)
         )
-        expenses = [dict(zip([column[0] for column in exp_cur.description], row)) 
-                   for row in exp_cur.fetchall()]
+        expenses = encode_rows([column[0] for column in exp_cur.description],
+                               exp_cur.fetchall(), columnar)
         
         # Get metadata
         meta_cur = conn.execute(
@@ -143,8 +144,8 @@ def recategorize_staging_expenses(statement_id):
         updates = []
         for row in cur.fetchall():
             staging_id, desc = row
-            new_cat = guess_category(desc)
-            new_need = guess_need_category(desc, new_cat)
+            new_cat = guess_category(desc, conn)
+            new_need = guess_need_category(desc, new_cat, conn)
             updates.append((new_cat, new_need, staging_id))
         
         conn.executemany('UPDATE staging_expenses SET category = ?, need_category = ? WHERE id = ?', updates)
@@ -153,49 +154,56 @@ def recategorize_staging_expenses(statement_id):
     return jsonify({'success': True, 'updated': len(updates)})
 
 def approve_staging_data(statement_id):
-    """Move staging data to the main expenses table using existing expense service logic"""
+    """Move staging data to the main expenses table in a single transaction.
+
+    Staging rows were already categorized when the statement was uploaded (and
+    possibly edited by the user since), so they are copied as-is with one
+    INSERT ... SELECT. The copy and the staging cleanup share one connection and
+    one commit, so a failure part way through leaves staging untouched.
+    """
     with get_db_connection() as conn:
-        # Get all staging expenses for this statement
+        journal = [
+            journal_service.begin(conn, table, key, [row[0] for row in conn.execute(
+                f'SELECT {key} FROM {table} WHERE statement_id = ?', (statement_id,)
+            )])
+            for table, key in (('expenses', 'id'), ('staging_expenses', 'id'), ('staging_metadata', 'statement_id'))
+        ]
+        meta_row = conn.execute(
+            'SELECT metadata FROM staging_metadata WHERE statement_id = ?',
+            (statement_id,)
+        ).fetchone()
+        metadata = json.loads(meta_row[0]) if meta_row else {}
+        default_spender = metadata.get('default_spender') or 'Gautami'
+
         cur = conn.execute('''
-            SELECT date, description, amount, category, need_category, card, who, notes, split_cost, outlier
-            FROM staging_expenses WHERE statement_id = ? ORDER BY date
-        ''', (statement_id,))
-        
-        staging_expenses = cur.fetchall()
-        
-        if not staging_expenses:
+            INSERT INTO expenses (date, description, amount, category, need_category, card, who, notes, split_cost, outlier, statement_id)
+            SELECT date, description, amount, category, need_category, card,
+                   COALESCE(NULLIF(who, ''), ?), notes,
+                   COALESCE(split_cost, 0), COALESCE(outlier, 0), statement_id
+            FROM staging_expenses
+            WHERE statement_id = ?
+            ORDER BY date, id
+        ''', (default_spender, statement_id))
+        approved_count = cur.rowcount
+
+        if approved_count == 0:
             return jsonify({'error': 'No staging expenses found for this statement'}), 404
-        
-        # Convert staging data to DataFrame format expected by expense_service
-        expense_data = []
-        for expense in staging_expenses:
-            expense_dict = {
-                'date': expense[0],
-                'description': expense[1],
-                'amount': expense[2],
-                'category': expense[3],
-                'need_category': expense[4],
-                'card': expense[5],
-                'who': expense[6],
-                'notes': expense[7],
-                'split_cost': expense[8],
-                'outlier': expense[9]
-            }
-            expense_data.append(expense_dict)
-        
-        # Create DataFrame
-        df = pd.DataFrame(expense_data)
-        
-        # Use existing expense service logic to insert the data
-        expense_service.insert_expenses(df, statement_id)
-        
+
         # Clean up staging data
         conn.execute('DELETE FROM staging_expenses WHERE statement_id = ?', (statement_id,))
         conn.execute('DELETE FROM staging_metadata WHERE statement_id = ?', (statement_id,))
-        
+
+        approved_ids = [row[0] for row in conn.execute(
+            'SELECT id FROM expenses WHERE statement_id = ?', (statement_id,)
+        )]
+        journal_service.record(conn, 'approve_staging', f'Approve {approved_count} expense(s) from statement {statement_id}', [
+            journal_service.finish(conn, journal[0], approved_ids),
+            journal_service.finish(conn, journal[1]),
+            journal_service.finish(conn, journal[2])
+        ])
         conn.commit()
-    
-    return jsonify({'success': True, 'message': f'Approved {len(staging_expenses)} expenses from statement {statement_id}'})
+
+    return jsonify({'success': True, 'message': f'Approved {approved_count} expenses from statement {statement_id}'})
 
 def cancel_staging_data(statement_id):
     """Cancel staging and delete the statement"""
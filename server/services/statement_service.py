@@ -70,6 +70,7 @@ def is_duplicate_statement(filename):
         cur = conn.execute('SELECT 1 FROM statements WHERE filename = ?', (filename,))
         return cur.fetchone() is not None
 from services.database_service import get_db_connection
+from services import archive_service
 import sqlite3
 
 def delete_all_expenses():
@@ -78,6 +79,7 @@ def delete_all_expenses():
         conn.execute('DELETE FROM statements')
         conn.execute('DELETE FROM user_overrides')
         conn.commit()
+    archive_service.remove_all_archives()
     return jsonify({'success': True, 'message': 'All data deleted.'})
 
 def delete_statement(statement_id):
@@ -85,4 +87,5 @@ def delete_statement(statement_id):
         conn.execute('DELETE FROM expenses WHERE statement_id = ?', (statement_id,))
         conn.execute('DELETE FROM statements WHERE id = ?', (statement_id,))
         conn.commit()
+    archive_service.delete_from_archives('statement_id = ?', (statement_id,))
     return {'success': True, 'message': f'Statement {statement_id} and its expenses deleted.'}
@@ -0,0 +1,191 @@
+from flask import jsonify
+from .database_service import get_db_connection, monthly_summary_select, SUMMARY_KEYS
+from . import archive_service
+
+def _parse_month(value):
+    """Parse 'YYYY-MM' (or 'YYYYMM') into a YYYYMM integer."""
+    if value is None or value == '':
+        return None
+    text = str(value).strip().replace('-', '')
+    if len(text) != 6 or not text.isdigit():
+        raise ValueError(f"Invalid month: {value}")
+    return int(text)
+
+def _month_label(month):
+    return f'{month // 100:04d}-{month % 100:02d}'
+
+def _shift_month(month, delta):
+    index = (month // 100) * 12 + (month % 100 - 1) + delta
+    return (index // 12) * 100 + index % 12 + 1
+
+def rebuild_monthly_summary():
+    """
+    Recompute expense_monthly_summary from the raw expenses table.
+
+    Returns a report of the groups where the incrementally maintained table
+    disagreed with the fresh aggregate (missing, extra or different values)
+    before replacing its contents.
+    """
+    with get_db_connection() as conn:
+        fresh = {row[:5]: row[5:] for row in conn.execute(monthly_summary_select())}
+        current = {row[:5]: row[5:] for row in conn.execute('SELECT * FROM expense_monthly_summary')}
+
+        columns = ('month',) + SUMMARY_KEYS
+        mismatches = []
+        for key in sorted(set(fresh) | set(current), key=lambda k: tuple(str(v) for v in k)):
+            if fresh.get(key) != current.get(key):
+                mismatches.append({
+                    'group': dict(zip(columns, key)),
+                    'expected': fresh.get(key),
+                    'found': current.get(key)
+                })
+
+        conn.execute('DELETE FROM expense_monthly_summary')
+        conn.execute(f'''
+            INSERT INTO expense_monthly_summary
+                (month, {', '.join(SUMMARY_KEYS)}, total_cents, count, min_cents, max_cents)
+            {monthly_summary_select()}
+        ''')
+        conn.commit()
+
+    return {
+        'success': True,
+        'groups': len(fresh),
+        'consistent': not mismatches,
+        'mismatches': mismatches[:100],
+        'mismatch_count': len(mismatches)
+    }
+
+def _summary_filters(args):
+    clauses, params = [], []
+    start_month = _parse_month(args.get('start_month'))
+    end_month = _parse_month(args.get('end_month'))
+    if start_month is not None:
+        clauses.append('month >= ?')
+        params.append(start_month)
+    if end_month is not None:
+        clauses.append('month <= ?')
+        params.append(end_month)
+    for key in SUMMARY_KEYS:
+        values = args.getlist(key)
+        if values:
+            clauses.append(f"{key} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+    return clauses, params
+
+def _combine(a, b, pick):
+    return b if a is None else a if b is None else pick(a, b)
+
+def _aggregate(conn, keys, where, params, start_month=None, end_month=None):
+    """
+    {(key values): [total_cents, count, min_cents, max_cents]} grouped by keys.
+
+    Hot months come from expense_monthly_summary. Archived years are not in
+    it, so the archives overlapping the month range are aggregated directly
+    and merged in, as cashflow does.
+    """
+    columns = ', '.join(keys)
+    groups = {}
+
+    def merge(rows):
+        for row in rows:
+            key, (total, count, low, high) = tuple(row[:len(keys)]), row[len(keys):]
+            if key not in groups:
+                groups[key] = [total, count, low, high]
+                continue
+            group = groups[key]
+            group[0] += total
+            group[1] += count
+            group[2] = _combine(group[2], low, min)
+            group[3] = _combine(group[3], high, max)
+
+    merge(conn.execute(f'''
+        SELECT {columns}, SUM(total_cents), SUM(count), MIN(min_cents), MAX(max_cents)
+        FROM expense_monthly_summary{where}
+        GROUP BY {columns}
+    ''', params).fetchall())
+
+    years = archive_service.years_for_range(
+        start_month * 100 if start_month is not None else None,
+        end_month * 100 + 99 if end_month is not None else None
+    )
+    summary_keys = ', '.join(f"COALESCE({k}, '') AS {k}" for k in SUMMARY_KEYS)
+    for _, schema in archive_service.each_archive(conn, years):
+        merge(conn.execute(f'''
+            SELECT {columns}, SUM(amount_cents), COUNT(*), MIN(amount_cents), MAX(amount_cents)
+            FROM (
+                SELECT date_num / 100 AS month, {summary_keys}, amount_cents FROM {schema}.expenses
+                WHERE date_num IS NOT NULL AND amount_cents IS NOT NULL
+            ){where}
+            GROUP BY {columns}
+        ''', params).fetchall())
+    return groups
+
+def get_monthly_summary(args):
+    """Monthly totals from the summary table and archives, grouped by month plus any of the summary keys."""
+    group_by = [g for g in args.get('group_by', '').split(',') if g]
+    invalid = [g for g in group_by if g not in SUMMARY_KEYS]
+    if invalid:
+        return jsonify({'success': False, 'error': f"Invalid group_by: {', '.join(invalid)}"}), 400
+    try:
+        clauses, params = _summary_filters(args)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+
+    with get_db_connection() as conn:
+        groups = _aggregate(conn, ['month'] + group_by, where, params,
+                            _parse_month(args.get('start_month')), _parse_month(args.get('end_month')))
+        rows = []
+        for key in sorted(groups):
+            entry = {'month': _month_label(key[0])}
+            entry.update(dict(zip(group_by, key[1:])))
+            total_cents, count, min_cents, max_cents = groups[key]
+            entry.update({
+                'total': total_cents / 100,
+                'count': count,
+                'min': min_cents / 100 if min_cents is not None else None,
+                'max': max_cents / 100 if max_cents is not None else None
+            })
+            rows.append(entry)
+    return jsonify({'success': True, 'group_by': group_by, 'months': rows})
+
+def get_summary_trends(args):
+    """Month-over-month and year-over-year change per month, from the summary table and archives."""
+    try:
+        clauses, params = _summary_filters(args)
+        start_month = _parse_month(args.get('start_month'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    # Widen the read by a year so the first requested months still have a comparison point
+    if start_month is not None:
+        idx = clauses.index('month >= ?')
+        params[idx] = _shift_month(start_month, -12)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+
+    with get_db_connection() as conn:
+        groups = _aggregate(conn, ['month'], where, params,
+                            _shift_month(start_month, -12) if start_month is not None else None,
+                            _parse_month(args.get('end_month')))
+    totals = {key[0]: group[0] for key, group in groups.items()}
+
+    def change(current, previous):
+        if previous is None:
+            return None
+        return {
+            'amount': (current - previous) / 100,
+            'percent': round((current - previous) / previous * 100, 2) if previous else None
+        }
+
+    months = []
+    for month in sorted(totals):
+        if start_month is not None and month < start_month:
+            continue
+        current = totals[month]
+        months.append({
+            'month': _month_label(month),
+            'total': current / 100,
+            'month_over_month': change(current, totals.get(_shift_month(month, -1))),
+            'year_over_year': change(current, totals.get(_shift_month(month, -12)))
+        })
+    return jsonify({'success': True, 'months': months})
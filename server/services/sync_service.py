@@ -0,0 +1,464 @@
+import hashlib
+import json
+import os
+import re
+import secrets
+import sqlite3
+import time
+from contextlib import closing
+from . import archive_service, journal_service
+from .backup_service import decode_value, encode_value, open_sealed, seal_bytes
+from .database_service import BACKUP_TABLES, DERIVED_COLUMNS, get_db_connection
+
+# Tables merged between devices, in apply order, with the columns that identify
+# a row on every device. Rows of tables without identity columns get a global
+# id made of the creating device's id and their local id.
+SYNC_TABLES = {
+    'statements': None,
+    'expenses': None,
+    'user_overrides': ('description',),
+    'custom_categories': ('name',),
+    'income_records': None,
+    'monthly_income_overrides': ('year', 'month', 'user'),
+}
+# Columns holding another synced table's local id; bundles carry its global id
+SYNC_REFERENCES = {('expenses', 'statement_id'): 'statements'}
+BUNDLE_SUFFIX = '.bundle.z.enc'
+_BUNDLE_RE = re.compile(r'^(\d+)' + re.escape(BUNDLE_SUFFIX) + '$')
+_CHUNK = 500
+
+def _has_local_id(table):
+    return BACKUP_TABLES[table] == 'id'
+
+def _fields(table, row):
+    """The synced columns of a row: all but the local id and derived columns."""
+    skip = set(DERIVED_COLUMNS.get(table, ()))
+    if _has_local_id(table):
+        skip.add('id')
+    return {column: value for column, value in row.items() if column not in skip}
+
+def _hash(value):
+    return hashlib.sha1(json.dumps(encode_value(value)).encode('utf-8')).hexdigest()[:16]
+
+# ---- device identity and clock ---------------------------------------------
+
+def _state(conn, key, default=None):
+    row = conn.execute('SELECT value FROM sync_state WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else default
+
+def _set_state(conn, key, value):
+    conn.execute(
+        'INSERT INTO sync_state (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+        (key, str(value))
+    )
+
+def _register(conn):
+    """This database's device id, created on first sync; returns (device, new)."""
+    device = _state(conn, 'device')
+    if device:
+        return device, False
+    device = secrets.token_hex(4)
+    _set_state(conn, 'device', device)
+    _set_state(conn, 'bundle', 0)
+    conn.execute("INSERT OR IGNORE INTO change_log_state (key, value) VALUES ('sync_seq', 0)")
+    return device, True
+
+def _clock(conn):
+    return tuple(map(int, _state(conn, 'clock', '0.0').split('.')))
+
+def _format_stamp(clock, device):
+    return f'{clock[0]:013d}.{clock[1]:06d}.{device}'
+
+def _observe(conn, stamp):
+    """Move the clock past a stamp merged from another device."""
+    remote = (int(stamp[:13]), int(stamp[14:20]))
+    if remote > _clock(conn):
+        _set_state(conn, 'clock', f'{remote[0]}.{remote[1]}')
+
+# ---- local changes ----------------------------------------------------------
+
+def _entries_by_key(conn, table, keys):
+    cur = conn.execute(
+        'SELECT gid, row_key, fields, deleted_stamp FROM sync_rows '
+        'WHERE table_name = ? AND row_key IN (SELECT value FROM json_each(?))',
+        (table, json.dumps(keys))
+    )
+    return {row[1]: row for row in cur.fetchall()}
+
+def _archived_keys(table, keys):
+    """The keys among these whose rows were moved into an archive on this device."""
+    if table != 'expenses' or not keys:
+        return set()
+    found = set()
+    for year in archive_service.list_archived_years():
+        try:
+            with closing(sqlite3.connect(archive_service.archive_path(year))) as archive:
+                found.update(row[0] for row in archive.execute(
+                    'SELECT id FROM expenses WHERE id IN (SELECT value FROM json_each(?))', (json.dumps(keys),)
+                ))
+        except sqlite3.OperationalError:
+            continue  # Archive without an expenses table yet
+    return found
+
+def _julian_ms(julian_day):
+    return int(round((julian_day - 2440587.5) * 86400000))
+
+def _refresh(conn, device, full):
+    """
+    Stamp local edits made since the last sync.
+
+    Rows written since then are found in the row change log (every row on
+    the first sync) and compared with their recorded field hashes: changed
+    fields get a new stamp, new rows a global id, vanished rows a tombstone.
+    Stamps are hybrid logical clock values, 'milliseconds.counter.device':
+    the time of the row's last write, unless that is not after the clock,
+    which has seen every stamp merged or written here; then the clock's time
+    with the counter bumped. Edits are thus ordered by when they were made,
+    and an edit made after merging another device's edit always wins over
+    it, even with clock skew. Rows moved into an archive here are not
+    tombstoned: archiving is local and must not delete them elsewhere.
+    Returns the number of rows stamped.
+    """
+    head = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM backup_changes').fetchone()[0]
+    since = conn.execute("SELECT value FROM change_log_state WHERE key = 'sync_seq'").fetchone()[0]
+    floor = latest = _clock(conn)
+    now = int(time.time() * 1000)
+
+    def stamp_at(ms):
+        nonlocal latest
+        clock = (ms, 0) if ms > floor[0] else (floor[0], floor[1] + 1)
+        latest = max(latest, clock)
+        return _format_stamp(clock, device)
+
+    changed_rows = 0
+    for table, identity in SYNC_TABLES.items():
+        key = BACKUP_TABLES[table]
+        if full:
+            written = {row[0]: now for row in conn.execute(
+                f'SELECT {key} FROM {table} UNION '
+                'SELECT row_key FROM sync_rows WHERE table_name = ? AND row_key IS NOT NULL', (table,)
+            )}
+        else:
+            written = {row[0]: _julian_ms(row[1]) if row[1] is not None else now for row in conn.execute(
+                'SELECT row_key, MAX(changed_at) FROM backup_changes '
+                'WHERE table_name = ? AND seq > ? AND seq <= ? GROUP BY row_key',
+                (table, since, head)
+            )}
+        keys = list(written)
+        for start in range(0, len(keys), _CHUNK):
+            chunk = keys[start:start + _CHUNK]
+            rows = {row[key]: row for row in journal_service.capture(conn, table, key, chunk)}
+            entries = _entries_by_key(conn, table, chunk)
+            archived = _archived_keys(table, [row_key for row_key in chunk if row_key not in rows])
+            for row_key in chunk:
+                row, entry = rows.get(row_key), entries.get(row_key)
+                if row is None:
+                    if entry and row_key not in archived:
+                        stamp = stamp_at(written[row_key])
+                        conn.execute(
+                            'UPDATE sync_rows SET row_key = NULL, deleted_stamp = ?, local_stamp = ? '
+                            'WHERE table_name = ? AND gid = ?', (stamp, stamp, table, entry[0])
+                        )
+                        changed_rows += 1
+                    continue
+
+                hashes = {column: _hash(value) for column, value in _fields(table, row).items()}
+                if entry:
+                    gid, old, resurrected = entry[0], json.loads(entry[2]), False
+                else:
+                    gid = f'{device}-{row_key}'
+                    old, resurrected = {}, False
+                    if identity:
+                        # A row re-created under the identity of a deleted one takes over its tombstone
+                        identity_gid = json.dumps([row[column] for column in identity])
+                        taken = conn.execute(
+                            'SELECT row_key, fields FROM sync_rows WHERE table_name = ? AND gid = ?',
+                            (table, identity_gid)
+                        ).fetchone()
+                        if not taken:
+                            gid = identity_gid
+                        elif taken[0] is None:
+                            gid, old, resurrected = identity_gid, json.loads(taken[1]), True
+                changed = [column for column, h in hashes.items()
+                           if resurrected or column not in old or old[column][0] != h]
+                if entry and not changed:
+                    continue
+                stamp = stamp_at(written[row_key])
+                fields = {column: [h, stamp if column in changed else old[column][1]] for column, h in hashes.items()}
+                conn.execute('''
+                    INSERT INTO sync_rows (table_name, gid, row_key, fields, local_stamp) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(table_name, gid) DO UPDATE SET
+                        row_key = excluded.row_key, fields = excluded.fields, local_stamp = excluded.local_stamp
+                ''', (table, gid, row_key, json.dumps(fields), stamp))
+                changed_rows += 1
+    if latest != floor:
+        _set_state(conn, 'clock', f'{latest[0]}.{latest[1]}')
+    conn.execute("UPDATE change_log_state SET value = ? WHERE key = 'sync_seq'", (head,))
+    return changed_rows
+
+# ---- bundles ----------------------------------------------------------------
+
+def _global_ref(conn, table, local_key):
+    if local_key is None:
+        return None
+    row = conn.execute(
+        'SELECT gid FROM sync_rows WHERE table_name = ? AND row_key = ?', (table, local_key)
+    ).fetchone()
+    return row[0] if row else None
+
+def _local_ref(conn, table, gid):
+    if gid is None:
+        return None
+    row = conn.execute(
+        'SELECT row_key FROM sync_rows WHERE table_name = ? AND gid = ?', (table, gid)
+    ).fetchone()
+    return row[0] if row else None
+
+def _export_bundle(conn, device, remote_dir):
+    """Write the rows stamped on this device since the last bundle as the next bundle file."""
+    cursor = _state(conn, 'exported', '')
+    items, latest = [], cursor
+    for table in SYNC_TABLES:
+        key = BACKUP_TABLES[table]
+        entries = conn.execute(
+            'SELECT gid, row_key, fields, deleted_stamp, local_stamp FROM sync_rows '
+            'WHERE table_name = ? AND local_stamp > ? ORDER BY local_stamp',
+            (table, cursor)
+        ).fetchall()
+        for start in range(0, len(entries), _CHUNK):
+            chunk = entries[start:start + _CHUNK]
+            rows = {row[key]: row for row in journal_service.capture(
+                conn, table, key, [entry[1] for entry in chunk if entry[1] is not None]
+            )}
+            for gid, row_key, fields, deleted_stamp, local_stamp in chunk:
+                latest = max(latest, local_stamp)
+                item = {'t': table, 'g': gid, 'x': deleted_stamp}
+                row = rows.get(row_key)
+                if row is not None:
+                    stamps = json.loads(fields)
+                    values = _fields(table, row)
+                    for (ref_table, column), target in SYNC_REFERENCES.items():
+                        if ref_table == table and column in values:
+                            values[column] = _global_ref(conn, target, values[column])
+                    item['f'] = {column: [encode_value(value), stamps[column][1]]
+                                 for column, value in values.items() if column in stamps}
+                items.append(item)
+    if not items:
+        return None
+
+    number = int(_state(conn, 'bundle', 0)) + 1
+    device_dir = os.path.join(remote_dir, device)
+    os.makedirs(device_dir, exist_ok=True)
+    name = f'{number:06d}{BUNDLE_SUFFIX}'
+    data = json.dumps({'device': device, 'number': number, 'rows': items}, separators=(',', ':')).encode('utf-8')
+    stored = seal_bytes(data, os.path.join(device_dir, name))
+    _set_state(conn, 'bundle', number)
+    _set_state(conn, 'exported', latest)
+    return {'file': f'{device}/{name}', 'rows': len(items), 'raw_bytes': len(data), 'stored_bytes': stored}
+
+def _insert_row(conn, table, values):
+    columns = list(values)
+    cur = conn.execute(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+        [values[column] for column in columns]
+    )
+    return cur.lastrowid if _has_local_id(table) else values[BACKUP_TABLES[table]]
+
+def _content_key(values):
+    return tuple(sorted((column, _hash(value)) for column, value in values.items()))
+
+def _adopt(conn, table, remote, claims):
+    """
+    The local row a remote row is the same as, on a device's first sync, or
+    None. Tables with identity columns match on those; other rows match
+    when every synced field is equal, each local row being claimed once.
+    Only rows without a global id yet can be adopted.
+    """
+    key, identity = BACKUP_TABLES[table], SYNC_TABLES[table]
+    unclaimed = f'{key} NOT IN (SELECT row_key FROM sync_rows WHERE table_name = ? AND row_key IS NOT NULL)'
+    if identity:
+        if any(column not in remote for column in identity):
+            return None
+        row = conn.execute(
+            f"SELECT {key} FROM {table} WHERE {' AND '.join(f'{column} IS ?' for column in identity)} AND {unclaimed}",
+            [remote[column][0] for column in identity] + [table]
+        ).fetchone()
+        return row[0] if row else None
+    if table not in claims:
+        claims[table] = {}
+        cur = conn.execute(f'SELECT * FROM {table} WHERE {unclaimed}', (table,))
+        columns = [column[0] for column in cur.description]
+        for row in cur:
+            row = dict(zip(columns, row))
+            claims[table].setdefault(_content_key(_fields(table, row)), []).append(row[key])
+    matches = claims[table].get(_content_key({column: value for column, (value, _) in remote.items()}))
+    return matches.pop(0) if matches else None
+
+def _apply_item(conn, item, stats, claims=None):
+    """
+    Merge one row from another device: each field keeps the value with the
+    later stamp, and the row stays deleted only if its latest delete is newer
+    than every field stamp. Field hashes are taken from the row as written,
+    so the merge is not mistaken for a local edit by the next refresh.
+
+    With claims (a device's first sync) a row new here first adopts the
+    local row it matches, see _adopt. Rows archived here are read-only, so
+    remote changes to them are skipped and counted.
+    """
+    table, gid = item['t'], item['g']
+    key = BACKUP_TABLES[table]
+    entry = conn.execute(
+        'SELECT row_key, fields, deleted_stamp FROM sync_rows WHERE table_name = ? AND gid = ?', (table, gid)
+    ).fetchone()
+    row_key, fields = (entry[0], json.loads(entry[1])) if entry else (None, {})
+    remote = {}
+    for column, (value, stamp) in item.get('f', {}).items():
+        value = decode_value(value)
+        if (table, column) in SYNC_REFERENCES:
+            value = _local_ref(conn, SYNC_REFERENCES[(table, column)], value)
+        remote[column] = (value, stamp)
+    adopted = False
+    if entry is None and claims is not None and remote:
+        row_key = _adopt(conn, table, remote, claims)
+        adopted = row_key is not None
+    elif row_key is not None and not conn.execute(f'SELECT 1 FROM {table} WHERE {key} = ?', (row_key,)).fetchone():
+        stats['archived'] += 1
+        return
+    won = {column: value for column, (value, stamp) in remote.items()
+           if column not in fields or stamp > fields[column][1]}
+    stamps = {column: fields[column][1] for column in fields}
+    stamps.update({column: remote[column][1] for column in won})
+    deleted_stamp = max([s for s in (entry[2] if entry else None, item.get('x')) if s], default=None)
+    dead = deleted_stamp is not None and deleted_stamp > max(stamps.values(), default='')
+
+    if dead:
+        if row_key is not None:
+            conn.execute(f'DELETE FROM {table} WHERE {key} = ?', (row_key,))
+            stats['deleted'] += 1
+        row_key, written = None, {}
+    elif row_key is None:
+        if not remote:
+            return
+        # New here, or deleted here and since edited elsewhere: the remote row is the only full copy
+        try:
+            row_key = _insert_row(conn, table, {column: value for column, (value, _) in remote.items()})
+        except sqlite3.IntegrityError as e:
+            stats['conflicts'].append({'table': table, 'gid': gid, 'error': str(e)})
+            return
+        written = remote
+        stats['inserted'] += 1
+    elif won:
+        conn.execute(
+            f"UPDATE {table} SET {', '.join(f'{column} = ?' for column in won)} WHERE {key} = ?",
+            [*won.values(), row_key]
+        )
+        written = won
+        stats['adopted' if adopted else 'updated'] += 1
+    else:
+        written = {}
+
+    if written:
+        row = journal_service.capture(conn, table, key, [row_key])[0]
+        for column in written:
+            fields[column] = [_hash(row[column]), stamps[column]]
+    conn.execute('''
+        INSERT INTO sync_rows (table_name, gid, row_key, fields, deleted_stamp) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(table_name, gid) DO UPDATE SET
+            row_key = excluded.row_key, fields = excluded.fields, deleted_stamp = excluded.deleted_stamp
+    ''', (table, gid, row_key, json.dumps(fields), deleted_stamp))
+
+def _import_bundles(conn, device, remote_dir, adopt=False):
+    """
+    Apply every bundle from other devices that has not been applied yet, in
+    order. With adopt, rows matching local ones take them over (see _adopt).
+    """
+    stats = {'bundles': 0, 'rows': 0, 'inserted': 0, 'updated': 0, 'adopted': 0, 'deleted': 0,
+             'archived': 0, 'conflicts': []}
+    claims = {} if adopt else None
+    if not os.path.isdir(remote_dir):
+        return stats
+    applied = dict(conn.execute('SELECT device, applied FROM sync_peers').fetchall())
+    for peer in sorted(os.listdir(remote_dir)):
+        peer_dir = os.path.join(remote_dir, peer)
+        if peer == device or not os.path.isdir(peer_dir):
+            continue
+        numbers = sorted(
+            int(match.group(1)) for match in map(_BUNDLE_RE.match, os.listdir(peer_dir)) if match
+        )
+        for number in numbers:
+            if number <= applied.get(peer, 0):
+                continue
+            bundle = json.loads(open_sealed(os.path.join(peer_dir, f'{number:06d}{BUNDLE_SUFFIX}')))
+            latest = ''
+            for item in bundle['rows']:
+                _apply_item(conn, item, stats, claims)
+                latest = max([latest, item.get('x') or ''] + [stamp for _, stamp in item.get('f', {}).values()])
+            if latest:
+                _observe(conn, latest)
+            stats['bundles'] += 1
+            stats['rows'] += len(bundle['rows'])
+            conn.execute(
+                'INSERT INTO sync_peers (device, applied) VALUES (?, ?) '
+                'ON CONFLICT(device) DO UPDATE SET applied = excluded.applied',
+                (peer, number)
+            )
+    return stats
+
+def sync(remote_dir):
+    """
+    Two-way merge with the other devices sharing remote_dir.
+
+    remote_dir holds one folder of numbered, encrypted change bundles per
+    device; a device only ever writes its own folder, so the folders never
+    conflict in git. In one transaction this stamps local edits, merges the
+    bundles of other devices not seen yet, then writes the rows edited here
+    since the last bundle as a new bundle. Only changed rows travel, and
+    concurrent edits to different fields of a row both survive.
+
+    Copies usually start out sharing rows, restored from the same backup or
+    imported from the same statements. So on a device's first sync the
+    other devices' bundles are merged first, adopting the local rows they
+    match, and only the rows left over get global ids of their own.
+    """
+    with get_db_connection() as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            device, new = _register(conn)
+            if new:
+                imported = _import_bundles(conn, device, remote_dir, adopt=True)
+                stamped = _refresh(conn, device, full=True)
+            else:
+                stamped = _refresh(conn, device, full=False)
+                imported = _import_bundles(conn, device, remote_dir)
+            # The merge's own writes are already recorded
+            conn.execute('''
+                UPDATE change_log_state SET value = (SELECT COALESCE(MAX(seq), 0) FROM backup_changes)
+                WHERE key = 'sync_seq'
+            ''')
+            exported = _export_bundle(conn, device, remote_dir)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    if imported['rows']:
+        from . import category_service
+        category_service.refresh_categories()
+    return {'device': device, 'stamped': stamped, 'imported': imported, 'exported': exported}
+
+def get_sync_status(remote_dir):
+    """This device's id and bundle count, and how far behind each other device it is."""
+    with get_db_connection() as conn:
+        device = _state(conn, 'device')
+        bundle = int(_state(conn, 'bundle', 0))
+        applied = dict(conn.execute('SELECT device, applied FROM sync_peers').fetchall())
+        tracked, tombstones = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(row_key IS NULL), 0) FROM sync_rows'
+        ).fetchone()
+    peers = {}
+    if os.path.isdir(remote_dir):
+        for peer in sorted(os.listdir(remote_dir)):
+            peer_dir = os.path.join(remote_dir, peer)
+            if peer != device and os.path.isdir(peer_dir):
+                numbers = [int(m.group(1)) for m in map(_BUNDLE_RE.match, os.listdir(peer_dir)) if m]
+                peers[peer] = {'bundles': max(numbers, default=0), 'applied': applied.get(peer, 0)}
+    return {'device': device, 'bundles': bundle, 'tracked_rows': tracked, 'tombstones': tombstones, 'peers': peers}
@@ -1,6 +1,229 @@
-import sqlite3
-from flask import jsonify
-from .database_service import get_db_connection
+import csv
+import io
+import json
+import re
+import threading
+from functools import lru_cache
+from flask import jsonify, Response, stream_with_context
+from .database_service import (
+    get_db_connection, has_trigram_search, trigram_match, prefix_range, DESCRIPTION_KEY, TRIGRAM_MIN_LENGTH
+)
+from . import journal_service
+
+# Rule kinds, in the order they take precedence when several rules match
+MATCH_TYPES = ('exact', 'normalized', 'prefix', 'regex')
+
+# ASCII only, like SQLite's lower(), so normalized_description_sql agrees with it
+_TOKEN = re.compile(r"[a-z0-9]+(?:['&][a-z0-9]+)*", re.IGNORECASE | re.ASCII)
+
+def normalize_description(text):
+    """
+    Lowercased words of a description without the tokens that contain
+    digits, so store numbers, dates and reference codes drop out:
+    'UBER *TRIP 8H2K' and 'Uber Trip 9QX1' both become 'uber trip'.
+    Expenses and staging rows store this in description_norm.
+    """
+    return ' '.join(token.lower() for token in _TOKEN.findall(text or '')
+                    if not any(c.isdigit() for c in token))
+
+def rule_key(description, match_type='exact'):
+    """The stored description of a rule of this match type; raises ValueError if it can't match anything."""
+    if match_type not in MATCH_TYPES:
+        raise ValueError(f"Invalid match_type: {match_type} (expected one of {', '.join(MATCH_TYPES)})")
+    description = (description or '').strip()
+    if match_type == 'normalized':
+        key = normalize_description(description)
+    elif match_type == 'regex':
+        key = description
+        try:
+            compiled = re.compile(f'(?:{key})')
+        except re.error as e:
+            raise ValueError(f'Invalid regex: {e}')
+        # Rules are combined into one expression, which renames and renumbers groups
+        if compiled.groupindex or re.search(r'\\[1-9]', key):
+            raise ValueError('Regex rules cannot use named groups or backreferences')
+    else:
+        key = description.lower()
+    if not key:
+        raise ValueError('Description is required' if match_type != 'normalized'
+                         else 'Description has no words left after normalization')
+    return key
+
+class RuleMatcher:
+    """
+    User rules of every match type, compiled for one lookup per description.
+
+    Precedence: an exact rule wins, then a normalized rule, then the longest
+    matching prefix (found by walking a character trie), then the first
+    regex rule that matches, longest pattern first. All regex rules are
+    tried by one combined expression whose alternatives are anchored at the
+    start, so the earliest alternative that matches anywhere wins.
+    """
+    def __init__(self, rules):
+        self.size = len(rules)
+        self._exact = {}
+        self._normalized = {}
+        self._trie = {}
+        regexes = []
+        for description, match_type, value in rules:
+            if match_type == 'normalized':
+                self._normalized[description] = value
+            elif match_type == 'prefix':
+                node = self._trie
+                for char in description:
+                    node = node.setdefault(char, {})
+                node[None] = (description, value)
+            elif match_type == 'regex':
+                try:
+                    re.compile(f'(?:{description})')
+                except re.error:
+                    continue  # Not written through rule_key; never matches
+                regexes.append((description, value))
+            else:
+                self._exact[description] = value
+
+        regexes.sort(key=lambda rule: (-len(rule[0]), rule[0]))
+        self._regex_rules = regexes
+        self._regex = re.compile(
+            '|'.join(f'(?P<r{i}>.*?(?:{pattern}))' for i, (pattern, _) in enumerate(regexes)),
+            re.IGNORECASE | re.DOTALL
+        ) if regexes else None
+
+    def match(self, description):
+        """(value, match_type, rule description) of the rule that applies, or None."""
+        desc = (description or '').strip()
+        lowered = desc.lower()
+        if lowered in self._exact:
+            return self._exact[lowered], 'exact', lowered
+        if self._normalized:
+            normalized = normalize_description(desc)
+            if normalized in self._normalized:
+                return self._normalized[normalized], 'normalized', normalized
+        if self._trie:
+            node, longest = self._trie, None
+            for char in lowered:
+                node = node.get(char)
+                if node is None:
+                    break
+                longest = node.get(None, longest)
+            if longest:
+                return longest[1], 'prefix', longest[0]
+        if self._regex:
+            found = self._regex.match(desc)
+            if found:
+                pattern, value = self._regex_rules[int(found.lastgroup[1:])]
+                return value, 'regex', pattern
+        return None
+
+_matchers = None
+_matchers_version = None
+_matchers_lock = threading.Lock()
+
+def get_rule_matchers(conn):
+    """{'category': RuleMatcher, 'need_category': RuleMatcher}, recompiled whenever user_overrides has changed."""
+    global _matchers, _matchers_version
+    # The version counter is bumped by triggers, so writes from any worker invalidate it
+    row = conn.execute("SELECT version FROM data_versions WHERE table_name = 'user_overrides'").fetchone()
+    version = row[0] if row else None
+    with _matchers_lock:
+        if _matchers is None or version != _matchers_version:
+            _matchers = _compile_matchers(conn)
+            _matchers_version = version
+        return _matchers
+
+def _compile_matchers(conn):
+    rows = conn.execute('SELECT description, match_type, category, need_category FROM user_overrides').fetchall()
+    return {
+        'category': RuleMatcher([(r[0], r[1], r[2]) for r in rows if r[2]]),
+        'need_category': RuleMatcher([(r[0], r[1], r[3]) for r in rows if r[3]])
+    }
+
+def match_user_rule(conn, description, field):
+    """The category or need_category the user rules assign to a description, or None."""
+    hit = get_rule_matchers(conn)[field].match(description)
+    return hit[0] if hit else None
+
+# Tables a rule can be applied to after the fact
+RULE_TARGET_TABLES = ('expenses', 'staging_expenses')
+
+def _regexp(pattern, text):
+    """SQLite REGEXP: whether a regex rule's pattern matches, as RuleMatcher tries it."""
+    return text is not None and _compiled_rule(pattern).search(text) is not None
+
+@lru_cache(maxsize=64)
+def _compiled_rule(pattern):
+    return re.compile(pattern, re.IGNORECASE | re.DOTALL)
+
+def _candidate_keys(conn, table, desc_norm, match_type):
+    """
+    Distinct description keys in a table the rule matches, found in SQL:
+    prefix rules by a range over the description key index, normalized rules
+    by the description_norm index, regex rules by REGEXP once per distinct key.
+    """
+    if match_type == 'exact':
+        return [desc_norm]
+    if match_type == 'prefix':
+        cursor = conn.execute(
+            f'SELECT DISTINCT {DESCRIPTION_KEY} FROM {table} WHERE {DESCRIPTION_KEY} >= ? AND {DESCRIPTION_KEY} < ?',
+            prefix_range(desc_norm)
+        )
+    elif match_type == 'normalized':
+        cursor = conn.execute(f'SELECT DISTINCT {DESCRIPTION_KEY} FROM {table} WHERE description_norm = ?', (desc_norm,))
+    else:
+        conn.create_function('regexp', 2, _regexp, deterministic=True)
+        cursor = conn.execute(f'''
+            SELECT {DESCRIPTION_KEY} FROM {table} GROUP BY 1
+            HAVING {DESCRIPTION_KEY} != '' AND {DESCRIPTION_KEY} REGEXP ?
+        ''', (desc_norm,))
+    return [row[0] for row in cursor]
+
+def _apply_rule(conn, desc_norm, journal):
+    """
+    Set a rule's category and need category on the existing expenses and
+    staging rows it matches, inside the caller's transaction.
+
+    A row only takes the rule's value for a field if this rule is the one
+    that wins for its description under the matching precedence. The
+    matching description keys are found first, then each table is changed
+    by one UPDATE over the description key index. Tracked row changes are
+    appended to `journal`; returns {table: rows changed}.
+    """
+    match_type, category, need_category = conn.execute(
+        'SELECT match_type, category, need_category FROM user_overrides WHERE description = ?', (desc_norm,)
+    ).fetchone()
+    # Compiled from this transaction's view of the rules, not the shared cache
+    matchers = _compile_matchers(conn)
+    values = {field: value for field, value in (('category', category), ('need_category', need_category)) if value}
+
+    applied = {}
+    for table in RULE_TARGET_TABLES:
+        keys = _candidate_keys(conn, table, desc_norm, match_type)
+        won = {}
+        for field in values:
+            hits = ((key, matchers[field].match(key)) for key in keys)
+            won[field] = [key for key, hit in hits if hit and hit[2] == desc_norm]
+        all_keys = sorted(set().union(*won.values())) if won else []
+        if not all_keys:
+            applied[table] = 0
+            continue
+
+        ids = [row[0] for row in conn.execute(
+            f'SELECT id FROM {table} WHERE {DESCRIPTION_KEY} IN (SELECT value FROM json_each(?))',
+            (json.dumps(all_keys),)
+        )]
+        change = journal_service.begin(conn, table, 'id', ids)
+        updates, params = [], []
+        for field, value in values.items():
+            updates.append(f'{field} = CASE WHEN {DESCRIPTION_KEY} IN (SELECT value FROM json_each(?)) THEN ? ELSE {field} END')
+            params += [json.dumps(won[field]), value]
+        conn.execute(
+            f"UPDATE {table} SET {', '.join(updates)} WHERE {DESCRIPTION_KEY} IN (SELECT value FROM json_each(?))",
+            params + [json.dumps(all_keys)]
+        )
+        journal.append(journal_service.finish(conn, change))
+        before = {row['id']: row for row in change['before']}
+        applied[table] = sum(1 for row in change['after'] if row != before.get(row['id']))
+    return applied
 
 def update_user_override_for_expense(description, category=None, need_category=None, conn=None):
     """
@@ -25,107 +248,146 @@ def update_user_override_for_expense(description, category=None, need_category=N
         with get_db_connection() as new_conn:
             _update_override_with_conn(new_conn, desc_norm, category, need_category)
 
-def _update_override_with_conn(conn, desc_norm, category=None, need_category=None):
+def _update_override_with_conn(conn, desc_norm, category=None, need_category=None, match_type='exact'):
     """
     Helper function to update or insert user overrides with a given connection.
     This is the core logic used by both API endpoints and internal expense updates.
+    An existing rule keeps its match type.
     """
     # Get existing rule to merge with new data
     existing = conn.execute(
         'SELECT category, need_category FROM user_overrides WHERE description = ?',
         (desc_norm,)
     ).fetchone()
-    
+
     # Determine final values (new values override existing ones)
     final_category = category if category is not None else (existing[0] if existing else None)
     final_need_category = need_category if need_category is not None else (existing[1] if existing else None)
-    
+
     # Update or insert the rule with merged data
     if final_category is not None or final_need_category is not None:
         conn.execute('''
-            INSERT OR REPLACE INTO user_overrides (description, category, need_category) 
-            VALUES (?, ?, ?)
-        ''', (desc_norm, final_category, final_need_category))
+            INSERT INTO user_overrides (description, category, need_category, match_type)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(description) DO UPDATE SET
+                category = excluded.category,
+                need_category = excluded.need_category
+        ''', (desc_norm, final_category, final_need_category, match_type))
+
+def _find_rule(conn, description):
+    """Stored description of the rule a client refers to: regex rules keep their case, others are lowercased."""
+    description = (description or '').strip()
+    row = conn.execute(
+        'SELECT description FROM user_overrides WHERE description IN (?, ?) ORDER BY description = ? DESC',
+        (description, description.lower(), description)
+    ).fetchone()
+    return row[0] if row else None
+
+def _user_rules(cursor):
+    return [{
+        'description': row[0],
+        'category': row[1] if row[1] else '',
+        'need_category': row[2] if row[2] else '',
+        'match_type': row[3]
+    } for row in cursor.fetchall()]
 
 def get_all_user_rules():
     """Get all user override rules from the database."""
     try:
         with get_db_connection() as conn:
             cursor = conn.execute('''
-                SELECT description, category, need_category 
-                FROM user_overrides 
+                SELECT description, category, need_category, match_type
+                FROM user_overrides
                 ORDER BY description
             ''')
-            user_rules = []
-            for row in cursor.fetchall():
-                user_rules.append({
-                    'description': row[0],
-                    'category': row[1] if row[1] else '',
-                    'need_category': row[2] if row[2] else ''
-                })
-            return jsonify({'success': True, 'user_rules': user_rules})
+            return jsonify({'success': True, 'user_rules': _user_rules(cursor)})
     except Exception as e:
         print(f"Error fetching user rules: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
-def add_user_rule(description, category=None, need_category=None):
-    """Add a new user override rule."""
+def _save_rule(conn, desc_norm, category, need_category, match_type='exact', apply=False):
+    """
+    Write a rule; with apply, also apply it to the existing rows it matches
+    and journal the rule and row changes as one undoable operation.
+    Returns {table: rows changed} when applied.
+    """
+    if not apply:
+        _update_override_with_conn(conn, desc_norm, category, need_category, match_type)
+        return None
+    rule_change = journal_service.begin(conn, 'user_overrides', 'description', [desc_norm])
+    _update_override_with_conn(conn, desc_norm, category, need_category, match_type)
+    row_changes = []
+    applied = _apply_rule(conn, desc_norm, row_changes)
+    journal_service.record(
+        conn, 'apply_rule', f'Apply rule "{desc_norm}" to {sum(applied.values())} row(s)',
+        [journal_service.finish(conn, rule_change)] + row_changes
+    )
+    return applied
+
+def add_user_rule(description, category=None, need_category=None, match_type='exact', apply=False):
+    """Add a new user override rule of the given match type, optionally applying it to existing rows."""
     if not description or not description.strip():
         return jsonify({'success': False, 'error': 'Description is required'}), 400
-    
-    desc_norm = description.strip().lower()
-    
+
+    try:
+        desc_norm = rule_key(description, match_type)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
     try:
         with get_db_connection() as conn:
             # Check if rule already exists (for API validation)
             existing = conn.execute(
-                'SELECT description FROM user_overrides WHERE description = ?', 
+                'SELECT description FROM user_overrides WHERE description = ?',
                 (desc_norm,)
             ).fetchone()
-            
+
             if existing:
                 return jsonify({'success': False, 'error': 'User rule already exists for this description'}), 409
-            
+
             # Use the consolidated function to insert the rule
-            _update_override_with_conn(conn, desc_norm, category, need_category)
+            applied = _save_rule(conn, desc_norm, category, need_category, match_type, apply)
             conn.commit()
-            
-            return jsonify({
-                'success': True, 
-                'message': f'User rule added successfully for "{description}"'
-            })
-            
+
+            result = {
+                'success': True,
+                'message': f'User rule added successfully for "{desc_norm}"',
+                'description': desc_norm,
+                'match_type': match_type
+            }
+            if applied is not None:
+                result['applied'] = applied
+            return jsonify(result)
+
     except Exception as e:
         print(f"Error adding user rule: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
-def update_user_rule(description, category=None, need_category=None):
-    """Update an existing user override rule."""
+def update_user_rule(description, category=None, need_category=None, apply=False):
+    """Update an existing user override rule, optionally applying it to existing rows."""
     if not description or not description.strip():
         return jsonify({'success': False, 'error': 'Description is required'}), 400
-    
-    desc_norm = description.strip().lower()
-    
+
     try:
         with get_db_connection() as conn:
             # Check if rule exists (for API validation)
-            existing = conn.execute(
-                'SELECT description FROM user_overrides WHERE description = ?', 
-                (desc_norm,)
-            ).fetchone()
-            
-            if not existing:
+            desc_norm = _find_rule(conn, description)
+
+            if not desc_norm:
                 return jsonify({'success': False, 'error': 'User rule not found'}), 404
-            
+
             # Use the consolidated function to update the rule (preserves existing data)
-            _update_override_with_conn(conn, desc_norm, category, need_category)
+            applied = _save_rule(conn, desc_norm, category, need_category, apply=apply)
             conn.commit()
-            
-            return jsonify({
-                'success': True, 
+
+            result = {
+                'success': True,
                 'message': f'User rule updated successfully for "{description}"'
-            })
-            
+            }
+            if applied is not None:
+                result['applied'] = applied
+            return jsonify(result)
+
     except Exception as e:
         print(f"Error updating user rule: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -134,59 +396,281 @@ def delete_user_rule(description):
     """Delete a user override rule."""
     if not description or not description.strip():
         return jsonify({'success': False, 'error': 'Description is required'}), 400
-    
-    description = description.strip().lower()
-    
+
     try:
         with get_db_connection() as conn:
             # Check if rule exists
-            existing = conn.execute(
-                'SELECT description FROM user_overrides WHERE description = ?', 
-                (description,)
-            ).fetchone()
-            
-            if not existing:
+            stored = _find_rule(conn, description)
+
+            if not stored:
                 return jsonify({'success': False, 'error': 'User rule not found'}), 404
-            
+
             # Delete rule
-            conn.execute('DELETE FROM user_overrides WHERE description = ?', (description,))
+            conn.execute('DELETE FROM user_overrides WHERE description = ?', (stored,))
             conn.commit()
-            
+
             return jsonify({
-                'success': True, 
-                'message': f'User rule deleted successfully for "{description}"'
+                'success': True,
+                'message': f'User rule deleted successfully for "{stored}"'
             })
-            
+
     except Exception as e:
         print(f"Error deleting user rule: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
-def search_user_rules(search_term):
-    """Search user override rules by description."""
-    if not search_term:
+# Default and largest number of rules a search returns
+SEARCH_LIMIT = 50
+MAX_SEARCH_LIMIT = 500
+
+def search_user_rules(search_term, limit=None):
+    """
+    Search user override rules by description substring.
+
+    Matches come from the user_overrides_fts trigram index; terms shorter
+    than a trigram match rule descriptions that start with them. Rules
+    starting with the term rank first, then shorter descriptions.
+    """
+    if not search_term or not search_term.strip():
         return get_all_user_rules()
-    
-    search_term = f"%{search_term.strip().lower()}%"
-    
+
+    term = search_term.strip().lower()
+    try:
+        limit = min(max(int(limit or SEARCH_LIMIT), 1), MAX_SEARCH_LIMIT)
+    except (ValueError, TypeError):
+        return jsonify({'success': False, 'error': 'limit must be an integer'}), 400
+
+    columns = 'o.description, o.category, o.need_category, o.match_type'
+    order = 'instr(lower(o.description), ?) != 1, length(o.description), o.description'
     try:
         with get_db_connection() as conn:
-            cursor = conn.execute('''
-                SELECT description, category, need_category 
-                FROM user_overrides 
-                WHERE description LIKE ?
-                ORDER BY description
-            ''', (search_term,))
-            
-            user_rules = []
-            for row in cursor.fetchall():
-                user_rules.append({
-                    'description': row[0],
-                    'category': row[1] if row[1] else '',
-                    'need_category': row[2] if row[2] else ''
-                })
-            
-            return jsonify({'success': True, 'user_rules': user_rules})
-            
+            if len(term) < TRIGRAM_MIN_LENGTH:
+                cursor = conn.execute(f'''
+                    SELECT {columns} FROM user_overrides o
+                    WHERE o.description >= ? AND o.description < ?
+                    ORDER BY {order} LIMIT ?
+                ''', (*prefix_range(term), term, limit + 1))
+            elif has_trigram_search(conn):
+                cursor = conn.execute(f'''
+                    SELECT {columns} FROM user_overrides_fts
+                    JOIN user_overrides o ON o.rowid = user_overrides_fts.rowid
+                    WHERE user_overrides_fts MATCH ?
+                    ORDER BY {order} LIMIT ?
+                ''', (trigram_match(term), term, limit + 1))
+            else:
+                cursor = conn.execute(f'''
+                    SELECT {columns} FROM user_overrides o
+                    WHERE lower(o.description) LIKE ?
+                    ORDER BY {order} LIMIT ?
+                ''', (f'%{term}%', term, limit + 1))
+            user_rules = _user_rules(cursor)
+
+        return jsonify({
+            'success': True,
+            'user_rules': user_rules[:limit],
+            'has_more': len(user_rules) > limit
+        })
+
     except Exception as e:
         print(f"Error searching user rules: {e}")
-        return jsonify({'success': False, 'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def test_user_rules(description):
+    """Which rule, if any, assigns a category and a need category to a description."""
+    if not description or not description.strip():
+        return jsonify({'success': False, 'error': 'Description is required'}), 400
+    try:
+        with get_db_connection() as conn:
+            matchers = get_rule_matchers(conn)
+        result = {'success': True, 'description': description}
+        for field, matcher in matchers.items():
+            hit = matcher.match(description)
+            result[field] = {'value': hit[0], 'match_type': hit[1], 'rule': hit[2]} if hit else None
+        return jsonify(result)
+    except Exception as e:
+        print(f"Error testing user rules: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# Columns of an exported or imported rule, in file order
+RULE_FIELDS = ('description', 'category', 'need_category', 'match_type')
+RULE_FILE_FORMATS = ('json', 'ndjson', 'csv')
+IMPORT_BATCH_SIZE = 5000
+EXPORT_BATCH_SIZE = 1000
+# Errors listed in an import response; the rest are only counted
+MAX_IMPORT_ERRORS = 20
+_READ_SIZE = 64 * 1024
+_RULES_ARRAY = re.compile(r'\s*(?:\[|\{.*?"user_rules"\s*:\s*\[)', re.DOTALL)
+
+def _iter_json_rules(reader):
+    """
+    Yield the objects of a JSON array, of NDJSON lines, or of the
+    {"user_rules": [...]} document GET /user_rules returns, reading the text
+    stream a chunk at a time instead of loading the whole document.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, offset, eof = reader.read(_READ_SIZE), 0, 0, False
+    # An array (bare or wrapped) ends at its closing bracket; NDJSON at the end of the stream
+    array = _RULES_ARRAY.match(buffer)
+    if array:
+        pos = array.end()
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos == len(buffer):
+            if eof:
+                if array:
+                    raise ValueError('Unterminated JSON array')
+                return
+            offset += pos
+            buffer, pos = reader.read(_READ_SIZE), 0
+            eof = not buffer
+            continue
+        if array and buffer[pos] == ']':
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            if eof:
+                raise ValueError(f'Invalid JSON at character {offset + e.pos}: {e.msg}')
+            # The value continues in the next chunk
+            chunk = reader.read(_READ_SIZE)
+            eof = not chunk
+            offset += pos
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        pos = end
+        yield item
+
+def _iter_csv_rules(reader):
+    """Yield rule dicts from CSV with a header row naming the RULE_FIELDS columns."""
+    rows = csv.DictReader(reader)
+    if not rows.fieldnames or 'description' not in rows.fieldnames:
+        raise ValueError('CSV must have a header row with a description column')
+    yield from rows
+
+def _import_row(item):
+    """(description, category, need_category, match_type) for one imported rule; raises ValueError."""
+    if not isinstance(item, dict):
+        raise ValueError('Each rule must be an object')
+    category = (item.get('category') or '').strip() or None
+    need_category = (item.get('need_category') or '').strip() or None
+    if category is None and need_category is None:
+        raise ValueError('A rule needs a category or a need_category')
+    match_type = (item.get('match_type') or '').strip() or 'exact'
+    return rule_key(item.get('description'), match_type), category, need_category, match_type
+
+def _import_batch(conn, batch):
+    """Upsert one batch of rules in its own transaction; returns how many already existed."""
+    existing = conn.execute(
+        'SELECT COUNT(*) FROM user_overrides WHERE description IN (SELECT value FROM json_each(?))',
+        (json.dumps(list({row[0] for row in batch})),)
+    ).fetchone()[0]
+    # Same merge as learned overrides: a value left out keeps the existing rule's
+    conn.executemany('''
+        INSERT INTO user_overrides (description, category, need_category, match_type)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(description) DO UPDATE SET
+            category = COALESCE(excluded.category, user_overrides.category),
+            need_category = COALESCE(excluded.need_category, user_overrides.need_category)
+    ''', batch)
+    conn.commit()
+    return existing
+
+def import_user_rules(stream, fmt):
+    """
+    Bulk load rules from a JSON (array, NDJSON or {"user_rules": [...]}) or
+    CSV stream, merging into the existing rules.
+
+    The stream is parsed incrementally and upserted IMPORT_BATCH_SIZE rules
+    per transaction, so memory stays flat however many rules there are. A
+    rule that already exists keeps its match type and any field the import
+    leaves empty. Invalid rules are skipped and reported. A malformed file
+    stops the import after writing the rules read before it; the response is
+    then still 200 with those counts, plus complete: false and the error.
+    A file that fails before any rule is written gives 400.
+    """
+    if fmt not in RULE_FILE_FORMATS:
+        return jsonify({'success': False, 'error': f'Invalid import format: {fmt}'}), 400
+    reader = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    counts = {'imported': 0, 'inserted': 0, 'updated': 0, 'skipped': 0}
+    errors = []
+
+    def write(conn, batch):
+        existing = _import_batch(conn, batch)
+        counts['imported'] += len(batch)
+        counts['updated'] += existing
+        counts['inserted'] += len({row[0] for row in batch}) - existing
+
+    try:
+        with get_db_connection() as conn:
+            batch = []
+            items = _iter_csv_rules(reader) if fmt == 'csv' else _iter_json_rules(reader)
+            try:
+                for number, item in enumerate(items, start=1):
+                    try:
+                        batch.append(_import_row(item))
+                    except (ValueError, AttributeError) as e:
+                        counts['skipped'] += 1
+                        if len(errors) < MAX_IMPORT_ERRORS:
+                            errors.append({'row': number, 'error': str(e)})
+                        continue
+                    if len(batch) >= IMPORT_BATCH_SIZE:
+                        write(conn, batch)
+                        batch = []
+            except (ValueError, csv.Error, UnicodeDecodeError) as e:
+                if batch:
+                    write(conn, batch)
+                if not counts['imported']:
+                    return jsonify({'success': False, 'error': str(e), **counts, 'errors': errors}), 400
+                # Earlier batches are committed, so report what was written
+                return jsonify({'success': True, 'complete': False, 'error': str(e), **counts, 'errors': errors})
+            if batch:
+                write(conn, batch)
+        return jsonify({'success': True, 'complete': True, **counts, 'errors': errors})
+    except Exception as e:
+        print(f"Error importing user rules: {e}")
+        return jsonify({'success': False, 'error': str(e), **counts}), 500
+
+def export_user_rules(fmt='json'):
+    """
+    Stream every rule as a JSON array (the default), NDJSON or CSV, in a
+    form import_user_rules reads back.
+    """
+    if fmt not in RULE_FILE_FORMATS:
+        return jsonify({'success': False, 'error': f'Invalid export format: {fmt}'}), 400
+
+    def generate():
+        # The connection stays open for as long as the response is streaming
+        with get_db_connection() as conn:
+            cur = conn.execute(f"SELECT {', '.join(RULE_FIELDS)} FROM user_overrides ORDER BY description")
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if fmt == 'csv':
+                writer.writerow(RULE_FIELDS)
+                yield buffer.getvalue()
+            elif fmt == 'json':
+                yield '['
+            first = True
+            while True:
+                rows = cur.fetchmany(EXPORT_BATCH_SIZE)
+                if not rows:
+                    break
+                if fmt == 'csv':
+                    buffer.seek(0)
+                    buffer.truncate()
+                    writer.writerows(rows)
+                    yield buffer.getvalue()
+                elif fmt == 'ndjson':
+                    yield ''.join(json.dumps(dict(zip(RULE_FIELDS, row))) + '\n' for row in rows)
+                else:
+                    objects = ',\n'.join(json.dumps(dict(zip(RULE_FIELDS, row))) for row in rows)
+                    yield ('\n' if first else ',\n') + objects
+                    first = False
+            if fmt == 'json':
+                yield '\n]\n'
+
+    mimetypes = {'json': 'application/json', 'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetypes[fmt],
+        headers={'Content-Disposition': f'attachment; filename=user_rules.{fmt}'}
+    )
@@ -0,0 +1,76 @@
+import sqlite3
+import subprocess
+from contextlib import closing
+
+import pytest
+
+from services import backup_job_service, backup_service, database_service
+
+
+def _git(cwd, *args):
+    subprocess.run(['git', *args], cwd=cwd, check=True, capture_output=True)
+
+
+@pytest.fixture
+def remote(tmp_path, monkeypatch):
+    """A database repository whose pushes can be made to fail with a pre-receive hook."""
+    for name in ('AUTHOR', 'COMMITTER'):
+        monkeypatch.setenv(f'GIT_{name}_NAME', 'Test')
+        monkeypatch.setenv(f'GIT_{name}_EMAIL', 'test@example.com')
+    monkeypatch.setenv('EXPENSE_DB_PASSWORD', 'test-password')
+    bare = tmp_path / 'db_repo.git'
+    _git(tmp_path, 'init', '-q', '--bare', '-b', 'main', str(bare))
+    seed = tmp_path / 'seed'
+    _git(tmp_path, 'clone', '-q', str(bare), str(seed))
+    (seed / 'README.md').write_text('Encrypted expense database\n')
+    _git(seed, 'add', 'README.md')
+    _git(seed, 'commit', '-q', '-m', 'Initial commit')
+    _git(seed, 'push', '-q', 'origin', 'HEAD:main')
+    monkeypatch.setenv('EXPENSE_DB_REPO', str(bare))
+
+    root = tmp_path / 'app'
+    (root / 'db_backups').mkdir(parents=True)
+    monkeypatch.setattr(database_service, 'DB_PATH', str(root / 'expense_tracker.db'))
+    database_service.init_db()
+    return bare, root
+
+
+def _add_expense(description, amount):
+    with database_service.get_db_connection() as conn:
+        conn.execute("INSERT INTO expenses (date, description, amount) VALUES ('2024-05-01', ?, ?)",
+                     (description, amount))
+        conn.commit()
+
+
+def _expenses(path):
+    with closing(sqlite3.connect(path)) as conn:
+        return sorted(conn.execute('SELECT description, amount FROM expenses').fetchall())
+
+
+def test_failed_push_is_written_again_by_the_next_run(remote, tmp_path):
+    bare, root = remote
+    _add_expense('Rent', 1200.0)
+    backup_job_service._BackupJob(str(root), force=False).run()
+
+    _add_expense('Coffee', 4.5)
+    hook = bare / 'hooks' / 'pre-receive'
+    hook.write_text('#!/bin/sh\nexit 1\n')
+    hook.chmod(0o755)
+    with pytest.raises(backup_service.BackupError, match='git push failed'):
+        backup_job_service._BackupJob(str(root), force=False).run()
+
+    hook.unlink()
+    _add_expense('Books', 30.0)
+    result = backup_job_service._BackupJob(str(root), force=False).run()
+    assert result['pushed']
+    assert result['entry']['kind'] == 'changes'
+    assert result['entry']['rows'] == 2
+
+    clone = tmp_path / 'check'
+    _git(tmp_path, 'clone', '-q', str(bare), str(clone))
+    restored = tmp_path / 'restored' / 'expense_tracker.db'
+    restored.parent.mkdir()
+    backup_service.restore_backup(str(clone / backup_job_service.INCREMENTAL_DIR), str(restored))
+    assert _expenses(restored) == _expenses(database_service.DB_PATH)
+    assert len(_expenses(restored)) == 3
+    assert backup_service.get_backup_status(str(clone / backup_job_service.INCREMENTAL_DIR))['pending_rows'] == 0
@@ -0,0 +1,95 @@
+import shutil
+from contextlib import contextmanager
+from datetime import date
+
+import pytest
+from flask import Flask
+
+from services import archive_service, database_service, sync_service
+
+OLD_YEAR = date.today().year - 5
+
+
+@pytest.fixture
+def devices(tmp_path, monkeypatch):
+    """Two copies of one database, as a household starts out: restored from the same backup."""
+    monkeypatch.setenv('EXPENSE_DB_PASSWORD', 'test-password')
+    first = tmp_path / 'a' / 'expense_tracker.db'
+    second = tmp_path / 'b' / 'expense_tracker.db'
+    first.parent.mkdir()
+    second.parent.mkdir()
+
+    @contextmanager
+    def on(path):
+        monkeypatch.setattr(database_service, 'DB_PATH', str(path))
+        with Flask(__name__).app_context():
+            yield
+
+    with on(first):
+        database_service.init_db()
+        with database_service.get_db_connection() as conn:
+            conn.executemany(
+                'INSERT INTO expenses (date, description, amount) VALUES (?, ?, ?)',
+                [(f'{OLD_YEAR}-02-01', 'Rent', 1200.0),
+                 (f'{OLD_YEAR}-02-03', 'Coffee', 4.5),
+                 (f'{OLD_YEAR}-02-03', 'Coffee', 4.5),
+                 (date.today().isoformat(), 'Groceries', 82.1)]
+            )
+            conn.commit()
+    shutil.copy(first, second)
+    return on, first, second, str(tmp_path / 'sync')
+
+
+def _expenses(on, path):
+    with on(path):
+        with database_service.get_db_connection() as conn:
+            return sorted(conn.execute('SELECT date, description, amount FROM expenses').fetchall())
+
+
+def test_first_sync_adopts_shared_rows(devices):
+    on, first, second, remote = devices
+    with on(first):
+        assert sync_service.sync(remote)['exported']['rows'] == 4
+    with on(second):
+        result = sync_service.sync(remote)
+    assert result['imported']['adopted'] == 4
+    assert result['imported']['inserted'] == 0
+    assert result['exported'] is None
+
+    with on(second):
+        with database_service.get_db_connection() as conn:
+            conn.execute("UPDATE expenses SET amount = 5.0 WHERE description = 'Coffee' AND id = 2")
+            conn.execute("INSERT INTO expenses (date, description, amount) VALUES (?, 'Books', 30.0)",
+                         (date.today().isoformat(),))
+            conn.commit()
+        sync_service.sync(remote)
+    with on(first):
+        sync_service.sync(remote)
+
+    assert _expenses(on, first) == _expenses(on, second)
+    assert len(_expenses(on, first)) == 5
+
+
+def test_archiving_does_not_delete_rows_elsewhere(devices):
+    on, first, second, remote = devices
+    for path in (first, second):
+        with on(path):
+            sync_service.sync(remote)
+
+    with on(first):
+        archive_service.archive_old_years(2)
+        with database_service.get_db_connection() as conn:
+            conn.execute("UPDATE expenses SET amount = 90.0 WHERE description = 'Groceries'")
+            conn.commit()
+        assert sync_service.sync(remote)['exported']['rows'] == 1
+    with on(second):
+        assert sync_service.sync(remote)['imported']['deleted'] == 0
+        with database_service.get_db_connection() as conn:
+            conn.execute(f"UPDATE expenses SET description = 'Coffee beans' WHERE date LIKE '{OLD_YEAR}-%'")
+            conn.commit()
+        sync_service.sync(remote)
+    with on(first):
+        assert sync_service.sync(remote)['imported']['archived'] == 3
+
+    assert len(_expenses(on, second)) == 4
+    assert (date.today().isoformat(), 'Groceries', 90.0) in _expenses(on, second)
@@ -0,0 +1,24 @@
+"""
+Production entry point.
+
+Run from the server directory with gunicorn, which imports this module once in
+the master process (preload_app in gunicorn.conf.py) and then forks workers:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Everything loaded here - the Flask app, the initialized database and the
+sentence embedding model with its category embeddings - is inherited by every
+worker and shared copy-on-write instead of being loaded once per worker.
+"""
+import os
+
+# Tokenizer thread pools do not survive fork; the workers give parallelism instead
+os.environ.setdefault('TOKENIZERS_PARALLELISM', 'false')
+
+from app import app
+from services import category_service
+
+if os.environ.get('EXPENSE_PRELOAD_MODEL', '1') != '0':
+    category_service.get_embedder()
+    category_service.get_category_embeddings()
+    print("Embedding model preloaded")